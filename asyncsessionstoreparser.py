@@ -0,0 +1,144 @@
+# asyncio front end of sessionstoreparser for services which parse
+# session stores as they are uploaded, needs python 3.5 or later
+#
+#   parser = AsyncSessionStoreParser({'all': None, 'entry': 'all'})
+#   async with await parser.parse(uploadedbytes) as urls:
+#     async for url in urls:
+#       ...
+#
+# reading and decompression run in the default executor of the loop,
+# decoding and walking the session store in executor, which may be a
+# ProcessPoolExecutor to use more than one cpu
+# in threads the urls are walked batchsize at a time as they are
+# consumed, a process pool sends back all urls of a parse at once since
+# the walk cannot leave the worker process
+# at most concurrency parses run at once, a parse keeps its place until
+# its urls are consumed, closed or dropped so a slow consumer holds
+# back new parses instead of letting their urls pile up
+
+import asyncio
+import concurrent.futures
+import functools
+import itertools
+
+import sessionstoreparser as ssp
+
+def getrunningloop():
+  # get_running_loop is new in python 3.7, before it get_event_loop
+  # gives the running loop inside a coroutine
+  return getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)()
+
+def readsource(jsonreader, source):
+  # the content of source, decompressed
+  with jsonreader.openfile(source) as fileob:
+    return fileob.read()
+
+def extracturls(urlextractor, data, name):
+  # module level so that a ProcessPoolExecutor can run it
+  return list(urlextractor.iterurls(data, name))
+
+def startextract(urlextractor, data, name):
+  # decodes the session store, the urls are walked as they are taken
+  return urlextractor.iterurls(data, name)
+
+def takeurls(urls, count):
+  return list(itertools.islice(urls, count))
+
+async def callinloop(function, *args):
+  # gives the loop to other tasks before every batch
+  await asyncio.sleep(0)
+  return function(*args)
+
+class AsyncUrls(object):
+  # async iterator over the urls of one parse, takes batchsize urls at a
+  # time with call, which runs takeurls in an executor or in the loop
+  # gives the place of its parse back when exhausted, closed or dropped
+
+  def __init__(self, urls, release, batchsize, call):
+    self.urls = urls
+    self.release = release
+    self.batchsize = batchsize
+    self.call = call
+    self.batch = iter([])
+
+  def __aiter__(self):
+    return self
+
+  async def __anext__(self):
+    url = next(self.batch, None)
+    if url is None and self.urls is not None:
+      try:
+        self.batch = iter(await self.call(
+              takeurls, self.urls, self.batchsize))
+      except BaseException:
+        self.close()
+        raise
+      url = next(self.batch, None)
+    if url is None:
+      self.close()
+      raise StopAsyncIteration
+    return url
+
+  def close(self):
+    if self.release is not None:
+      self.release()
+      self.release = None
+    self.urls = None
+    self.batch = iter([])
+
+  def __del__(self):
+    # an async for which breaks early neither exhausts nor closes
+    self.close()
+
+  async def aclose(self):
+    self.close()
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *exc_info):
+    self.close()
+
+class AsyncSessionStoreParser(object):
+  # parsedargv takes the options makeurlextractor takes, the extractor
+  # is made once and shared by all parses
+  # the semaphore is made in the loop of the first parse, a parser
+  # belongs to that loop
+
+  def __init__(self, parsedargv=None, executor=None, concurrency=4,
+        batchsize=1024, stderr=None):
+    #pylint: disable=too-many-arguments
+    self.urlextractor = ssp.makeurlextractor(parsedargv, stderr)
+    self.executor = executor
+    self.concurrency = concurrency
+    self.batchsize = batchsize
+    self.semaphore = None
+
+  def getsemaphore(self):
+    if self.semaphore is None:
+      self.semaphore = asyncio.Semaphore(self.concurrency)
+    return self.semaphore
+
+  async def parse(self, source, name='upload'):
+    # source is the bytes of a session store or a filename, name is
+    # used for bytes in error messages
+    if ssp.isdata(source):
+      source = ssp.DataSource(source, name)
+    loop = getrunningloop()
+    semaphore = self.getsemaphore()
+    await semaphore.acquire()
+    try:
+      data = await loop.run_in_executor(None, readsource,
+            self.urlextractor.jsonreader, source)
+      if isinstance(self.executor, concurrent.futures.ProcessPoolExecutor):
+        urls = iter(await loop.run_in_executor(self.executor, extracturls,
+              self.urlextractor, data, str(source)))
+        call = callinloop
+      else:
+        urls = await loop.run_in_executor(self.executor, startextract,
+              self.urlextractor, data, str(source))
+        call = functools.partial(loop.run_in_executor, self.executor)
+    except BaseException:
+      semaphore.release()
+      raise
+    return AsyncUrls(urls, semaphore.release, self.batchsize, call)
@@ -0,0 +1,733 @@
+#! /usr/bin/env python
+
+# generates session stores of several sizes and times each stage of
+# SessionStoreParser.parse on them: read, decode, produce, filter, consume
+# and times the start of the sessionstoreparser command, one call of
+# secludedmain against one of UrlExtractor.iterurls and the latency of
+# concurrent uploads to AsyncSessionStoreParser, the speedup of
+# --window-jobs on a session store of many closed windows, --diff and
+# the throughput of each --writer
+# results can be saved as json and compared against an earlier run
+
+import gc
+import getopt
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import py_compile
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import sessionstoreparser as ssp
+
+USAGE = '''\
+usage: runbenchmark.py [options] [results.json]
+  --scales=SCALES        comma separated, from: {scales}; default: all
+  --repeat=N             best of N runs per stage, of 10 times N for
+                         startup; default: 3
+  --directory=DIR        keep generated session stores in DIR
+  --output=FILE          save results as json to FILE
+  --compare=FILE         compare against results saved in FILE, exit status
+                         is 1 if a stage got slower than the threshold; with
+                         results.json that file is compared and nothing run
+  --threshold=FRACTION   allowed slowdown before a stage is flagged;
+                         default: 0.1
+  --generate=FILE        only write one session store to FILE made with
+                         --windows, --tabs, --history, --closed-tabs,
+                         --closed-windows, --bloat and --seed
+'''
+
+TIMER = getattr(time, 'perf_counter', time.time)
+
+GENERATORDEFAULTS = {
+      'windows': 2,
+      'tabs': 10,
+      'history': 5,
+      'closedtabs': 5,
+      'closedwindows': 2,
+      'bloat': 0,
+      'seed': 1}
+
+SCALES = [
+      ('small', dict(GENERATORDEFAULTS)),
+      ('medium', dict(GENERATORDEFAULTS,
+        windows=10, tabs=40, history=10, closedtabs=10, closedwindows=5,
+        bloat=256)),
+      ('large', dict(GENERATORDEFAULTS,
+        windows=40, tabs=100, history=30, closedtabs=25, closedwindows=10,
+        bloat=2048)),
+      ('bloated', dict(GENERATORDEFAULTS,
+        windows=4, tabs=25, history=5, closedtabs=10, closedwindows=2,
+        bloat=32768))]
+
+# startup runs the sessionstoreparser command for each case and
+# times the import of the module
+# async runs runloadtest on the medium session store, python 3.5 or later
+# library parses the small session store through each entry point
+# shards parses SHARDPARAMETERS without and with --window-jobs
+# diff compares the large session store with one more closed windows
+# writers consumes WRITERURLS urls of the large session store by each
+# writer
+DEFAULTSCALES = [scale for scale, dummy in SCALES] + [
+      'startup', 'library', 'async', 'shards', 'diff', 'writers']
+
+# parsedargv for the parser of each case
+CASES = [
+      ('default', {}),
+      ('all', {'all': None, 'entry': 'all'}),
+      ('project', {'all': None, 'entry': 'all', 'reader': 'project'}),
+      ('flat', {'all': None, 'entry': 'all', 'producer': 'flat'})]
+
+STAGES = ['read', 'decode', 'produce', 'filter', 'consume', 'total']
+
+# arguments for each startup case, None is the small session store
+STARTUPCASES = [
+      ('version', ['--version']),
+      ('help', ['--help']),
+      ('parse', ['--all', None])]
+
+STARTUPSTAGES = ['import', 'wall']
+
+STARTUPRUNS = 10
+
+LIBRARYCASES = ['main', 'extractor', 'bytes']
+
+LIBRARYSTAGES = ['call']
+
+LIBRARYCALLS = 100
+
+# worker processes of each load test case, 0 decodes in threads
+LOADCASES = [
+      ('threads', 0),
+      ('processes', 2)]
+
+LOADSTAGES = ['p50', 'p99', 'lag']
+
+LOADUPLOADS = 100
+
+LOADCONCURRENCY = 4
+
+SHARDPARAMETERS = dict(GENERATORDEFAULTS,
+      windows=4, tabs=25, history=10, closedtabs=10, closedwindows=400,
+      bloat=256)
+
+SHARDARGV = ['--all', '--url=all']
+
+# worker processes of each shards case, those beyond the number of cpus
+# are left out but for 2, so the pool is always timed
+SHARDJOBS = [1, 2, 4, 8, 16]
+
+# the same windows as the large session store, as the generator makes
+# them first, and then more closed windows
+DIFFPARAMETERS = dict(SCALES[2][1], closedwindows=15)
+
+DIFFARGV = ['--all', '--url=all']
+
+DIFFCASES = ['urls', 'digests']
+
+WRITERURLS = 1000000
+
+# parsedargv for the url consumer of each writers case
+WRITERCASES = [
+      ('plain', {}),
+      ('batched', {'writer': 'batched'}),
+      ('ndjson', {'writer': 'ndjson'}),
+      ('csv', {'writer': 'csv'}),
+      ('html', {'writer': 'html'}),
+      ('batched-gzip', {'writer': 'batched', 'gzip': None}),
+      ('ndjson-gzip', {'writer': 'ndjson', 'gzip': None})]
+
+IMPORTCODE = (
+      'import time; start = time.time(); import sessionstoreparser; '
+      'print(time.time() - start)')
+
+class SessionStoreGenerator(object):
+  # makes the same session store for the same parameters on python 2 and 3
+  # only random() is used, the other methods of Random differ by version
+  # bloat is the number of characters of form data per selected entry and
+  # of image data per tab, like saved forms and favicons in real files
+
+  HOSTS = 500
+  WORDS = [
+        'news', 'mail', 'search', 'docs', 'wiki', 'shop', 'video', 'maps',
+        'forum', 'blog', 'issues', 'code', u'r\xe9sum\xe9',
+        u'\u65e5\u672c', u'caf\xe9']
+
+  def __init__(self, windows, tabs, history, closedtabs, closedwindows,
+        bloat, seed):
+    #pylint: disable=too-many-arguments
+    self.windows = windows
+    self.tabs = tabs
+    self.history = history
+    self.closedtabs = closedtabs
+    self.closedwindows = closedwindows
+    self.bloat = bloat
+    self.random = random.Random(seed)
+    self.pool = self.makepool(1 << 16)
+    self.entryid = 0
+    self.clock = 1500000000000
+
+  def makepool(self, size):
+    chars = ('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+          '0123456789+/')
+    return ''.join(chars[self.pick(64)] for dummy in range(size))
+
+  def pick(self, count):
+    return int(self.random.random() * count)
+
+  def filler(self, size):
+    start = self.pick(len(self.pool) - size) if size < len(self.pool) else 0
+    text = self.pool[start:start+size]
+    while len(text) < size:
+      text += self.pool[:size-len(text)]
+    return text
+
+  def makeurl(self):
+    words = self.WORDS
+    return u'https://host%d.example/%s/%s/%d' % (
+          self.pick(self.HOSTS), words[self.pick(len(words))],
+          words[self.pick(len(words))], self.pick(100000))
+
+  def makeentry(self, selected):
+    self.entryid += 1
+    url = self.makeurl()
+    entry = {
+          'url': url,
+          'title': url.rsplit('/', 2)[1].title(),
+          'charset': 'UTF-8',
+          'ID': self.entryid,
+          'docshellID': 0,
+          'persist': True}
+    if selected and self.bloat:
+      entry['formdata'] = {
+            'id': {'comment': self.filler(self.bloat)},
+            'url': url}
+    return entry
+
+  def maketab(self):
+    depth = 1 + self.pick(self.history)
+    index = 1 + self.pick(depth)
+    self.clock += 1 + self.pick(60000)
+    tab = {
+          'entries': [
+            self.makeentry(number == index) for number in
+            range(1, depth + 1)],
+          'index': index,
+          'lastAccessed': self.clock,
+          'hidden': False,
+          'attributes': {},
+          'userContextId': 0}
+    if self.bloat:
+      tab['image'] = 'data:image/png;base64,' + self.filler(self.bloat)
+    return tab
+
+  def makeclosedtab(self, position):
+    tab = self.maketab()
+    self.clock += 1 + self.pick(60000)
+    return {
+          'state': tab,
+          'title': tab['entries'][tab['index'] - 1]['title'],
+          'image': tab.get('image'),
+          'pos': position,
+          'closedAt': self.clock}
+
+  def makewindow(self):
+    tabs = [self.maketab() for dummy in range(self.tabs)]
+    closedtabs = [self.makeclosedtab(position)
+          for position in range(self.closedtabs)]
+    return {
+          'tabs': tabs,
+          'selected': 1 + self.pick(len(tabs)),
+          '_closedTabs': closedtabs,
+          'width': 1280,
+          'height': 1024,
+          'screenX': 0,
+          'screenY': 0,
+          'sizemode': 'normal'}
+
+  def makeclosedwindow(self):
+    window = self.makewindow()
+    self.clock += 1 + self.pick(60000)
+    window['closedAt'] = self.clock
+    return window
+
+  def make(self):
+    windows = [self.makewindow() for dummy in range(self.windows)]
+    closedwindows = [self.makeclosedwindow()
+          for dummy in range(self.closedwindows)]
+    return {
+          'version': ['sessionrestore', 1],
+          'windows': windows,
+          'selectedWindow': 1 + self.pick(len(windows)) if windows else 0,
+          '_closedWindows': closedwindows,
+          'session': {
+            'lastUpdate': self.clock,
+            'startTime': 1500000000000,
+            'recentCrashes': 0},
+          'global': {}}
+
+  def write(self, filename):
+    text = json.dumps(self.make(), ensure_ascii=False, sort_keys=True,
+          separators=(',', ':'))
+    if not isinstance(text, bytes):
+      text = text.encode('utf-8')
+    with open(filename, 'wb') as fileob:
+      fileob.write(text)
+    return len(text)
+
+class NullRawStream(io.RawIOBase):
+  # discards everything, the writers still encode as for a real stdout
+
+  def writable(self):
+    return True
+
+  def write(self, data):
+    return len(data)
+
+def makeoutput():
+  return io.TextIOWrapper(
+        io.BufferedWriter(NullRawStream()), encoding='utf-8', newline='\n')
+
+def makeparser(filename, parsedargv):
+  initparams = ssp.SessionStoreParserFactoryFactory.getinitparams()
+  sspf_factory = ssp.SessionStoreParserFactoryFactory(**initparams)
+  sessionstoreparserfactory = sspf_factory.make(
+        makeoutput(), ssp.openbinary, sys.stderr)
+  return sessionstoreparserfactory.make(dict(parsedargv, filename=filename))
+
+def runstages(filename, parsedargv):
+  # one run of each stage, every stage gets the result of the one before
+  parser = makeparser(filename, parsedargv)
+  jsonreader = parser.sessionstoreproducer.jsonreader
+  times = {}
+  gc.collect()
+  start = TIMER()
+  with jsonreader.openfile(filename) as fileob:
+    text = ssp.readtext(fileob)
+  times['read'] = TIMER() - start
+  start = TIMER()
+  sessionstore = jsonreader.jsonloadsfunc(text)
+  times['decode'] = TIMER() - start
+  del text
+  start = TIMER()
+  urls = list(parser.urlproducer.produce(sessionstore, parser.urlfilter))
+  times['produce'] = TIMER() - start
+  start = TIMER()
+  filteredurls = list(parser.urlfilter.filter(urls))
+  times['filter'] = TIMER() - start
+  start = TIMER()
+  parser.urlconsumer.consume(filteredurls)
+  parser.urlconsumer.stream.flush()
+  times['consume'] = TIMER() - start
+  del sessionstore, urls
+  parser = makeparser(filename, parsedargv)
+  gc.collect()
+  start = TIMER()
+  parser.parse()
+  parser.urlconsumer.stream.flush()
+  times['total'] = TIMER() - start
+  return times, len(filteredurls)
+
+def benchmarkfile(filename, parsedargv, repeat):
+  best = {}
+  for dummy in range(repeat):
+    times, urlcount = runstages(filename, parsedargv)
+    for stage, seconds in times.items():
+      best[stage] = min(best.get(stage, seconds), seconds)
+  return best, urlcount
+
+def getsessionstore(directory, scale, parameters):
+  filename = os.path.join(directory, '%s-%d.js' % (scale, parameters['seed']))
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+  if not os.path.exists(filename):
+    SessionStoreGenerator(**parameters).write(filename)
+  return filename
+
+def getscriptpath():
+  return os.path.join(
+        os.path.dirname(os.path.abspath(ssp.__file__)), 'sessionstoreparser')
+
+def getenviron():
+  # the module next to the script, whatever the working directory
+  # python 2 fails to write urls to a file without an encoding set
+  return dict(os.environ, PYTHONPATH=os.path.dirname(getscriptpath()),
+        PYTHONIOENCODING='utf-8')
+
+def timecommand(argv, runs):
+  best = None
+  environ = getenviron()
+  with open(os.devnull, 'wb') as devnull:
+    for dummy in range(runs):
+      start = TIMER()
+      subprocess.call(argv, stdout=devnull, stderr=devnull, env=environ)
+      seconds = TIMER() - start
+      best = seconds if best is None else min(best, seconds)
+  return best
+
+def readcommand(argv):
+  process = subprocess.Popen(argv, stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE, env=getenviron())
+  output, errors = process.communicate()
+  return output.decode('utf-8'), errors.decode('utf-8')
+
+def timeimport(runs):
+  best = None
+  for dummy in range(runs):
+    output, dummy_errors = readcommand([sys.executable, '-c', IMPORTCODE])
+    seconds = float(output)
+    best = seconds if best is None else min(best, seconds)
+  return best
+
+def parseimporttime(text, modulename):
+  # cumulative seconds of each module imported by modulename itself
+  # from the output of python -X importtime, which lists a module
+  # after the modules it imports, indented by two more spaces
+  imports = {}
+  depth = None
+  for line in reversed(text.splitlines()):
+    fields = line.split('|')
+    if not line.startswith('import time:') or len(fields) != 3:
+      continue
+    if not fields[1].strip().isdigit():
+      continue
+    indent = len(fields[2]) - len(fields[2].lstrip()) - 1
+    name = fields[2].strip()
+    if depth is None:
+      if name == modulename:
+        depth = indent
+    elif indent <= depth:
+      break
+    elif indent == depth + 2:
+      imports[name] = int(fields[1]) / 1e6
+  return imports
+
+def getimportbreakdown():
+  # -X importtime is only in python 3.7 and later
+  if sys.version_info < (3, 7):
+    return None
+  dummy_output, errors = readcommand([sys.executable,
+        '-X', 'importtime', '-c', 'import sessionstoreparser'])
+  return parseimporttime(errors, 'sessionstoreparser')
+
+def runstartup(filename, repeat, stdout):
+  py_compile.compile(ssp.__file__.replace('.pyc', '.py'))
+  runs = STARTUPRUNS * repeat
+  results = []
+  imports = getimportbreakdown()
+  stages = {'import': timeimport(runs)}
+  results.append({
+        'scale': 'startup',
+        'case': 'import',
+        'stages': stages,
+        'imports': imports})
+  stdout.write('%-8s %-8s  import %.4f\n' % (
+        'startup', 'import', stages['import']))
+  if imports:
+    slowest = sorted(imports.items(), key=lambda item: -item[1])[:5]
+    stdout.write('%-17s  %s\n' % ('', '  '.join(
+          '%s %.4f' % item for item in slowest)))
+  for case, arguments in STARTUPCASES:
+    arguments = [filename if argument is None else argument
+          for argument in arguments]
+    argv = [sys.executable, getscriptpath()] + arguments
+    stages = {'wall': timecommand(argv, runs)}
+    results.append({
+          'scale': 'startup',
+          'case': case,
+          'stages': stages})
+    stdout.write('%-8s %-8s  wall %.4f\n' % ('startup', case, stages['wall']))
+  return results
+
+def makelibrarycalls(filename):
+  # each parses the file with --all --url=all, python 2 takes str as
+  # a filename
+  with open(filename, 'rb') as fileob:
+    data = bytearray(fileob.read())
+  argv = ['sessionstoreparser', '--all', '--url=all', filename]
+  urlextractor = ssp.makeurlextractor({'all': None, 'entry': 'all'})
+  return {
+        'main': lambda: ssp.secludedmain(
+          argv, makeoutput(), sys.stderr, ssp.openbinary),
+        'extractor': lambda: list(urlextractor.iterurls(filename)),
+        'bytes': lambda: list(urlextractor.iterurls(data))}
+
+def timecalls(func, calls, repeat):
+  best = None
+  for dummy in range(repeat):
+    gc.collect()
+    start = TIMER()
+    for dummy_call in range(calls):
+      func()
+    seconds = (TIMER() - start) / calls
+    best = seconds if best is None else min(best, seconds)
+  return best
+
+def runlibrary(filename, repeat, stdout):
+  calls = makelibrarycalls(filename)
+  results = []
+  for case in LIBRARYCASES:
+    stages = {'call': timecalls(calls[case], LIBRARYCALLS, repeat)}
+    results.append({
+          'scale': 'library',
+          'case': case,
+          'stages': stages})
+    stdout.write('%-8s %-9s  call %.6f\n' % ('library', case, stages['call']))
+  return results
+
+def runasync(filename, stdout):
+  if sys.version_info < (3, 5):
+    stdout.write('%-8s needs python 3.5 or later\n' % 'async')
+    return []
+  import runloadtest
+  results = []
+  for case, jobs in LOADCASES:
+    stages, urlcount = runloadtest.loadtestfile(
+          filename, LOADUPLOADS, LOADCONCURRENCY, jobs)
+    results.append({
+          'scale': 'async',
+          'case': case,
+          'uploads': LOADUPLOADS,
+          'urls': urlcount,
+          'stages': stages})
+    stdout.write('%-8s %-8s %8d uploads  %s\n' % ('async', case,
+          LOADUPLOADS, '  '.join('%s %.4f' % (stage, stages[stage])
+            for stage in LOADSTAGES + ['wall'])))
+  return results
+
+def getshardjobs():
+  cpus = multiprocessing.cpu_count()
+  return [jobs for jobs in SHARDJOBS if jobs <= max(2, cpus)]
+
+def timemain(argv, repeat):
+  best = None
+  for dummy in range(repeat):
+    gc.collect()
+    start = TIMER()
+    ssp.secludedmain(['sessionstoreparser'] + argv, makeoutput(),
+          sys.stderr, ssp.openbinary)
+    seconds = TIMER() - start
+    best = seconds if best is None else min(best, seconds)
+  return best
+
+def runshards(filename, repeat, stdout):
+  # speedup is against the serial parse, the same on one cpu means the
+  # sharding costs nothing
+  argv = SHARDARGV + [filename]
+  serial = timemain(argv, repeat)
+  results = [{
+        'scale': 'shards',
+        'case': 'serial',
+        'stages': {'wall': serial}}]
+  stdout.write('%-8s %-8s  wall %.4f\n' % ('shards', 'serial', serial))
+  for jobs in getshardjobs():
+    case = 'jobs-%d' % jobs
+    seconds = timemain(['--window-jobs=%d' % jobs] + argv, repeat)
+    stages = {'wall': seconds, 'speedup': serial / seconds}
+    results.append({
+          'scale': 'shards',
+          'case': case,
+          'cpus': multiprocessing.cpu_count(),
+          'stages': stages})
+    stdout.write('%-8s %-8s  wall %.4f  speedup %.2f\n' % (
+          'shards', case, seconds, stages['speedup']))
+  return results
+
+def rundiff(oldfilename, newfilename, repeat, stdout):
+  results = []
+  for case in DIFFCASES:
+    argv = ['--diff=' + case] + DIFFARGV + [oldfilename, newfilename]
+    stages = {'wall': timemain(argv, repeat)}
+    results.append({
+          'scale': 'diff',
+          'case': case,
+          'stages': stages})
+    stdout.write('%-8s %-8s  wall %.4f\n' % ('diff', case, stages['wall']))
+  return results
+
+def makewriterurls(filename):
+  # the urls of the file once with the fields the record writers need,
+  # the urls of a run repeat them
+  with open(filename, 'rb') as fileob:
+    sessionstore = json.loads(fileob.read().decode('utf-8'))
+  producer = ssp.DetailedUrlProducer(ssp.RecordWriter.FIELDS)
+  return list(producer.produce(sessionstore))
+
+def runwriters(filename, urlcount, repeat, stdout):
+  # relative is the wall time against that of the plain writer
+  urls = makewriterurls(filename)
+  initparams = ssp.UrlConsumerFactory.getinitparams()
+  results = []
+  for case, parsedargv in WRITERCASES:
+    best = None
+    for dummy in range(repeat):
+      urlconsumerfactory = ssp.UrlConsumerFactory(
+            stream=makeoutput(), **initparams)
+      urlconsumer = urlconsumerfactory.make(parsedargv)
+      gc.collect()
+      start = TIMER()
+      urlconsumer.consume(
+            itertools.islice(itertools.cycle(urls), urlcount))
+      seconds = TIMER() - start
+      best = seconds if best is None else min(best, seconds)
+    plain = results[0]['stages']['wall'] if results else best
+    stages = {'wall': best, 'relative': best / plain}
+    results.append({
+          'scale': 'writers',
+          'case': case,
+          'urls': urlcount,
+          'stages': stages})
+    stdout.write('%-8s %-12s %8d urls  wall %.4f  %.0f urls/s  '
+          'relative %.2f\n' % ('writers', case, urlcount, best,
+            urlcount / best, stages['relative']))
+  return results
+
+def runbenchmark(directory, scales, repeat, stdout):
+  results = []
+  for scale, parameters in SCALES:
+    if scale not in scales:
+      continue
+    filename = getsessionstore(directory, scale, parameters)
+    size = os.path.getsize(filename)
+    for case, parsedargv in CASES:
+      stages, urlcount = benchmarkfile(filename, parsedargv, repeat)
+      results.append({
+            'scale': scale,
+            'case': case,
+            'parameters': parameters,
+            'bytes': size,
+            'urls': urlcount,
+            'stages': stages})
+      stdout.write('%-8s %-8s %10d bytes %8d urls  %s\n' % (
+            scale, case, size, urlcount, '  '.join(
+              '%s %.4f' % (stage, stages[stage]) for stage in STAGES)))
+  if 'startup' in scales:
+    scale, parameters = SCALES[0]
+    filename = getsessionstore(directory, scale, parameters)
+    results.extend(runstartup(filename, repeat, stdout))
+  if 'library' in scales:
+    scale, parameters = SCALES[0]
+    filename = getsessionstore(directory, scale, parameters)
+    results.extend(runlibrary(filename, repeat, stdout))
+  if 'async' in scales:
+    scale, parameters = SCALES[1]
+    filename = getsessionstore(directory, scale, parameters)
+    results.extend(runasync(filename, stdout))
+  if 'shards' in scales:
+    filename = getsessionstore(directory, 'shards', SHARDPARAMETERS)
+    results.extend(runshards(filename, repeat, stdout))
+  if 'diff' in scales:
+    scale, parameters = SCALES[2]
+    oldfilename = getsessionstore(directory, scale, parameters)
+    newfilename = getsessionstore(directory, 'diff', DIFFPARAMETERS)
+    results.extend(rundiff(oldfilename, newfilename, repeat, stdout))
+  if 'writers' in scales:
+    scale, parameters = SCALES[2]
+    filename = getsessionstore(directory, scale, parameters)
+    results.extend(runwriters(filename, WRITERURLS, repeat, stdout))
+  return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'repeat': repeat,
+        'results': results}
+
+def compareresults(old, new, threshold, stdout, minimum=0.001):
+  # stages faster than minimum seconds are too noisy to be flagged
+  oldstages = {}
+  for result in old['results']:
+    for stage, seconds in result['stages'].items():
+      oldstages[(result['scale'], result['case'], stage)] = seconds
+  regressions = []
+  for result in new['results']:
+    for stage in STAGES + STARTUPSTAGES + LIBRARYSTAGES + LOADSTAGES:
+      key = (result['scale'], result['case'], stage)
+      if key not in oldstages or stage not in result['stages']:
+        continue
+      before = oldstages[key]
+      after = result['stages'][stage]
+      change = (after - before) / before if before > 0 else 0.0
+      flag = ''
+      if change > threshold and after - before > minimum:
+        flag = '  REGRESSION'
+        regressions.append(key)
+      stdout.write('%-8s %-8s %-8s %9.4f %9.4f %+7.1f%%%s\n' % (
+            key + (before, after, change * 100, flag)))
+  return regressions
+
+def loadresults(filename):
+  with open(filename) as fileob:
+    return json.load(fileob)
+
+def saveresults(results, filename):
+  with open(filename, 'w') as fileob:
+    json.dump(results, fileob, indent=2, sort_keys=True)
+    fileob.write('\n')
+
+def generate(filename, options):
+  parameters = dict(GENERATORDEFAULTS)
+  for name in parameters:
+    if name in options:
+      parameters[name] = int(options[name])
+  size = SessionStoreGenerator(**parameters).write(filename)
+  sys.stdout.write('%s: %d bytes\n' % (filename, size))
+  return 0
+
+def getoptions(argv):
+  longopts = ['scales=', 'repeat=', 'directory=', 'output=', 'compare=',
+        'threshold=', 'generate=', 'windows=', 'tabs=', 'history=',
+        'closed-tabs=', 'closed-windows=', 'bloat=', 'seed=', 'help']
+  opts, args = getopt.getopt(argv[1:], 'h', longopts)
+  options = {}
+  for option, value in opts:
+    options[option.lstrip('-').replace('-', '')] = value
+  return options, args
+
+def run(argv):
+  options, args = getoptions(argv)
+  if 'h' in options or 'help' in options:
+    sys.stdout.write(USAGE.format(
+          scales=', '.join(DEFAULTSCALES)))
+    return 0
+  if 'generate' in options:
+    return generate(options['generate'], options)
+  threshold = float(options.get('threshold', '0.1'))
+  if args:
+    if 'compare' not in options:
+      raise getopt.GetoptError('results.json needs --compare')
+    new = loadresults(args[0])
+  else:
+    scales = options.get('scales', ','.join(DEFAULTSCALES)).split(',')
+    repeat = int(options.get('repeat', '3'))
+    directory = options.get('directory')
+    if directory is None:
+      directory = tempfile.mkdtemp()
+    try:
+      new = runbenchmark(directory, scales, repeat, sys.stdout)
+    finally:
+      if 'directory' not in options:
+        shutil.rmtree(directory)
+    if 'output' in options:
+      saveresults(new, options['output'])
+  if 'compare' not in options:
+    return 0
+  regressions = compareresults(
+        loadresults(options['compare']), new, threshold, sys.stdout)
+  return 1 if regressions else 0
+
+def main():
+  try:
+    return run(sys.argv)
+  except (getopt.GetoptError, ValueError) as err:
+    sys.stderr.write('runbenchmark.py: %s\n' % err)
+    return 2
+
+if __name__ == '__main__':
+  sys.exit(main())
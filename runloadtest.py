@@ -0,0 +1,114 @@
+#! /usr/bin/env python3
+
+# load test of AsyncSessionStoreParser: a local stand-in client uploads
+# one session store many times at once, each upload is timed from its
+# start until its last url is consumed
+# a ticker task measures how late the loop runs it, which shows whether
+# the parses block the loop
+
+import asyncio
+import concurrent.futures
+import getopt
+import sys
+import time
+
+import asyncsessionstoreparser as assp
+
+USAGE = '''\
+usage: runloadtest.py [options] sessionstore
+  --uploads=N            concurrent uploads; default: 100
+  --concurrency=N        parses running at once; default: 4
+  --jobs=N               decode in N worker processes instead of
+                         threads; default: 0
+'''
+
+TICK = 0.001
+
+async def upload(parser, data, latencies):
+  start = time.perf_counter()
+  urls = await parser.parse(data)
+  count = 0
+  async for dummy_url in urls:
+    count += 1
+  latencies.append(time.perf_counter() - start)
+  return count
+
+async def tick(lags, stop):
+  loop = assp.getrunningloop()
+  while not stop.is_set():
+    start = loop.time()
+    await asyncio.sleep(TICK)
+    lags.append(loop.time() - start - TICK)
+
+async def runclients(parser, data, uploads, latencies, lags):
+  stop = asyncio.Event()
+  ticker = asyncio.ensure_future(tick(lags, stop))
+  try:
+    return await asyncio.gather(*[upload(parser, data, latencies)
+          for dummy in range(uploads)])
+  finally:
+    stop.set()
+    await ticker
+
+def percentile(values, fraction):
+  # nearest rank
+  values = sorted(values)
+  return values[max(0, int(round(fraction * len(values))) - 1)]
+
+def runloadtest(data, uploads, concurrency, executor=None, parsedargv=None):
+  loop = asyncio.new_event_loop()
+  latencies = []
+  lags = []
+  try:
+    parser = assp.AsyncSessionStoreParser(
+          parsedargv, executor=executor, concurrency=concurrency)
+    start = time.perf_counter()
+    counts = loop.run_until_complete(
+          runclients(parser, data, uploads, latencies, lags))
+    wall = time.perf_counter() - start
+  finally:
+    loop.close()
+  return {
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'wall': wall,
+        'lag': max(lags) if lags else 0.0}, sum(counts)
+
+def loadtestfile(filename, uploads, concurrency, jobs):
+  with open(filename, 'rb') as fileob:
+    data = fileob.read()
+  executor = None
+  if jobs > 0:
+    executor = concurrent.futures.ProcessPoolExecutor(jobs)
+  try:
+    return runloadtest(data, uploads, concurrency, executor)
+  finally:
+    if executor is not None:
+      executor.shutdown()
+
+def run(argv):
+  opts, args = getopt.getopt(
+        argv[1:], 'h', ['uploads=', 'concurrency=', 'jobs=', 'help'])
+  options = dict((option.lstrip('-'), value) for option, value in opts)
+  if 'h' in options or 'help' in options:
+    sys.stdout.write(USAGE)
+    return 0
+  if len(args) != 1:
+    raise getopt.GetoptError('needs exactly one session store')
+  stages, urlcount = loadtestfile(args[0],
+        int(options.get('uploads', '100')),
+        int(options.get('concurrency', '4')), int(options.get('jobs', '0')))
+  sys.stdout.write('%d urls  %s\n' % (urlcount, '  '.join(
+        '%s %.4f' % (stage, stages[stage])
+        for stage in ['p50', 'p99', 'wall', 'lag'])))
+  return 0
+
+def main():
+  try:
+    return run(sys.argv)
+  except (getopt.GetoptError, ValueError) as err:
+    sys.stderr.write('runloadtest.py: %s\n' % err)
+    return 2
+
+if __name__ == '__main__':
+  sys.exit(main())
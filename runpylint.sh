@@ -14,4 +14,7 @@ pylint \
   --reports=n \
   --indent-string='  ' \
   sessionstoreparser.py \
+  runbenchmark.py \
+  asyncsessionstoreparser.py \
+  runloadtest.py \
   tests
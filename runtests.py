@@ -5,6 +5,30 @@ import unittest
 from tests.test_argvparser import *
 from tests.test_main import *
 from tests.test_main2 import *
+from tests.test_mozlz4 import *
+from tests.test_urlrecord import *
+from tests.test_urlfilter import *
+from tests.test_urlwriter import *
+from tests.test_batch import *
+from tests.test_watch import *
+from tests.test_urlcache import *
+from tests.test_sqlite import *
+from tests.test_unique import *
+from tests.test_summary import *
+from tests.test_format import *
+from tests.test_salvage import *
+from tests.test_input import *
+from tests.test_benchmark import *
+from tests.test_stats import *
+from tests.test_sessionstorewriter import *
+from tests.test_projector import *
+from tests.test_flatproducer import *
+from tests.test_shards import *
+from tests.test_diff import *
+from tests.test_recordwriters import *
+from tests.test_extractor import *
+from tests.test_async import *
+from tests.test_streamreader import *
 
 if __name__ == '__main__': # pragma: no cover
   unittest.main()
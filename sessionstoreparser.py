@@ -6,8 +6,9 @@ COMMANDNAME = 'sessionstoreparser'
 
 USAGE = '''\
 {commandname} {version}
-usage: {commandname} [options] filename
+usage: {commandname} [options] filename...
 without options will show selected urls from open tabs from open windows.
+filename - reads the session store from stdin.
 '''.format(commandname=COMMANDNAME, version=VERSION)
 
 SHORTHELP = USAGE + '''\
@@ -22,12 +23,80 @@ options:
   --window=STATE         open, closed, selected, all; default: open
   --tab=STATE            open, closed, selected, all; default: open
   --url=STATE            back, selected, forward, all; default: selected
+  --reader=READER        json, stream, salvage, project; default: json
+                         salvage reads what is intact of damaged files
+                         project decodes only what urls are made of
+  --producer=PRODUCER    nested, flat; default: nested, flat for --frames
+                         flat walks the session store in one loop
+  --frames               urls of the frames within pages too, after
+                         the url of their page
+  --writer=WRITER        plain, batched, ndjson, csv, html, sqlite,
+                         sessionstore; default: plain
+                         ndjson, csv and html write url, title, states
+                         and numbers of each url, one document per file
+                         sessionstore writes the session store with
+                         only the windows, tabs and urls selected
+  --gzip                 compress the output of --writer=batched,
+                         ndjson, csv, html with gzip
+  --files-from=FILE      read more filenames from FILE, one per line;
+                         - reads from stdin
+  --jobs=N               parse files in N worker processes; default: 1
+  --window-jobs=N        walk the windows of one session store in N
+                         worker processes, for huge ones
+  --order=ORDER          input, completed; order of output from
+                         several files; default: input
+  --watch                parse again whenever the file changes and show
+                         added (+) and removed (-) urls
+  --interval=SECONDS     how often --watch checks the file; default: 1
+  --cache=DIR            keep extracted urls in DIR and reuse them
+                         while the file is unchanged
+  --cache-size=MB        remove least recently used entries from the
+                         cache above this size; default: 256
+  --database=FILE        sqlite database for --writer=sqlite and --query
+  --query                show urls from --database instead of parsing,
+                         only those from filename if given
+  --unique=MODE          show each url only once, at its first place;
+                         exact, approximate
+  --unique-memory=MB     most memory for --unique=approximate; default: 64
+  --unique-error=RATE    rate of unique urls --unique=approximate may
+                         drop; default: 0.0001
+  --format=FORMAT        text shown per url for --writer=plain, batched;
+                         fields: %url% %title% %windownumber% %tabnumber%
+                         %entrynumber% %depth% %windowstate% %tabstate%
+                         %entrystate% %lastaccessed%, %% for %;
+                         default: %url%
+  --summary              count windows, tabs and urls in each state
+                         instead of showing urls
+  --diff=KEYS            show urls added (+), removed (-), moved to
+                         another window or tab (>) and changed in state
+                         (~) from the first to the second filename;
+                         urls, digests; digests keeps no urls in memory
+                         but reads both files twice
+  --stats                print time, cpu time, counts and bytes of each
+                         stage of the parse to stderr
+  --trace-memory         --stats with the memory peak of each stage;
+                         needs python 3.9 or later
+  --profile=FILE         write cProfile statistics of the run to FILE,
+                         with --jobs only of the main process
   -h, --help             print this help
   --version              print version
 '''
 
-import getopt
-import json
+# array, cProfile, getopt, hashlib, json, multiprocessing, re, sqlite3
+# and tempfile are imported where they are used, --version and --help
+# start without them and a parse imports only what its options need
+import codecs
+import errno
+import io
+import itertools
+import marshal
+import math
+import mmap
+import operator
+import os
+import struct
+import sys
+import time
 
 class Error(Exception):
   pass
@@ -35,10 +104,16 @@ class Error(Exception):
 class ArgvError(Error):
   pass
 
+class UnknownOptionError(ArgvError):
+  def __init__(self, option):
+    ArgvError.__init__(self, 'unknown option: %s' % option)
+    self.option = option
+
 class ArgvParser(object):
-  def __init__(self, optionsdata, argumentsdata):
+  def __init__(self, optionsdata, argumentsdata, restargumentsname=None):
     self.optionsdata = optionsdata
     self.argumentsdata = argumentsdata
+    self.restargumentsname = restargumentsname
 
   def prepareoptstring(self, opt, argcount, argmod):
     strippedopt = opt.lstrip('-')
@@ -81,9 +156,34 @@ class ArgvParser(object):
       optsdict[name] = val
     return optsdict
 
+  def splitflags(self, argv):
+    # options without argument spelled out in full and filenames, as
+    # in most runs, are split without getopt and the modules it imports
+    # None leaves anything else to getopt
+    flagnames = {}
+    for name, opts, argcount in self.optionsdata:
+      if argcount == 0:
+        for opt in opts:
+          flagnames[opt] = name
+    optsdict = {}
+    for index, arg in enumerate(argv):
+      if not self.isoption(arg):
+        return optsdict, argv[index:]
+      if arg not in flagnames:
+        return None
+      optsdict[flagnames[arg]] = ''
+    return optsdict, []
+
   def splitopts(self, argv):
+    split = self.splitflags(argv)
+    if split is not None:
+      return split
+    import getopt
     shortopts, longopts, optnames = self.prepareoptionsdata(self.optionsdata)
-    opts, args = getopt.getopt(argv, shortopts, longopts)
+    try:
+      opts, args = getopt.getopt(argv, shortopts, longopts)
+    except getopt.GetoptError as err:
+      raise UnknownOptionError(str(err).split()[1])
     optsdict = self.dictifyopts(opts, optnames)
     return optsdict, args
 
@@ -97,8 +197,19 @@ class ArgvParser(object):
         argsdict[name] = arg
       else:
         break
+    if self.restargumentsname is not None:
+      restarguments = []
+      while len(restargv) > 0 and not self.isoption(restargv[0]):
+        restarguments.append(restargv[0])
+        restargv = restargv[1:]
+      if len(restarguments) > 0:
+        argsdict[self.restargumentsname] = restarguments
     return argsdict, restargv
 
+  @staticmethod
+  def isoption(arg):
+    return arg.startswith('-') and arg != '-'
+
   def combine(self, optsdict, argsdict):
     parsedargv = {}
     parsedargv.update(optsdict)
@@ -114,16 +225,47 @@ class ArgvParser(object):
   def parse(self, argv):
     try:
       parsedargv, restargv = self.tryparse(argv)
-    except getopt.GetoptError as err:
+    except UnknownOptionError as err:
       parsedargv = {}
-      unknownoption = str(err).split()[1]
-      restargv = [unknownoption]
+      restargv = [err.option]
     return parsedargv, restargv
 
+def mapfile(fileob):
+  # None if fileob is not a regular file read from its start
+  try:
+    fileno = fileob.fileno()
+    if fileob.tell() != 0 or os.fstat(fileno).st_size == 0:
+      return None
+    return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+  except (AttributeError, EnvironmentError, ValueError):
+    return None
+
+def decodetext(data, errors):
+  # python 2 keeps bytes, json decodes the strings in them as it goes
+  if str is bytes:
+    return data[:]
+  if isinstance(data, str):
+    return data
+  return str(data, 'utf-8-sig', errors)
+
+def readtext(fileob, errors='strict'):
+  # a mapped file is decoded straight from the page cache, there is no
+  # bytes copy of the file and the mapping is gone before the text is
+  # parsed
+  mapping = mapfile(fileob)
+  if mapping is None:
+    return decodetext(fileob.read(), errors)
+  try:
+    return decodetext(mapping, errors)
+  finally:
+    mapping.close()
+
 class JsonReader(object):
-  def __init__(self, openfunc, jsonloadfunc):
+  # readers may report warnings to stderr
+  def __init__(self, openfunc, jsonloadsfunc, stderr=None):
     self.openfunc = openfunc
-    self.jsonloadfunc = jsonloadfunc
+    self.jsonloadsfunc = jsonloadsfunc
+    self.stderr = stderr
 
   def openfile(self, filename):
     try:
@@ -134,7 +276,7 @@ class JsonReader(object):
 
   def jsonload(self, fileob, filename):
     try:
-      sessionstore = self.jsonloadfunc(fileob)
+      sessionstore = self.jsonloadsfunc(readtext(fileob))
       return sessionstore
     except ValueError:
       raise Error('error: cannot read session store from file %s.' % filename)
@@ -144,6 +286,972 @@ class JsonReader(object):
       sessionstore = self.jsonload(fileob, filename)
     return sessionstore
 
+MOZLZ4MAGIC = b'mozLz40\0'
+
+def decompresslz4block(block, size, start=0):
+  # lz4 block format: sequences of literals followed by a back reference
+  # copies are done with slice assignment into the preallocated buffer
+  # the block is read where it is, from start on
+  #pylint: disable=too-many-branches
+  srcview = memoryview(block)
+  if bytes is str:
+    # items of str are one byte strings on python 2
+    src = bytearray(srcview)
+  else:
+    src = block
+  dst = bytearray(size)
+  srcpos = start
+  dstpos = 0
+  srcend = len(srcview)
+  try:
+    while True:
+      token = src[srcpos]
+      srcpos += 1
+      length = token >> 4
+      if length == 15:
+        while True:
+          byte = src[srcpos]
+          srcpos += 1
+          length += byte
+          if byte != 255:
+            break
+      if length != 0:
+        dst[dstpos:dstpos+length] = srcview[srcpos:srcpos+length]
+        srcpos += length
+        dstpos += length
+      if srcpos >= srcend:
+        break
+      offset = src[srcpos] | (src[srcpos+1] << 8)
+      srcpos += 2
+      length = token & 15
+      if length == 15:
+        while True:
+          byte = src[srcpos]
+          srcpos += 1
+          length += byte
+          if byte != 255:
+            break
+      length += 4
+      start = dstpos - offset
+      if offset == 0 or start < 0:
+        raise ValueError('invalid lz4 match offset')
+      if offset >= length:
+        dst[dstpos:dstpos+length] = dst[start:start+length]
+      else:
+        # overlapping match repeats the last offset bytes
+        pattern = dst[start:dstpos]
+        repeated = pattern * (length // offset + 1)
+        dst[dstpos:dstpos+length] = repeated[:length]
+      dstpos += length
+  except IndexError:
+    raise ValueError('truncated lz4 block')
+  if dstpos != size or len(dst) != size:
+    raise ValueError('lz4 block does not match size in header')
+  return dst
+
+def getlz4blockdecompress():
+  # the lz4 package is optional and decodes about ten times faster
+  try:
+    import lz4.block
+  except ImportError:
+    return decompresslz4block
+  def lz4blockdecompress(block, size, start=0):
+    try:
+      return lz4.block.decompress(
+            memoryview(block)[start:], uncompressed_size=size)
+    except lz4.block.LZ4BlockError as err:
+      raise ValueError(str(err))
+  return lz4blockdecompress
+
+def decompressmozlz4(data, lz4blockdecompress=None, head=b''):
+  # magic, little endian uint32 decompressed size, lz4 block
+  # head is the start of the file if it was read apart from data
+  headersize = len(MOZLZ4MAGIC) + 4
+  skip = headersize - len(head)
+  header = head + memoryview(data)[:max(skip, 0)].tobytes()
+  if skip < 0 or len(header) < headersize or (
+        not header.startswith(MOZLZ4MAGIC)):
+    raise ValueError('not a mozlz4 file')
+  size, = struct.unpack('<I', header[len(MOZLZ4MAGIC):])
+  if lz4blockdecompress is None:
+    lz4blockdecompress = getlz4blockdecompress()
+  return lz4blockdecompress(data, size, skip)
+
+class BufferFile(object):
+  # read only file over a decompressed buffer
+  # decompression happens on first read so errors surface as json errors
+  # head is the start of the file, read before data
+
+  def __init__(self, data, decompressfunc, head=b''):
+    self.data = data
+    self.decompressfunc = decompressfunc
+    self.head = head
+    self.buf = None
+    self.view = None
+    self.pos = 0
+
+  def decompress(self):
+    self.buf = self.decompressfunc(self.data, head=self.head)
+    self.view = memoryview(self.buf)
+    self.data = None
+    self.head = None
+
+  def read(self, size=-1):
+    if self.buf is None:
+      self.decompress()
+    if size is None or size < 0:
+      size = len(self.buf) - self.pos
+    if self.pos == 0 and size >= len(self.buf) and bytes is not str:
+      # json accepts the buffer itself on python 3
+      chunk = self.buf
+    else:
+      chunk = self.view[self.pos:self.pos+size].tobytes()
+    self.pos += len(chunk)
+    return chunk
+
+  def close(self):
+    self.data = None
+    self.head = None
+    self.buf = None
+    self.view = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+class StdinFile(object):
+  # reads stdin in large chunks and does not close it
+  # the first chunk is kept so MagicOpener can seek back to the start
+
+  def __init__(self, fileob, chunksize):
+    self.fileob = fileob
+    self.chunksize = chunksize
+    self.first = None
+    self.pos = 0
+    self.pastfirst = False
+
+  def readrest(self):
+    chunks = []
+    while True:
+      chunk = self.fileob.read(self.chunksize)
+      if len(chunk) == 0:
+        return chunks
+      chunks.append(chunk)
+
+  def read(self, size=-1):
+    if self.first is None:
+      self.first = self.fileob.read(self.chunksize)
+    if size is None or size < 0:
+      chunks = [self.first[self.pos:]] + self.readrest()
+      self.first = b''
+      self.pos = 0
+      self.pastfirst = True
+      return b''.join(chunks)
+    if self.pos < len(self.first):
+      chunk = self.first[self.pos:self.pos+size]
+      self.pos += len(chunk)
+      return chunk
+    self.pastfirst = True
+    return self.fileob.read(size)
+
+  def seek(self, offset):
+    if self.first is None or self.pastfirst or offset > len(self.first):
+      raise IOError('cannot seek in stdin')
+    self.pos = offset
+
+  def close(self):
+    self.first = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+class StdinOpener(object):
+  # opens - as stdin in binary mode and everything else with openfunc
+
+  def __init__(self, openfunc, stdin, chunksize):
+    self.openfunc = openfunc
+    self.stdin = stdin
+    self.chunksize = chunksize
+
+  def __call__(self, filename):
+    if filename != '-':
+      return self.openfunc(filename)
+    if self.stdin is None:
+      raise IOError('no stdin')
+    stdin = getattr(self.stdin, 'buffer', self.stdin)
+    return StdinFile(stdin, self.chunksize)
+
+def getsourcepath(filename):
+  # - is stdin and names no file, so it is kept as it is
+  if filename == '-':
+    return filename
+  return os.path.abspath(filename)
+
+class DataSource(object):
+  # a session store given by its content instead of a filename
+  # messages name it by name
+
+  def __init__(self, data, name):
+    self.data = data
+    self.name = name
+
+  def __str__(self):
+    return self.name
+
+def isdata(source):
+  # bytes on python 3, where they cannot be a filename
+  if isinstance(source, (bytearray, memoryview)):
+    return True
+  return bytes is not str and isinstance(source, bytes)
+
+class DataOpener(object):
+  # opens a DataSource as a file over its data and everything else
+  # with openfunc
+
+  def __init__(self, openfunc):
+    self.openfunc = openfunc
+
+  def __call__(self, filename):
+    if isinstance(filename, DataSource):
+      return io.BytesIO(filename.data)
+    return self.openfunc(filename)
+
+class MagicOpener(object):
+  # opens with openfunc and swaps in a decompressing file
+  # if the file starts with a known magic
+  # the magic already read is handed on with the rest of the file
+
+  def __init__(self, openfunc, decompressors):
+    self.openfunc = openfunc
+    self.decompressors = decompressors
+
+  def __call__(self, filename):
+    filecontext = self.openfunc(filename)
+    fileob = filecontext.__enter__()
+    magiclength = max(len(magic) for magic in self.decompressors)
+    head = fileob.read(magiclength)
+    for magic, decompressfunc in self.decompressors.items():
+      if isinstance(head, bytes) and head.startswith(magic):
+        data = fileob.read()
+        filecontext.__exit__(None, None, None)
+        return BufferFile(data, decompressfunc, head)
+    fileob.seek(0)
+    return filecontext
+
+class JsonScanner(object):
+  # finds the boundaries of json values without decoding them
+  # works on str or bytes read in chunks from fileob
+  # only the values asked for are decoded with jsondecoder
+  #pylint: disable=too-many-instance-attributes
+
+  def __init__(self, fileob, jsondecoder, chunksize, buf=''):
+    self.fileob = fileob
+    self.jsondecoder = jsondecoder
+    self.chunksize = chunksize
+    self.buf = buf
+    self.pos = 0
+    self.mark = None
+    self.eof = fileob is None
+    self.chars = None
+    self.decodable = False
+    self.textdecoder = None
+    if len(buf) != 0:
+      self.setbuftype(buf)
+
+  def setbuftype(self, buf):
+    if not isinstance(buf, (str, type(u''))) and not self.eof:
+      # bytes read on python 3 are decoded chunk by chunk, bytes given
+      # whole are scanned as they are
+      self.textdecoder = codecs.getincrementaldecoder('utf-8')()
+      buf = u''
+    self.chars = self.getchars(buf)
+    # raw_decode only works on the native str type
+    self.decodable = isinstance(buf, str)
+
+  @staticmethod
+  def getchars(buf):
+    if isinstance(buf, type(u'')):
+      return getchars('text')
+    return getchars('bytes')
+
+  def fill(self, size=None):
+    if self.eof:
+      return False
+    chunk = self.fileob.read(size or self.chunksize)
+    if len(chunk) == 0:
+      self.eof = True
+      return False
+    if self.chars is None:
+      self.setbuftype(chunk)
+    if self.textdecoder is not None:
+      chunk = self.textdecoder.decode(chunk)
+    keep = self.pos if self.mark is None else self.mark
+    if keep < len(self.buf):
+      self.buf = self.buf[keep:] + chunk
+    else:
+      self.buf = chunk
+    self.pos -= keep
+    if self.mark is not None:
+      self.mark -= keep
+    return True
+
+  def ensure(self):
+    while self.pos >= len(self.buf):
+      if not self.fill():
+        raise ValueError('unexpected end of json data')
+
+  def peek(self):
+    self.skipwhitespace()
+    return self.buf[self.pos:self.pos+1]
+
+  def skipwhitespace(self):
+    while True:
+      if self.pos < len(self.buf):
+        match = self.chars['whitespace'].match(self.buf, self.pos)
+        self.pos = match.end()
+        if self.pos < len(self.buf):
+          return
+      if not self.fill():
+        return
+
+  def expect(self, name):
+    char = self.peek()
+    if len(char) == 0 or char != self.chars[name]:
+      raise ValueError('expected %s at offset %d' % (name, self.pos))
+    self.pos += 1
+
+  def skipstringbody(self):
+    # pos is after the opening quote
+    while True:
+      match = self.chars['stringend'].search(self.buf, self.pos)
+      if match is None:
+        self.pos = len(self.buf)
+        self.ensure()
+        continue
+      self.pos = match.end()
+      if match.group() == self.chars['quote']:
+        return
+      # skip the escaped char after backslash
+      self.ensure()
+      self.pos += 1
+
+  def skipcontainer(self):
+    # pos is at the opening bracket
+    depth = 0
+    structure = self.chars['structure']
+    opening = self.chars['opening']
+    quote = self.chars['quote']
+    while True:
+      match = structure.search(self.buf, self.pos)
+      if match is None:
+        self.pos = len(self.buf)
+        self.ensure()
+        continue
+      self.pos = match.end()
+      char = match.group()
+      if char == quote:
+        self.skipstringbody()
+      elif char in opening:
+        depth += 1
+      else:
+        depth -= 1
+        if depth == 0:
+          return
+
+  def skipscalar(self):
+    while True:
+      if self.pos < len(self.buf):
+        match = self.chars['scalar'].match(self.buf, self.pos)
+        self.pos = match.end()
+        if self.pos < len(self.buf):
+          return
+      if not self.fill():
+        return
+
+  def skipvalue(self):
+    char = self.peek()
+    if len(char) == 0:
+      raise ValueError('unexpected end of json data')
+    if char == self.chars['quote']:
+      self.pos += 1
+      self.skipstringbody()
+    elif char in self.chars['opening']:
+      self.skipcontainer()
+    else:
+      self.skipscalar()
+
+  def readraw(self):
+    self.skipwhitespace()
+    self.mark = self.pos
+    try:
+      self.skipvalue()
+      raw = self.buf[self.mark:self.pos]
+    finally:
+      self.mark = None
+    return raw
+
+  def decodevalue(self):
+    # decode in place and retry with more data if the value is cut off
+    # reading at least as much as is buffered keeps retries linear
+    while True:
+      try:
+        value, end = self.jsondecoder.raw_decode(self.buf, self.pos)
+      except ValueError:
+        if not self.fill(max(self.chunksize, len(self.buf) - self.pos)):
+          raise
+        continue
+      if end < len(self.buf) or not self.fill():
+        self.pos = end
+        return value
+
+  def readvalue(self):
+    self.skipwhitespace()
+    if self.decodable:
+      return self.decodevalue()
+    raw = self.readraw()
+    if not isinstance(raw, (str, type(u''))):
+      raw = raw.decode('utf-8')
+    return self.jsondecoder.decode(raw)
+
+  def separator(self, closing):
+    # returns False after closing bracket, True after comma
+    char = self.peek()
+    self.pos += 1
+    if char == self.chars['comma']:
+      return True
+    if char == self.chars[closing]:
+      return False
+    raise ValueError('expected , or %s at offset %d' % (closing, self.pos))
+
+  def iterobject(self):
+    # yields keys; caller must consume each value before resuming
+    self.expect('{')
+    if self.peek() == self.chars['}']:
+      self.pos += 1
+      return
+    while True:
+      key = self.readvalue()
+      self.expect(':')
+      yield key
+      if not self.separator('}'):
+        return
+
+  def iterarray(self):
+    # yields once per element; caller must consume each element
+    self.expect('[')
+    if self.peek() == self.chars[']']:
+      self.pos += 1
+      return
+    while True:
+      yield
+      if not self.separator(']'):
+        return
+
+def makechars(convert):
+  import re
+  chars = {
+        'whitespace': re.compile(convert(r'[ \t\n\r]*')),
+        'scalar': re.compile(convert(r'[^,:\]}\s]*')),
+        'stringend': re.compile(convert(r'["\\]')),
+        'structure': re.compile(convert(r'["\[\]{}]')),
+        'opening': convert('[{'),
+        'quote': convert('"'),
+        'comma': convert(','),
+        ':': convert(':'),
+        '{': convert('{'),
+        '}': convert('}'),
+        '[': convert('['),
+        ']': convert(']')}
+  return chars
+
+CHARS = {}
+
+def getchars(kind):
+  # made on first use, importing the module compiles no patterns
+  if kind not in CHARS:
+    if kind == 'text':
+      CHARS[kind] = makechars(type(u''))
+    else:
+      CHARS[kind] = makechars(lambda text: text.encode('ascii'))
+  return CHARS[kind]
+
+class StreamingSessionStore(object):
+  # lazy stand in for the decoded sessionstore dict
+  # windows are decoded one at a time as the scanner reaches them
+  # values needed before they are reached in the file are kept undecoded
+
+  def __init__(self, scanner, filecontext, arraykeys, valuekeys):
+    self.scanner = scanner
+    self.filecontext = filecontext
+    self.arraykeys = arraykeys
+    self.valuekeys = valuekeys
+    self.pending = set(arraykeys) | set(valuekeys)
+    self.keys = scanner.iterobject()
+    self.parked = {}
+
+  def close(self):
+    if self.filecontext is not None:
+      self.filecontext.__exit__(None, None, None)
+      self.filecontext = None
+
+  def done(self, key):
+    self.pending.discard(key)
+    if len(self.pending) == 0:
+      self.close()
+
+  def advanceto(self, wantedkey):
+    for key in self.keys:
+      if key == wantedkey:
+        return True
+      if key in self.arraykeys:
+        self.parked[key] = self.scanner.readraw()
+      elif key in self.valuekeys:
+        self.parked[key] = self.scanner.readvalue()
+      else:
+        self.scanner.skipvalue()
+    return False
+
+  def getvalue(self, key):
+    if key not in self.parked:
+      if not self.advanceto(key):
+        raise KeyError(key)
+      self.parked[key] = self.scanner.readvalue()
+    value = self.parked[key]
+    self.done(key)
+    return value
+
+  def iterarray(self, key):
+    if key in self.parked:
+      raw = self.parked.pop(key)
+      scanner = JsonScanner(
+            None, self.scanner.jsondecoder, self.scanner.chunksize, raw)
+    elif self.advanceto(key):
+      scanner = self.scanner
+    else:
+      raise KeyError(key)
+    for _ in scanner.iterarray():
+      yield scanner.readvalue()
+    self.done(key)
+
+  def __getitem__(self, key):
+    if key in self.arraykeys:
+      return self.iterarray(key)
+    return self.getvalue(key)
+
+class ErrorTranslatingSessionStore(object):
+  # turns json errors raised during lazy decoding into Error
+
+  def __init__(self, sessionstore, filename):
+    self.sessionstore = sessionstore
+    self.filename = filename
+
+  def error(self):
+    return Error('error: cannot read session store from file %s.' %
+          self.filename)
+
+  def iterarray(self, items):
+    try:
+      for item in items:
+        yield item
+    except ValueError:
+      raise self.error()
+
+  def __getitem__(self, key):
+    try:
+      value = self.sessionstore[key]
+    except ValueError:
+      raise self.error()
+    if key in self.sessionstore.arraykeys:
+      return self.iterarray(value)
+    return value
+
+class StreamingJsonReader(JsonReader):
+  def __init__(self, openfunc, jsondecoder, chunksize, arraykeys, valuekeys,
+        stderr=None):
+    #pylint: disable=too-many-arguments
+    #pylint: disable=super-init-not-called
+    self.openfunc = openfunc
+    self.stderr = stderr
+    self.jsondecoder = jsondecoder
+    self.chunksize = chunksize
+    self.arraykeys = arraykeys
+    self.valuekeys = valuekeys
+
+  def read(self, filename):
+    filecontext = self.openfile(filename)
+    fileob = filecontext.__enter__()
+    scanner = JsonScanner(fileob, self.jsondecoder, self.chunksize)
+    sessionstore = StreamingSessionStore(
+          scanner, filecontext, self.arraykeys, self.valuekeys)
+    return ErrorTranslatingSessionStore(sessionstore, filename)
+
+class JsonSalvager(object):
+  # recovers windows, tabs and entries from a damaged session store
+  # goes forward through the text from one object start or array key
+  # to the next, an object that decodes is taken whole by its shape
+  # and skipped, one that does not is entered at its next object start
+  # so every byte is decoded at most once per nesting level
+  # objects which cannot be placed are left out, the places where
+  # decoding failed are kept in skipped as (start, end) offsets
+  # a { which does not follow [ , or : is in a string and ignored when
+  # it does not decode
+  #pylint: disable=too-many-instance-attributes
+
+  TOKEN = (
+        r'"(windows|_closedWindows|tabs|_closedTabs|entries)"\s*:\s*\[|'
+        r'"selectedWindow"\s*:\s*(\d+)|'
+        r'\{')
+
+  ERRORPOSITION = r'\(char (\d+)'
+
+  def __init__(self, text, jsondecoder):
+    import json.scanner
+    import re
+    self.text = text
+    self.jsondecoder = jsondecoder
+    self.token = re.compile(self.TOKEN)
+    self.errorposition = re.compile(self.ERRORPOSITION)
+    # the python scanner tells where nested values fail
+    self.slowdecoder = json.JSONDecoder()
+    self.slowdecoder.scan_once = json.scanner.py_make_scanner(
+          self.slowdecoder)
+    self.sessionstore = {
+          'windows': [],
+          '_closedWindows': [],
+          'selectedWindow': 0}
+    self.windowsection = 'windows'
+    self.tabsection = 'tabs'
+    self.window = None
+    self.windowkeys = set()
+    self.tab = None
+    self.partialwindows = []
+    self.partialtabs = []
+    self.skipped = []
+    self.damage = None
+    self.truncated = False
+
+  def geterrorposition(self, err, start):
+    # python 2 has the position only in the message and its c scanner
+    # loses it for nested values, then the object is decoded again
+    position = getattr(err, 'pos', None)
+    if position is not None:
+      return position
+    match = self.errorposition.search(str(err))
+    if match is None:
+      try:
+        self.slowdecoder.raw_decode(self.text, start)
+      except ValueError as slowerr:
+        match = self.errorposition.search(str(slowerr))
+    if match is None:
+      return start
+    return int(match.group(1))
+
+  def marksuccess(self, position):
+    if self.damage is not None and position > self.damage:
+      self.skipped.append((self.damage, position))
+      self.damage = None
+
+  def markfailure(self, start, position):
+    before = self.text[max(start - 16, 0):start].rstrip()[-1:]
+    if before not in ('[', ',', ':'):
+      return
+    if self.damage is None or position < self.damage:
+      self.damage = position
+
+  def newwindow(self):
+    window = {'tabs': [], '_closedTabs': [], 'selected': 0}
+    self.sessionstore[self.windowsection].append(window)
+    self.partialwindows.append(window)
+    self.window = window
+    self.windowkeys = set()
+    self.tab = None
+    return window
+
+  def newtab(self):
+    tab = {'entries': [], 'index': 0}
+    self.addtab(tab)
+    self.partialtabs.append(tab)
+    self.tab = tab
+    return tab
+
+  def addtab(self, tab):
+    window = self.window
+    if window is None:
+      window = self.newwindow()
+    if self.tabsection == 'tabs':
+      window['tabs'].append(tab)
+    else:
+      window['_closedTabs'].append({'state': tab})
+
+  def handlekey(self, key):
+    if key in ('windows', '_closedWindows'):
+      self.windowsection = key
+      self.window = None
+      self.tab = None
+    elif key in ('tabs', '_closedTabs'):
+      if self.window is None or key in self.windowkeys:
+        self.newwindow()
+      self.windowkeys.add(key)
+      self.tabsection = key
+      self.tab = None
+    else:
+      self.newtab()
+
+  def handleobject(self, value):
+    if not isinstance(value, dict):
+      return
+    if isinstance(value.get('tabs'), list):
+      self.sessionstore[self.windowsection].append(value)
+      self.window = None
+      self.tab = None
+    elif isinstance(value.get('entries'), list):
+      self.addtab(value)
+      self.tab = None
+    elif (isinstance(value.get('state'), dict) and
+          isinstance(value['state'].get('entries'), list)):
+      if self.window is None:
+        self.newwindow()
+      self.window['_closedTabs'].append(value)
+    elif 'url' in value:
+      if self.tab is None:
+        self.newtab()
+      self.tab['entries'].append(value)
+
+  def salvage(self):
+    text = self.text
+    rawdecode = self.jsondecoder.raw_decode
+    # the outermost object is known not to decode
+    position = 0
+    match = self.token.search(text)
+    if match is not None and match.group() == '{':
+      position = match.end()
+    while True:
+      match = self.token.search(text, position)
+      if match is None:
+        break
+      start = match.start()
+      if match.group(1) is not None:
+        self.marksuccess(start)
+        self.handlekey(match.group(1))
+        position = match.end()
+      elif match.group(2) is not None:
+        self.marksuccess(start)
+        self.sessionstore['selectedWindow'] = int(match.group(2))
+        position = match.end()
+      else:
+        try:
+          value, position = rawdecode(text, start)
+        except ValueError as err:
+          self.markfailure(start, self.geterrorposition(err, start))
+          position = start + 1
+          continue
+        self.marksuccess(start)
+        self.handleobject(value)
+    # damage which is not followed by anything intact is the end missing
+    if self.damage is not None:
+      self.truncated = True
+      if self.damage < len(text):
+        self.skipped.append((self.damage, len(text)))
+    # the selected entry of a damaged tab is not known, take the last
+    for tab in self.partialtabs:
+      tab['index'] = len(tab['entries'])
+    return self.sessionstore
+
+  def getbyteranges(self):
+    # offsets in the utf-8 encoded text, in order
+    byteranges = []
+    lastoffset = 0
+    lastbyteoffset = 0
+    for start, end in self.skipped:
+      bytestart = lastbyteoffset + len(
+            self.text[lastoffset:start].encode('utf-8'))
+      byteend = bytestart + len(self.text[start:end].encode('utf-8'))
+      byteranges.append((bytestart, byteend))
+      lastoffset = end
+      lastbyteoffset = byteend
+    return byteranges
+
+  def getcounts(self):
+    windows = (self.sessionstore['windows'] +
+          self.sessionstore['_closedWindows'])
+    tabs = []
+    for window in windows:
+      tabs.extend(window['tabs'])
+      tabs.extend(tab['state'] for tab in window['_closedTabs'])
+    urlcount = sum(len(tab['entries']) for tab in tabs)
+    return (len(windows), len(self.partialwindows),
+          len(tabs), len(self.partialtabs), urlcount)
+
+class SalvagingJsonReader(JsonReader):
+  # reads intact files as JsonReader does, from damaged ones keeps what
+  # JsonSalvager finds and reports what was skipped to stderr
+
+  def __init__(self, openfunc, jsondecoder, stderr=None):
+    #pylint: disable=super-init-not-called
+    self.openfunc = openfunc
+    self.jsondecoder = jsondecoder
+    self.stderr = stderr
+
+  def report(self, salvager, filename):
+    if self.stderr is None:
+      return
+    byteranges = salvager.getbyteranges()
+    for start, end in byteranges:
+      self.stderr.write('warning: %s: skipped bytes %d to %d.\n' % (
+            filename, start, end))
+    if salvager.truncated:
+      self.stderr.write('warning: %s: data ends early.\n' % filename)
+    windows, partialwindows, tabs, partialtabs, urls = salvager.getcounts()
+    self.stderr.write('warning: %s: salvaged %d windows (%d partial), '
+          '%d tabs (%d partial), %d urls; skipped %d bytes in %d places.\n' %
+          (filename, windows, partialwindows, tabs, partialtabs, urls,
+            sum(end - start for start, end in byteranges), len(byteranges)))
+
+  def read(self, filename):
+    with self.openfile(filename) as fileob:
+      data = readtext(fileob, 'replace')
+    if isinstance(data, bytes):
+      data = data.decode('utf-8', 'replace')
+    try:
+      return self.jsondecoder.decode(data)
+    except ValueError:
+      pass
+    salvager = JsonSalvager(data, self.jsondecoder)
+    sessionstore = salvager.salvage()
+    if salvager.getcounts()[0] == 0:
+      raise Error('error: cannot read session store from file %s.' % filename)
+    self.report(salvager, filename)
+    return sessionstore
+
+class JsonProjector(object):
+  # decodes only the members named in projection, a dict from key to
+  # what is kept of its value:
+  #   None   all of it
+  #   dict   the members named in the dict, of an object or of each
+  #          object in an array
+  #   tuple  the members named in the tuple of each object in an array,
+  #          which jsondecoder decodes first, for arrays of many small
+  #          objects which are cheaper to decode in c than to walk here
+  # strings of other members are skipped with find, neither decoded nor
+  # checked, so data uris and form data cost no copy; other values are
+  # decoded by jsondecoder and dropped at once
+
+  def __init__(self, jsondecoder, projection):
+    import re
+    from json.decoder import scanstring
+    self.jsondecoder = jsondecoder
+    self.projection = projection
+    self.scanstring = scanstring
+    self.whitespace = re.compile(r'[ \t\n\r]*')
+    # a key without escapes up to its value in one match
+    self.keypattern = re.compile(r'"([^"\\]*)"[ \t\n\r]*:[ \t\n\r]*')
+    self.separatorpattern = re.compile(r'[ \t\n\r]*([,\]}])[ \t\n\r]*')
+
+  @staticmethod
+  def skipstring(text, pos):
+    # pos is at the opening quote, a quote ends the string unless an odd
+    # number of backslashes is before it
+    end = text.find('"', pos + 1)
+    while end > 0 and text[end-1:end] == '\\':
+      start = end - 1
+      while text[start-1:start] == '\\':
+        start -= 1
+      if (end - start) % 2 == 0:
+        break
+      end = text.find('"', end + 1)
+    if end < 0:
+      raise ValueError('unterminated string at offset %d' % pos)
+    return end + 1
+
+  def skip(self, text, pos):
+    if text[pos:pos+1] == '"':
+      return self.skipstring(text, pos)
+    dummy_value, end = self.jsondecoder.raw_decode(text, pos)
+    return end
+
+  def readkey(self, text, pos):
+    # the key at pos and the position of its value
+    match = self.keypattern.match(text, pos)
+    if match is not None:
+      return match.group(1), match.end()
+    if text[pos:pos+1] != '"':
+      raise ValueError('expected key at offset %d' % pos)
+    key, pos = self.scanstring(text, pos + 1)
+    pos = self.whitespace.match(text, pos).end()
+    if text[pos:pos+1] != ':':
+      raise ValueError('expected : at offset %d' % pos)
+    return key, self.whitespace.match(text, pos + 1).end()
+
+  def separator(self, text, pos, closing):
+    # the position after the comma or closing bracket and whether it
+    # was the closing bracket
+    match = self.separatorpattern.match(text, pos)
+    if match is not None:
+      char = match.group(1)
+      if char == ',':
+        return match.end(), False
+      if char == closing:
+        return match.start(1) + 1, True
+    raise ValueError('expected , or %s at offset %d' % (closing, pos))
+
+  def decodeobjects(self, text, pos, keys):
+    values, end = self.jsondecoder.raw_decode(text, pos)
+    if not isinstance(values, list):
+      return values, end
+    return [dict((key, value[key]) for key in keys if key in value)
+          if isinstance(value, dict) else value for value in values], end
+
+  def project(self, text, pos, projection):
+    if projection is None:
+      return self.jsondecoder.raw_decode(text, pos)
+    if isinstance(projection, tuple):
+      return self.decodeobjects(text, pos, projection)
+    char = text[pos:pos+1]
+    if char == '{':
+      return self.projectobject(text, pos, projection)
+    if char == '[':
+      return self.projectarray(text, pos, projection)
+    return self.jsondecoder.raw_decode(text, pos)
+
+  def projectarray(self, text, pos, projection):
+    values = []
+    pos = self.whitespace.match(text, pos + 1).end()
+    if text[pos:pos+1] == ']':
+      return values, pos + 1
+    while True:
+      value, pos = self.project(text, pos, projection)
+      values.append(value)
+      pos, closed = self.separator(text, pos, ']')
+      if closed:
+        return values, pos
+
+  def projectobject(self, text, pos, projection):
+    members = {}
+    pos = self.whitespace.match(text, pos + 1).end()
+    if text[pos:pos+1] == '}':
+      return members, pos + 1
+    while True:
+      key, pos = self.readkey(text, pos)
+      if key in projection:
+        members[key], pos = self.project(text, pos, projection[key])
+      else:
+        pos = self.skip(text, pos)
+      pos, closed = self.separator(text, pos, '}')
+      if closed:
+        return members, pos
+
+  def loads(self, text):
+    pos = self.whitespace.match(text, 0).end()
+    value, end = self.project(text, pos, self.projection)
+    if self.whitespace.match(text, end).end() != len(text):
+      raise ValueError('extra data at offset %d' % end)
+    return value
+
 class SessionStoreProducer(object):
   def __init__(self, jsonreader, filename):
     self.jsonreader = jsonreader
@@ -152,127 +1260,590 @@ class SessionStoreProducer(object):
   def produce(self):
     return self.jsonreader.read(self.filename)
 
+def getprojection():
+  # what UrlProducer and SessionStoreCounter read of a session store,
+  # title and lastAccessed are only read for --format, children for
+  # --frames
+  tab = {
+        'entries': ('url', 'title', 'children'),
+        'index': None,
+        'lastAccessed': None}
+  window = {
+        'tabs': tab,
+        'selected': None,
+        '_closedTabs': {
+          'state': tab}}
+  return {
+        'windows': window,
+        'selectedWindow': None,
+        '_closedWindows': window}
+
 class SessionStoreProducerFactory(object):
-  def __init__(self, jsonreaderclass, sessionstoreproducerclass,
-        openfunc, jsonloadfunc):
-    self.jsonreaderclass = jsonreaderclass
+  def __init__(self, jsonreaders, defaultreader, sessionstoreproducerclass,
+        openerclass, decompressors, openfunc, stderr):
+    #pylint: disable=too-many-arguments
+    self.jsonreaders = jsonreaders
+    self.defaultreader = defaultreader
     self.sessionstoreproducerclass = sessionstoreproducerclass
-    self.openfunc = openfunc
-    self.jsonloadfunc = jsonloadfunc
+    self.openfunc = openerclass(openfunc, decompressors)
+    self.stderr = stderr
 
   @staticmethod
   def getinitparams():
+    import json
+    jsonreaders = {
+          'json': (JsonReader, {
+            'jsonloadsfunc': json.loads}),
+          'stream': (StreamingJsonReader, {
+            'jsondecoder': json.JSONDecoder(),
+            'chunksize': 1 << 16,
+            'arraykeys': ['windows', '_closedWindows'],
+            'valuekeys': ['selectedWindow']}),
+          'salvage': (SalvagingJsonReader, {
+            'jsondecoder': json.JSONDecoder()}),
+          'project': (JsonReader, {
+            'jsonloadsfunc': JsonProjector(
+              json.JSONDecoder(), getprojection()).loads})}
     initparams = {
-          'jsonreaderclass': JsonReader,
+          'jsonreaders': jsonreaders,
+          'defaultreader': 'json',
           'sessionstoreproducerclass': SessionStoreProducer,
-          'jsonloadfunc': json.load}
+          'openerclass': MagicOpener,
+          'decompressors': {
+            MOZLZ4MAGIC: decompressmozlz4}}
     return initparams
 
-  def make(self, parsedargv):
+  def makejsonreader(self, parsedargv, stats=None):
+    readername = parsedargv.get('reader', self.defaultreader)
+    try:
+      jsonreaderclass, jsonreaderparams = self.jsonreaders[readername]
+    except KeyError:
+      raise ArgvError('illegal value for "reader": "%s"' % readername)
+    openfunc = self.openfunc
+    if stats is not None:
+      openfunc = CountingOpener(openfunc, stats)
+      if 'jsonloadsfunc' in jsonreaderparams:
+        jsonreaderparams = dict(jsonreaderparams, jsonloadsfunc=stats.wrapfunc(
+              'decode', jsonreaderparams['jsonloadsfunc']))
+      if 'jsondecoder' in jsonreaderparams:
+        jsonreaderparams = dict(jsonreaderparams,
+              jsondecoder=MeasuredJsonDecoder(
+                jsonreaderparams['jsondecoder'], stats))
+    jsonreader = jsonreaderclass(
+          openfunc=openfunc, stderr=self.stderr, **jsonreaderparams)
+    return jsonreader
+
+  def make(self, parsedargv, stats=None):
     try:
       filename = parsedargv['filename']
     except KeyError:
       raise ArgvError('missing argument: filename')
-    jsonreader = self.jsonreaderclass(self.openfunc, self.jsonloadfunc)
+    jsonreader = self.makejsonreader(parsedargv, stats)
     sessionstoreproducer = self.sessionstoreproducerclass(jsonreader, filename)
     return sessionstoreproducer
 
+WINDOWOPEN = 1 << 0
+WINDOWSELECTED = 1 << 1
+WINDOWCLOSED = 1 << 2
+TABOPEN = 1 << 3
+TABSELECTED = 1 << 4
+TABCLOSED = 1 << 5
+ENTRYBACK = 1 << 6
+ENTRYSELECTED = 1 << 7
+ENTRYFORWARD = 1 << 8
+
+STATEBITS = {
+      'window': {
+        'open': WINDOWOPEN,
+        'selected': WINDOWSELECTED,
+        'closed': WINDOWCLOSED},
+      'tab': {
+        'open': TABOPEN,
+        'selected': TABSELECTED,
+        'closed': TABCLOSED},
+      'entry': {
+        'back': ENTRYBACK,
+        'selected': ENTRYSELECTED,
+        'forward': ENTRYFORWARD}}
+
+VALIDSTATES = {
+      'window': [WINDOWOPEN, WINDOWOPEN | WINDOWSELECTED, WINDOWCLOSED],
+      'tab': [TABOPEN, TABOPEN | TABSELECTED, TABCLOSED],
+      'entry': [ENTRYBACK, ENTRYSELECTED, ENTRYFORWARD]}
+
+def getvalidstates():
+  # every combination of window, tab, entry state and their prefixes
+  states = []
+  for windowstate in VALIDSTATES['window']:
+    for tabstate in VALIDSTATES['tab']:
+      for entrystate in VALIDSTATES['entry']:
+        states.append((windowstate,
+              windowstate | tabstate,
+              windowstate | tabstate | entrystate))
+  return states
+
+ALLSTATES = frozenset(state
+      for states in getvalidstates() for state in states)
+
+def getstatemask(level, names):
+  mask = 0
+  for name in names:
+    mask |= STATEBITS[level][name]
+  return mask
+
+STATETEXTS = []
+
+def getstatetexts():
+  # for each combination of state bits the names per level
+  # as in "open,selected"
+  # made on first use, most runs never show the states
+  if len(STATETEXTS) == 0:
+    for state in range(max(ALLSTATES) + 1):
+      STATETEXTS.append(tuple(
+            ','.join(sorted(name for name, bit in STATEBITS[level].items()
+              if state & bit))
+            for level in ('window', 'tab', 'entry')))
+  return STATETEXTS
+
+class UrlRecord(object):
+  # one url with window, tab and entry states packed into one int
+  # about 70 bytes per url instead of about 840 for a dict of sets
+  __slots__ = ('url', 'state')
+
+  def __init__(self, url, state=0):
+    self.url = url
+    self.state = state
+
+  def getstatenames(self, level):
+    names = set()
+    for name, bit in STATEBITS[level].items():
+      if self.state & bit:
+        names.add(name)
+    return names
+
+  @property
+  def windowstate(self):
+    return getstatetexts()[self.state][0]
+
+  @property
+  def tabstate(self):
+    return getstatetexts()[self.state][1]
+
+  @property
+  def entrystate(self):
+    return getstatetexts()[self.state][2]
+
+  def __getitem__(self, key):
+    # dict style access as in older versions
+    if key == 'url':
+      return self.url
+    if key in STATEBITS:
+      return self.getstatenames(key)
+    raise KeyError(key)
+
+class DetailedUrlRecord(UrlRecord):
+  # numbers of window, tab and entry as shown to users, counting from 1
+  # depth of the frame in its entry, 0 for the page itself
+  # title and lastaccessed only if asked for
+  __slots__ = ('windownumber', 'tabnumber', 'entrynumber', 'depth',
+        'title', 'lastaccessed')
+
+  def __init__(self, url, state=0):
+    UrlRecord.__init__(self, url, state)
+    self.windownumber = None
+    self.tabnumber = None
+    self.entrynumber = None
+    self.depth = None
+    self.title = None
+    self.lastaccessed = None
+
 class UrlProducer(object):
+  # states are passed down so that whole windows, tabs and history
+  # ranges which cannot reach a state in reachable are never visited
+  # where is (windownumber, tabnumber, tab), counting from 1 within
+  # the open or closed list, number is the entry number in the tab
+
   def __init__(self):
     pass
 
-  def handleentry(self, entry):
-    plainurl = entry['url']
-    url = {
-          'window': set(),
-          'tab': set(),
-          'entry': set(),
-          'url': plainurl}
-    yield url
+  def handleentry(self, entry, state, where, number):
+    #pylint: disable=unused-argument
+    yield UrlRecord(entry['url'], state)
 
-  def handletab(self, tab):
+  def handleentries(self, entries, state, where, number):
+    for entry in entries:
+      for url in self.handleentry(entry, state, where, number):
+        yield url
+      number += 1
+
+  def handletab(self, tab, state, reachable, where):
     openindex = tab['index'] - 1
     entries = tab['entries']
-    for index, entry in enumerate(entries):
-      for url in self.handleentry(entry):
-        if index < openindex:
-          url['entry'].add('back')
-        elif index > openindex:
-          url['entry'].add('forward')
-        else: # index == openindex:
-          url['entry'].add('selected')
+    where = where + (tab,)
+    if state | ENTRYBACK in reachable:
+      for url in self.handleentries(
+            entries[:max(openindex, 0)], state | ENTRYBACK, where, 1):
+        yield url
+    if state | ENTRYSELECTED in reachable and 0 <= openindex < len(entries):
+      for url in self.handleentry(
+            entries[openindex], state | ENTRYSELECTED, where, openindex + 1):
+        yield url
+    if state | ENTRYFORWARD in reachable:
+      for url in self.handleentries(
+            entries[max(openindex + 1, 0):], state | ENTRYFORWARD, where,
+            max(openindex + 1, 0) + 1):
         yield url
 
-  def handlewindow(self, window):
+  def handlewindow(self, window, state, reachable, windownumber):
     selected = window['selected'] - 1
-    for index, tab in enumerate(window['tabs']):
-      for url in self.handletab(tab):
-        url['tab'].add('open')
+    opentabstates = [state | TABOPEN, state | TABOPEN | TABSELECTED]
+    if not reachable.isdisjoint(opentabstates):
+      for index, tab in enumerate(window['tabs']):
+        tabstate = state | TABOPEN
         if index == selected:
-          url['tab'].add('selected')
-        yield url
-    for tab in window['_closedTabs']:
-      for url in self.handletab(tab['state']):
-        url['tab'].add('closed')
-        yield url
+          tabstate |= TABSELECTED
+        if tabstate in reachable:
+          for url in self.handletab(
+                tab, tabstate, reachable, (windownumber, index + 1)):
+            yield url
+    if state | TABCLOSED in reachable:
+      for index, tab in enumerate(window['_closedTabs']):
+        for url in self.handletab(tab['state'], state | TABCLOSED,
+              reachable, (windownumber, index + 1)):
+          yield url
 
-  def handlesessionstore(self, sessionstore):
+  def handlesessionstore(self, sessionstore, reachable):
     selected = sessionstore['selectedWindow'] - 1
     for index, window in enumerate(sessionstore['windows']):
-      for url in self.handlewindow(window):
-        url['window'].add('open')
-        if index == selected:
-          url['window'].add('selected')
-        yield url
-    for window in sessionstore['_closedWindows']:
-      for url in self.handlewindow(window):
-        url['window'].add('closed')
-        yield url
+      state = WINDOWOPEN
+      if index == selected:
+        state |= WINDOWSELECTED
+      if state in reachable:
+        for url in self.handlewindow(window, state, reachable, index + 1):
+          yield url
+    if WINDOWCLOSED in reachable:
+      for index, window in enumerate(sessionstore['_closedWindows']):
+        for url in self.handlewindow(
+              window, WINDOWCLOSED, reachable, index + 1):
+          yield url
 
-  def generate(self, sessionstore):
-    for url in self.handlesessionstore(sessionstore):
+  def generate(self, sessionstore, reachable):
+    for url in self.handlesessionstore(sessionstore, reachable):
       yield url
 
-  def produce(self, sessionstore):
-    return self.generate(sessionstore)
+  def produce(self, sessionstore, urlfilter=None):
+    if urlfilter is None:
+      reachable = ALLSTATES
+    else:
+      reachable = urlfilter.reachable
+    return self.generate(sessionstore, reachable)
+
+class DetailedUrlProducer(UrlProducer):
+  # produces DetailedUrlRecord for consumers which need more than
+  # the url and its states
+
+  def __init__(self, fields):
+    UrlProducer.__init__(self)
+    self.fields = fields
+    self.withtitle = 'title' in fields
+    self.withlastaccessed = 'lastaccessed' in fields
+
+  def handleentry(self, entry, state, where, number):
+    url = DetailedUrlRecord(entry['url'], state)
+    url.windownumber, url.tabnumber, tab = where
+    url.entrynumber = number
+    if self.withtitle:
+      url.title = entry.get('title', u'')
+    if self.withlastaccessed:
+      url.lastaccessed = tab.get('lastAccessed', u'')
+    url.depth = 0
+    yield url
+
+class FlatUrlProducer(object):
+  # the urls of UrlProducer in the same order from one loop over an
+  # explicit stack, a url costs one generator resumption instead of one
+  # per level and a new generator per entry
+  # a stack item is (kind, items, state, where, depth), the items are
+  # numbered, where is windownumber or (windownumber, tabnumber, tab)
+  # with descend the frames of an entry, its children, follow it with
+  # the state and numbers of the entry and their depth
+
+  WINDOWS, TABS, CLOSEDTABS, ENTRIES = range(4)
+
+  def __init__(self, descend=False):
+    self.descend = descend
+
+  def makeurl(self, entry, state, where, number, depth):
+    #pylint: disable=too-many-arguments
+    #pylint: disable=unused-argument
+    #pylint: disable=no-self-use
+    return UrlRecord(entry['url'], state)
+
+  def pushtab(self, stack, tab, state, reachable, where):
+    #pylint: disable=too-many-arguments
+    # the history ranges are pushed last first
+    openindex = tab['index'] - 1
+    entries = tab['entries']
+    where = where + (tab,)
+    forward = max(openindex + 1, 0)
+    if state | ENTRYFORWARD in reachable:
+      stack.append((self.ENTRIES, enumerate(entries[forward:], forward + 1),
+            state | ENTRYFORWARD, where, 0))
+    if state | ENTRYSELECTED in reachable and 0 <= openindex < len(entries):
+      stack.append((self.ENTRIES, iter([(openindex + 1, entries[openindex])]),
+            state | ENTRYSELECTED, where, 0))
+    if state | ENTRYBACK in reachable:
+      stack.append((self.ENTRIES, enumerate(entries[:max(openindex, 0)], 1),
+            state | ENTRYBACK, where, 0))
+
+  def pushwindow(self, stack, window, state, reachable, windownumber):
+    #pylint: disable=too-many-arguments
+    selected = window['selected']
+    if state | TABCLOSED in reachable:
+      stack.append((self.CLOSEDTABS, enumerate(window['_closedTabs'], 1),
+            state | TABCLOSED, windownumber, 0))
+    opentabstates = [state | TABOPEN, state | TABOPEN | TABSELECTED]
+    if not reachable.isdisjoint(opentabstates):
+      stack.append((self.TABS, enumerate(window['tabs'], 1),
+            state | TABOPEN, windownumber, selected))
+
+  def stepwindows(self, stack, reachable):
+    # pushes the tabs of the next reachable window of the windows on top
+    # of the stack, depth holds the number of the selected window
+    dummy_kind, items, state, dummy_where, selected = stack[-1]
+    for number, window in items:
+      windowstate = state
+      if number == selected:
+        windowstate |= WINDOWSELECTED
+      if windowstate in reachable:
+        self.pushwindow(stack, window, windowstate, reachable, number)
+        return
+    stack.pop()
+
+  def steptabs(self, stack, reachable):
+    # pushes the entries of the next reachable tab, depth holds the
+    # number of the selected tab
+    dummy_kind, items, state, windownumber, selected = stack[-1]
+    for number, tab in items:
+      tabstate = state
+      if number == selected:
+        tabstate |= TABSELECTED
+      if tabstate in reachable:
+        self.pushtab(stack, tab, tabstate, reachable, (windownumber, number))
+        return
+    stack.pop()
+
+  def stepclosedtabs(self, stack, reachable):
+    dummy_kind, items, state, windownumber, dummy_depth = stack[-1]
+    for number, tab in items:
+      self.pushtab(stack, tab['state'], state, reachable,
+            (windownumber, number))
+      return
+    stack.pop()
+
+  def generate(self, sessionstore, reachable):
+    # the entries are walked here, windows and tabs by the steps which
+    # push what they hold
+    steps = {
+          self.WINDOWS: self.stepwindows,
+          self.TABS: self.steptabs,
+          self.CLOSEDTABS: self.stepclosedtabs}
+    makeurl = self.makeurl
+    descend = self.descend
+    stack = []
+    if WINDOWCLOSED in reachable:
+      stack.append((self.WINDOWS, enumerate(sessionstore['_closedWindows'], 1),
+            WINDOWCLOSED, None, 0))
+    stack.append((self.WINDOWS, enumerate(sessionstore['windows'], 1),
+          WINDOWOPEN, None, sessionstore['selectedWindow']))
+    while stack:
+      kind, items, state, where, depth = stack[-1]
+      if kind != self.ENTRIES:
+        steps[kind](stack, reachable)
+        continue
+      for number, entry in items:
+        yield makeurl(entry, state, where, number, depth)
+        if descend and entry.get('children'):
+          stack.append((kind,
+                iter([(number, child) for child in entry['children']]),
+                state, where, depth + 1))
+          break
+      else:
+        stack.pop()
+
+  def produce(self, sessionstore, urlfilter=None):
+    if urlfilter is None:
+      reachable = ALLSTATES
+    else:
+      reachable = urlfilter.reachable
+    return self.generate(sessionstore, reachable)
+
+class DetailedFlatUrlProducer(FlatUrlProducer):
+  # produces DetailedUrlRecord as DetailedUrlProducer does
+
+  def __init__(self, fields, descend=False):
+    FlatUrlProducer.__init__(self, descend)
+    self.fields = fields
+    self.withtitle = 'title' in fields
+    self.withlastaccessed = 'lastaccessed' in fields
+
+  def makeurl(self, entry, state, where, number, depth):
+    #pylint: disable=too-many-arguments
+    url = DetailedUrlRecord(entry['url'], state)
+    url.windownumber, url.tabnumber, tab = where
+    url.entrynumber = number
+    url.depth = depth
+    if self.withtitle:
+      url.title = entry.get('title', u'')
+    if self.withlastaccessed:
+      url.lastaccessed = tab.get('lastAccessed', u'')
+    return url
 
 class UrlProducerFactory(object):
-  def __init__(self, urlproducerclass):
-    self.urlproducerclass = urlproducerclass
+  # a producer is a pair of classes, for urls and states only and for
+  # DetailedUrlRecord, only framesproducer can descend into frames
+
+  def __init__(self, urlproducers, defaultproducer, framesproducer):
+    self.urlproducers = urlproducers
+    self.defaultproducer = defaultproducer
+    self.framesproducer = framesproducer
 
   @staticmethod
   def getinitparams():
     initparams = {
-          'urlproducerclass': UrlProducer}
+          'urlproducers': {
+            'nested': (UrlProducer, DetailedUrlProducer),
+            'flat': (FlatUrlProducer, DetailedFlatUrlProducer)},
+          'defaultproducer': 'nested',
+          'framesproducer': 'flat'}
     return initparams
 
-  def make(self, parsedargv):
-    #pylint: disable=unused-argument
-    urlproducer = self.urlproducerclass()
+  def make(self, parsedargv, fields=frozenset()):
+    params = {}
+    if 'frames' in parsedargv:
+      producername = parsedargv.get('producer', self.framesproducer)
+      if producername != self.framesproducer:
+        raise ArgvError('--frames needs --producer=%s' % self.framesproducer)
+      params['descend'] = True
+    else:
+      producername = parsedargv.get('producer', self.defaultproducer)
+    try:
+      urlproducerclass, detailedproducerclass = self.urlproducers[
+            producername]
+    except KeyError:
+      raise ArgvError('illegal value for "producer": "%s"' % producername)
+    if fields:
+      urlproducer = detailedproducerclass(fields, **params)
+    else:
+      urlproducer = urlproducerclass(**params)
     return urlproducer
 
+class SessionStoreCounter(object):
+  # counts windows, tabs and entries per state bit as UrlProducer would
+  # visit them, entries are counted with len() without visiting them
+  # a window or tab is counted if its state can still reach a match
+
+  def __init__(self):
+    pass
+
+  def handletab(self, tab, state, reachable, counts):
+    #pylint: disable=no-self-use
+    openindex = tab['index'] - 1
+    entrycount = len(tab['entries'])
+    if state | ENTRYBACK in reachable:
+      counts[ENTRYBACK] += min(max(openindex, 0), entrycount)
+    if state | ENTRYSELECTED in reachable and 0 <= openindex < entrycount:
+      counts[ENTRYSELECTED] += 1
+    if state | ENTRYFORWARD in reachable:
+      counts[ENTRYFORWARD] += max(entrycount - max(openindex + 1, 0), 0)
+
+  def handlewindow(self, window, state, reachable, counts):
+    selected = window['selected'] - 1
+    opentabstates = [state | TABOPEN, state | TABOPEN | TABSELECTED]
+    if not reachable.isdisjoint(opentabstates):
+      for index, tab in enumerate(window['tabs']):
+        tabstate = state | TABOPEN
+        if index == selected:
+          tabstate |= TABSELECTED
+        if tabstate in reachable:
+          counts[TABOPEN] += 1
+          if index == selected:
+            counts[TABSELECTED] += 1
+          self.handletab(tab, tabstate, reachable, counts)
+    if state | TABCLOSED in reachable:
+      for tab in window['_closedTabs']:
+        counts[TABCLOSED] += 1
+        self.handletab(tab['state'], state | TABCLOSED, reachable, counts)
+
+  def handlesessionstore(self, sessionstore, reachable, counts):
+    selected = sessionstore['selectedWindow'] - 1
+    for index, window in enumerate(sessionstore['windows']):
+      state = WINDOWOPEN
+      if index == selected:
+        state |= WINDOWSELECTED
+      if state in reachable:
+        counts[WINDOWOPEN] += 1
+        if index == selected:
+          counts[WINDOWSELECTED] += 1
+        self.handlewindow(window, state, reachable, counts)
+    if WINDOWCLOSED in reachable:
+      for window in sessionstore['_closedWindows']:
+        counts[WINDOWCLOSED] += 1
+        self.handlewindow(window, WINDOWCLOSED, reachable, counts)
+
+  def count(self, sessionstore, urlfilter=None):
+    # returns a dict from state bit to count
+    if urlfilter is None:
+      reachable = ALLSTATES
+    else:
+      reachable = urlfilter.reachable
+    counts = dict((bit, 0)
+          for bits in STATEBITS.values() for bit in bits.values())
+    self.handlesessionstore(sessionstore, reachable, counts)
+    return counts
+
 class UrlFilter(object):
+  # the attributes are compiled into a lookup table over all states
+  # and the set of partial states from which a match is still reachable
+  # the latter lets UrlProducer skip what cannot match
+
   def __init__(self, attributes):
     self.attributes = attributes
+    self.masks = [getstatemask(level, names)
+          for level, names in attributes.items()]
+    self.table, self.reachable = self.compile(self.masks)
+
+  @staticmethod
+  def compile(masks):
+    table = [False] * (max(ALLSTATES) + 1)
+    reachable = set()
+    for states in getvalidstates():
+      fullstate = states[-1]
+      if all(fullstate & mask for mask in masks):
+        table[fullstate] = True
+        reachable.update(states)
+    return tuple(table), frozenset(reachable)
 
   def attributesmatch(self, url):
-    for key, value in self.attributes.items():
-      if url[key].isdisjoint(value):
-        return False
-    return True
+    return self.table[url.state]
 
   def filter(self, urls):
+    table = self.table
     for url in urls:
-      if self.attributesmatch(url):
+      if table[url.state]:
         yield url
 
 class UrlFilterFactory(object):
   def __init__(self, urlfilterclass,
-        defaulttemplates, optionstemplates, attributes):
+        defaulttemplates, optionstemplates, attributes,
+        uniquefilterclass, urlsetfactoryclass, urlsetfactoryparams):
+    #pylint: disable=too-many-arguments
     self.urlfilterclass = urlfilterclass
     self.defaulttemplates = defaulttemplates
     self.optionstemplates = optionstemplates
     self.attributes = attributes
+    self.uniquefilterclass = uniquefilterclass
+    self.urlsetfactory = urlsetfactoryclass(**urlsetfactoryparams)
 
   @staticmethod
   def getinitparams():
@@ -313,7 +1884,10 @@ class UrlFilterFactory(object):
           'urlfilterclass': UrlFilter,
           'defaulttemplates': defaulttemplates,
           'optionstemplates': optionstemplates,
-          'attributes': attributes}
+          'attributes': attributes,
+          'uniquefilterclass': UniqueUrlFilter,
+          'urlsetfactoryclass': UrlSetFactory,
+          'urlsetfactoryparams': UrlSetFactory.getinitparams()}
     return initparams
 
   def gettemplates(self, parsedargv):
@@ -340,77 +1914,2938 @@ class UrlFilterFactory(object):
     templates = self.gettemplates(parsedargv)
     attributes = self.getattributes(templates)
     urlfilter = self.urlfilterclass(attributes)
+    urlset = self.urlsetfactory.make(parsedargv)
+    if urlset is not None:
+      urlfilter = self.uniquefilterclass(urlfilter, urlset)
     return urlfilter
 
-class UrlWriter(object):
-  def __init__(self, stream):
-    self.stream = stream
+def getdigesttypecode():
+  # 'Q' is missing in python 2 where 'L' has 64 bits on most platforms
+  import array
+  for typecode in ['Q', 'L']:
+    try:
+      array.array(typecode)
+    except ValueError:
+      continue
+    return typecode
+  raise Error('error: no unsigned integer array type.')
 
-  def write(self, urls):
-    for url in urls:
-      self.stream.write(url['url'] + '\n')
+class ExactUrlSet(object):
+  # keeps the 64 bit hash of each url in an open addressing table
+  # at most half full, so 16 to 32 bytes per url instead of about
+  # 160 for a set of strings
+  # the hash of a string is computed once and stored with it
+  # two of n urls have the same hash with probability n ** 2 / 2 ** 65,
+  # about 1 / 3000 for 10 ** 8
+  # hashes are only valid within one process
+
+  def __init__(self):
+    import array
+    self.typecode = getdigesttypecode()
+    self.table = array.array(self.typecode, [0]) * 1024
+    self.digestmask = (1 << (8 * self.table.itemsize)) - 1
+    self.count = 0
+
+  def resize(self):
+    import array
+    oldtable = self.table
+    table = array.array(self.typecode, [0]) * (len(oldtable) * 2)
+    mask = len(table) - 1
+    for digest in oldtable:
+      if digest != 0:
+        index = digest & mask
+        while table[index] != 0:
+          index = (index + 1) & mask
+        table[index] = digest
+    self.table = table
+
+  def addnew(self, url):
+    # true if url was not added before
+    # 0 marks free slots
+    digest = (hash(url) & self.digestmask) or 1
+    table = self.table
+    mask = len(table) - 1
+    index = digest & mask
+    while True:
+      value = table[index]
+      if value == 0:
+        break
+      if value == digest:
+        return False
+      index = (index + 1) & mask
+    table[index] = digest
+    self.count += 1
+    if self.count * 2 > len(table):
+      self.resize()
+    return True
+
+class BloomUrlSet(object):
+  # bloom filter of maxsize bytes, rounded down to a power of two
+  # hashes is chosen for errorrate, which holds up to about
+  # bits * log(2) ** 2 / -log(errorrate) urls and then rises
+  # the bit positions come from the two halves of the 64 bit hash
+
+  def __init__(self, maxsize, errorrate):
+    size = 1 << (maxsize.bit_length() - 1)
+    self.bits = bytearray(size)
+    self.mask = size * 8 - 1
+    self.hashes = max(int(math.ceil(-math.log(errorrate, 2))), 1)
+    self.count = 0
+
+  def addnew(self, url):
+    digest = hash(url)
+    mask = self.mask
+    # an odd step never repeats a position
+    position = digest & mask
+    step = ((digest >> 32) & mask) | 1
+    bits = self.bits
+    new = False
+    for dummy_index in range(self.hashes):
+      position = (position + step) & mask
+      byteindex = position >> 3
+      bit = 1 << (position & 7)
+      if not bits[byteindex] & bit:
+        bits[byteindex] |= bit
+        new = True
+    if new:
+      self.count += 1
+    return new
+
+class UniqueUrlFilter(object):
+  # lets only the first of equal urls through urlfilter
+  # acts as urlfilter for UrlProducer and SqliteQueryParser
+
+  def __init__(self, urlfilter, urlset):
+    self.urlfilter = urlfilter
+    self.urlset = urlset
+    self.table = urlfilter.table
+    self.reachable = urlfilter.reachable
+
+  def attributesmatch(self, url):
+    return self.urlfilter.attributesmatch(url)
+
+  def filter(self, urls):
+    addnew = self.urlset.addnew
+    for url in self.urlfilter.filter(urls):
+      if addnew(url.url):
+        yield url
+
+class KeyedUrlFilter(object):
+  # lets urls through urlfilter and keeps the url of each in keys, so
+  # the parent can make the outputs of workers unique by url
+
+  def __init__(self, urlfilter, keys):
+    self.urlfilter = urlfilter
+    self.keys = keys
+    self.table = urlfilter.table
+    self.reachable = urlfilter.reachable
+
+  def attributesmatch(self, url):
+    return self.urlfilter.attributesmatch(url)
+
+  def filter(self, urls):
+    append = self.keys.append
+    for url in self.urlfilter.filter(urls):
+      append(url.url)
+      yield url
+
+class UrlSetFactory(object):
+  # urlsets maps each mode to the class, its params and the options it
+  # takes, the others are refused for it
+
+  def __init__(self, urlsets, defaultmaxsize, defaulterrorrate):
+    self.urlsets = urlsets
+    self.defaultmaxsize = defaultmaxsize
+    self.defaulterrorrate = defaulterrorrate
+
+  @staticmethod
+  def getinitparams():
+    urlsets = {
+          'exact': (ExactUrlSet, {}, []),
+          'approximate': (BloomUrlSet, {}, [
+            'unique-memory', 'unique-error'])}
+    initparams = {
+          'urlsets': urlsets,
+          'defaultmaxsize': '64',
+          'defaulterrorrate': '0.0001'}
+    return initparams
+
+  def getmaxsize(self, parsedargv):
+    maxsize = parsedargv.get('uniquememory', self.defaultmaxsize)
+    try:
+      maxsizebytes = int(float(maxsize) * (1 << 20))
+    except ValueError:
+      maxsizebytes = 0
+    if maxsizebytes < 1:
+      raise ArgvError('illegal value for "unique-memory": "%s"' % maxsize)
+    return maxsizebytes
+
+  def geterrorrate(self, parsedargv):
+    errorrate = parsedargv.get('uniqueerror', self.defaulterrorrate)
+    try:
+      errorratevalue = float(errorrate)
+    except ValueError:
+      errorratevalue = 0.0
+    if not 0.0 < errorratevalue < 1.0:
+      raise ArgvError('illegal value for "unique-error": "%s"' % errorrate)
+    return errorratevalue
+
+  def make(self, parsedargv):
+    # None without --unique
+    if 'unique' not in parsedargv:
+      return None
+    name = parsedargv['unique']
+    try:
+      urlsetclass, urlsetparams, options = self.urlsets[name]
+    except KeyError:
+      raise ArgvError('illegal value for "unique": "%s"' % name)
+    for option in ['unique-memory', 'unique-error']:
+      if option.replace('-', '') in parsedargv and option not in options:
+        raise ArgvError('--unique=%s takes no --%s' % (name, option))
+    urlsetparams = dict(urlsetparams)
+    if 'unique-memory' in options:
+      urlsetparams['maxsize'] = self.getmaxsize(parsedargv)
+    if 'unique-error' in options:
+      urlsetparams['errorrate'] = self.geterrorrate(parsedargv)
+    urlset = urlsetclass(**urlsetparams)
+    return urlset
+
+class UrlFormat(object):
+  # compiles a format like "[%windownumber%:%tabnumber%] %url%" once
+  # into a %-template and one attrgetter over the records
+  # fields are the fields UrlProducer has to extract for it
+
+  FIELDS = {
+        'url': None,
+        'title': 'title',
+        'windownumber': 'windownumber',
+        'tabnumber': 'tabnumber',
+        'entrynumber': 'entrynumber',
+        'depth': 'depth',
+        'windowstate': None,
+        'tabstate': None,
+        'entrystate': None,
+        'lastaccessed': 'lastaccessed'}
+
+  def __init__(self, formatstring):
+    if isinstance(formatstring, bytes):
+      formatstring = formatstring.decode('utf-8')
+    self.formatstring = formatstring
+    self.template, self.names = self.compile(formatstring)
+    self.fields = frozenset(self.FIELDS[name] for name in self.names
+          if self.FIELDS[name] is not None)
+    if len(self.names) == 0:
+      self.getter = lambda url: ()
+    else:
+      self.getter = operator.attrgetter(*self.names)
+
+  def compile(self, formatstring):
+    # %% is a literal %
+    import re
+    parts = re.split(r'%([a-z]*)%', formatstring)
+    template = []
+    names = []
+    for index, part in enumerate(parts):
+      if index % 2 == 0:
+        if '%' in part:
+          raise ArgvError('illegal value for "format": "%s"' % formatstring)
+        template.append(part)
+      elif part == '':
+        template.append(u'%%')
+      elif part in self.FIELDS:
+        template.append(u'%s')
+        names.append(part)
+      else:
+        raise ArgvError('illegal field in "format": "%%%s%%"' % part)
+    return u''.join(template), names
+
+  def format(self, url):
+    return self.template % self.getter(url)
+
+class UrlWriter(object):
+  # urlformat is a UrlFormat or None for only the url
+
+  def __init__(self, stream, urlformat=None):
+    self.stream = stream
+    self.urlformat = urlformat
+    if urlformat is None:
+      self.fields = frozenset()
+    else:
+      self.fields = urlformat.fields
+
+  def write(self, urls):
+    if self.urlformat is None:
+      for url in urls:
+        self.stream.write(url.url + '\n')
+      return
+    formaturl = self.urlformat.format
+    for url in urls:
+      self.stream.write(formaturl(url) + u'\n')
 
   def consume(self, urls):
     self.write(urls)
 
-class UrlConsumerFactory(object):
-  def __init__(self, urlconsumerclass, stream):
-    self.urlconsumerclass = urlconsumerclass
-    self.stream = stream
+def silencebrokenpipe(stream):
+  # point the closed pipe at /dev/null so flushing at exit does not fail
+  try:
+    fileno = stream.fileno()
+  except (AttributeError, IOError, ValueError):
+    return
+  devnull = os.open(os.devnull, os.O_WRONLY)
+  os.dup2(devnull, fileno)
+  os.close(devnull)
+
+IMAP = getattr(itertools, 'imap', map)
+
+class BatchedUrlWriter(UrlWriter):
+  # joins urls into chunks of about chunksize bytes
+  # and writes them utf-8 encoded to the binary buffer under stream
+  # the number of urls per chunk follows the url lengths seen so far
+  # with compresslevel the chunks are compressed with gzip on the way
+
+  NEWLINE = u'\n'
+
+  def __init__(self, stream, chunksize, urlformat=None, compresslevel=None):
+    UrlWriter.__init__(self, getattr(stream, 'buffer', stream), urlformat)
+    self.textstream = stream
+    self.chunksize = chunksize
+    self.compresslevel = compresslevel
+
+  def getlines(self, urls):
+    if self.urlformat is None:
+      return IMAP(operator.attrgetter('url'), urls)
+    return IMAP(self.urlformat.format, urls)
+
+  def writedocument(self, stream, urls):
+    lines = self.getlines(urls)
+    newline = self.NEWLINE
+    count = max(self.chunksize // 64, 1)
+    while True:
+      chunk = list(itertools.islice(lines, count))
+      if len(chunk) == 0:
+        break
+      chunk.append(u'')
+      data = newline.join(chunk).encode('utf-8')
+      stream.write(data)
+      count = min(max(count * self.chunksize // len(data), 1), 1 << 16)
+
+  def write(self, urls):
+    if self.compresslevel is None:
+      self.writedocument(self.stream, urls)
+    else:
+      import gzip
+      # no name and no time in the header, the same urls give the same
+      # bytes
+      gzipfile = gzip.GzipFile(filename='', mode='wb',
+            compresslevel=self.compresslevel, fileobj=self.stream, mtime=0)
+      self.writedocument(gzipfile, urls)
+      gzipfile.close()
+    self.stream.flush()
+
+  def consume(self, urls):
+    try:
+      # nothing written to the text layer may overtake this output
+      self.textstream.flush()
+      self.write(urls)
+    except IOError as err:
+      if err.errno != errno.EPIPE:
+        raise
+      silencebrokenpipe(self.stream)
+
+class RecordWriter(BatchedUrlWriter):
+  # writes the url, title, states and numbers of each url as a line of
+  # a document between header and footer, in chunks like
+  # BatchedUrlWriter
+  # statesfunc gives the text of the states, which is made once per
+  # state, and linefunc the line of one url
+
+  FIELDS = frozenset(['title', 'windownumber', 'tabnumber', 'entrynumber'])
+
+  HEADER = u''
+  FOOTER = u''
+
+  def __init__(self,
+        stream, chunksize, statesfunc, linefunc, compresslevel=None):
+    #pylint: disable=too-many-arguments
+    BatchedUrlWriter.__init__(self, stream, chunksize, None, compresslevel)
+    self.fields = self.FIELDS
+    self.statetexts = [statesfunc(*statetexts)
+          for statetexts in getstatetexts()]
+    self.linefunc = linefunc
+
+  def getlines(self, urls):
+    return IMAP(self.linefunc, urls)
+
+  def writedocument(self, stream, urls):
+    stream.write(self.HEADER.encode('utf-8'))
+    BatchedUrlWriter.writedocument(self, stream, urls)
+    stream.write(self.FOOTER.encode('utf-8'))
+
+class NdjsonUrlWriter(RecordWriter):
+  # one json object per line, the strings escaped by the c encoder of
+  # the json module
+
+  def __init__(self, stream, chunksize, compresslevel=None):
+    import json.encoder
+    RecordWriter.__init__(self, stream, chunksize,
+          self.formatstates, self.formatline, compresslevel)
+    self.encodestring = json.encoder.encode_basestring_ascii
+
+  @staticmethod
+  def formatstates(windowstate, tabstate, entrystate):
+    return u'"windowstate":"%s","tabstate":"%s","entrystate":"%s"' % (
+          windowstate, tabstate, entrystate)
+
+  def formatline(self, url):
+    encodestring = self.encodestring
+    return u'{"url":%s,"title":%s,%s,"windownumber":%d,"tabnumber":%d,' \
+          u'"entrynumber":%d}' % (encodestring(url.url),
+          encodestring(url.title or u''), self.statetexts[url.state],
+          url.windownumber, url.tabnumber, url.entrynumber)
+
+class CsvUrlWriter(RecordWriter):
+  # comma separated values as RFC 4180 with a header line, strings are
+  # always quoted
+
+  HEADER = (u'url,title,windowstate,tabstate,entrystate,windownumber,'
+        u'tabnumber,entrynumber\r\n')
+
+  NEWLINE = u'\r\n'
+
+  def __init__(self, stream, chunksize, compresslevel=None):
+    RecordWriter.__init__(self, stream, chunksize,
+          self.formatstates, self.formatline, compresslevel)
+
+  @staticmethod
+  def formatstates(windowstate, tabstate, entrystate):
+    return u'"%s","%s","%s"' % (windowstate, tabstate, entrystate)
+
+  def formatline(self, url):
+    return u'"%s","%s",%s,%d,%d,%d' % (url.url.replace(u'"', u'""'),
+          (url.title or u'').replace(u'"', u'""'), self.statetexts[url.state],
+          url.windownumber, url.tabnumber, url.entrynumber)
+
+def escapehtml(text):
+  return (text.replace(u'&', u'&amp;').replace(u'<', u'&lt;')
+        .replace(u'>', u'&gt;').replace(u'"', u'&quot;'))
+
+class HtmlUrlWriter(RecordWriter):
+  # a table with one row per url linked by its title, or by the url if
+  # it has none
+
+  HEADER = (u'<!DOCTYPE html>\n'
+        u'<html>\n'
+        u'<head>\n'
+        u'<meta charset="utf-8">\n'
+        u'<title>sessionstoreparser</title>\n'
+        u'</head>\n'
+        u'<body>\n'
+        u'<table>\n'
+        u'<tr><th>url</th><th>window</th><th>tab</th><th>entry</th>'
+        u'<th>window state</th><th>tab state</th><th>entry state</th>'
+        u'</tr>\n')
+
+  FOOTER = (u'</table>\n'
+        u'</body>\n'
+        u'</html>\n')
+
+  def __init__(self, stream, chunksize, compresslevel=None):
+    RecordWriter.__init__(self, stream, chunksize,
+          self.formatstates, self.formatline, compresslevel)
+
+  @staticmethod
+  def formatstates(windowstate, tabstate, entrystate):
+    return u'<td>%s</td><td>%s</td><td>%s</td>' % (
+          windowstate, tabstate, entrystate)
+
+  def formatline(self, url):
+    plainurl = escapehtml(url.url)
+    return (u'<tr><td><a href="%s">%s</a></td><td>%d</td><td>%d</td>'
+          u'<td>%d</td>%s</tr>' % (plainurl,
+            escapehtml(url.title or u'') or plainurl, url.windownumber,
+            url.tabnumber, url.entrynumber, self.statetexts[url.state]))
+
+class UrlDiffWriter(object):
+  # writes the urls added and removed since the previous consume
+  # snapshots are sets so the difference is two hashed lookups per url
+
+  fields = frozenset()
+
+  def __init__(self, stream):
+    self.stream = stream
+    self.snapshot = []
+    self.snapshotset = set()
+
+  @staticmethod
+  def unique(urls):
+    seen = set()
+    plainurls = []
+    for url in urls:
+      if url.url not in seen:
+        seen.add(url.url)
+        plainurls.append(url.url)
+    return plainurls, seen
+
+  def write(self, removed, added):
+    for plainurl in removed:
+      self.stream.write('- ' + plainurl + '\n')
+    for plainurl in added:
+      self.stream.write('+ ' + plainurl + '\n')
+    self.stream.flush()
+
+  def consume(self, urls):
+    snapshot, snapshotset = self.unique(urls)
+    removed = [plainurl for plainurl in self.snapshot
+          if plainurl not in snapshotset]
+    added = [plainurl for plainurl in snapshot
+          if plainurl not in self.snapshotset]
+    self.snapshot = snapshot
+    self.snapshotset = snapshotset
+    self.write(removed, added)
+
+class SqliteUrlWriter(object):
+  # loads urls into the table urls of a sqlite database, replacing
+  # earlier rows of the same source file
+  # rows go in with executemany in batches within one transaction,
+  # the indexes are created after the first load
+
+  fields = frozenset(['windownumber', 'tabnumber', 'entrynumber'])
+
+  SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS urls (
+          source TEXT NOT NULL,
+          url TEXT NOT NULL,
+          state INTEGER NOT NULL,
+          windowstate TEXT NOT NULL,
+          tabstate TEXT NOT NULL,
+          entrystate TEXT NOT NULL,
+          windownumber INTEGER,
+          tabnumber INTEGER,
+          entrynumber INTEGER)'''
+
+  INDEXES = [
+        'CREATE INDEX IF NOT EXISTS urls_source_state '
+          'ON urls (source, state)',
+        'CREATE INDEX IF NOT EXISTS urls_state ON urls (state)']
+
+  INSERT = 'INSERT INTO urls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+
+  def __init__(self, stream, database, source, batchsize, timefunc):
+    #pylint: disable=too-many-arguments
+    self.stream = stream
+    self.database = database
+    self.source = getsourcepath(source)
+    self.batchsize = batchsize
+    self.timefunc = timefunc
+
+  def makerows(self, urls):
+    source = self.source
+    statetexts = getstatetexts()
+    for url in urls:
+      windowstate, tabstate, entrystate = statetexts[url.state]
+      yield (source, url.url, url.state, windowstate, tabstate, entrystate,
+            url.windownumber, url.tabnumber, url.entrynumber)
+
+  def load(self, connection, urls):
+    rows = self.makerows(urls)
+    count = 0
+    with connection:
+      connection.execute(self.SCHEMA)
+      connection.execute('DELETE FROM urls WHERE source = ?', (self.source,))
+      while True:
+        batch = list(itertools.islice(rows, self.batchsize))
+        if len(batch) == 0:
+          break
+        connection.executemany(self.INSERT, batch)
+        count += len(batch)
+    with connection:
+      for index in self.INDEXES:
+        connection.execute(index)
+    return count
+
+  def write(self, count, seconds):
+    rate = count / max(seconds, 1e-6)
+    self.stream.write(u'%d rows in %s, %.2f s, %d rows/s\n' % (
+          count, self.database, seconds, rate))
+
+  def consume(self, urls):
+    import sqlite3
+    starttime = self.timefunc()
+    connection = sqlite3.connect(self.database, timeout=60)
+    try:
+      connection.execute('PRAGMA journal_mode=WAL')
+      connection.execute('PRAGMA synchronous=NORMAL')
+      count = self.load(connection, urls)
+    except sqlite3.Error as err:
+      raise Error('error: cannot write to database %s: %s.' % (
+            self.database, err))
+    finally:
+      connection.close()
+    self.write(count, self.timefunc() - starttime)
+
+class UrlConsumerFactory(object):
+  #pylint: disable=too-many-instance-attributes
+  def __init__(self, urlconsumers, defaultconsumer, watchconsumer,
+        summarywriterclass, sessionstorewriterclass, sessionstorewriterparams,
+        diffwriterclass, urlformatclass, formatconsumers, defaultformat,
+        gzipconsumers, compresslevel, stream):
+    #pylint: disable=too-many-arguments
+    self.urlconsumers = urlconsumers
+    self.defaultconsumer = defaultconsumer
+    self.watchconsumer = watchconsumer
+    self.summarywriterclass = summarywriterclass
+    self.sessionstorewriterclass = sessionstorewriterclass
+    self.sessionstorewriterparams = sessionstorewriterparams
+    self.diffwriterclass = diffwriterclass
+    self.urlformatclass = urlformatclass
+    self.formatconsumers = formatconsumers
+    self.defaultformat = defaultformat
+    self.gzipconsumers = gzipconsumers
+    self.compresslevel = compresslevel
+    self.stream = stream
+
+  @staticmethod
+  def getinitparams():
+    import json
+    # the third item maps constructor arguments to options
+    urlconsumers = {
+          'plain': (UrlWriter, {}, {}),
+          'batched': (BatchedUrlWriter, {
+            'chunksize': 1 << 16}, {}),
+          'ndjson': (NdjsonUrlWriter, {
+            'chunksize': 1 << 16}, {}),
+          'csv': (CsvUrlWriter, {
+            'chunksize': 1 << 16}, {}),
+          'html': (HtmlUrlWriter, {
+            'chunksize': 1 << 16}, {}),
+          'diff': (UrlDiffWriter, {}, {}),
+          'sqlite': (SqliteUrlWriter, {
+            'batchsize': 10000,
+            'timefunc': time.time}, {
+            'database': 'database',
+            'source': 'filename'})}
+    initparams = {
+          'urlconsumers': urlconsumers,
+          'defaultconsumer': 'plain',
+          'watchconsumer': 'diff',
+          'summarywriterclass': SummaryWriter,
+          'sessionstorewriterclass': SessionStoreWriter,
+          'sessionstorewriterparams': {
+            'jsondecoder': json.JSONDecoder(),
+            'chunksize': 1 << 20},
+          'diffwriterclass': SessionDiffWriter,
+          'urlformatclass': UrlFormat,
+          'formatconsumers': ['plain', 'batched'],
+          'defaultformat': '%url%',
+          'gzipconsumers': ['batched', 'ndjson', 'csv', 'html'],
+          'compresslevel': 6}
+    return initparams
+
+  def makesummarywriter(self, parsedargv):
+    #pylint: disable=unused-argument
+    summarywriter = self.summarywriterclass(self.stream)
+    return summarywriter
+
+  def makesessionstorewriter(self, parsedargv):
+    #pylint: disable=unused-argument
+    sessionstorewriter = self.sessionstorewriterclass(
+          self.stream, **self.sessionstorewriterparams)
+    return sessionstorewriter
+
+  def makediffwriter(self, parsedargv):
+    formatstring = parsedargv.get('format', self.defaultformat)
+    urlformat = None
+    if formatstring != self.defaultformat:
+      urlformat = self.urlformatclass(formatstring)
+      for field in urlformat.fields:
+        if field not in self.diffwriterclass.FIELDS:
+          raise ArgvError('--diff takes no %%%s%% in --format' % field)
+    diffwriter = self.diffwriterclass(self.stream, urlformat)
+    return diffwriter
+
+  def make(self, parsedargv, stats=None):
+    if 'watch' in parsedargv:
+      defaultconsumer = self.watchconsumer
+    else:
+      defaultconsumer = self.defaultconsumer
+    consumername = parsedargv.get('writer', defaultconsumer)
+    try:
+      urlconsumerclass, urlconsumerparams, argvparams = (
+            self.urlconsumers[consumername])
+    except KeyError:
+      raise ArgvError('illegal value for "writer": "%s"' % consumername)
+    urlconsumerparams = dict(urlconsumerparams)
+    for paramname, optionname in argvparams.items():
+      if optionname not in parsedargv:
+        raise ArgvError('--writer=%s needs --%s' % (consumername, optionname))
+      urlconsumerparams[paramname] = parsedargv[optionname]
+    formatstring = parsedargv.get('format', self.defaultformat)
+    if formatstring != self.defaultformat:
+      # the default format is left to the faster plain write
+      if consumername not in self.formatconsumers:
+        raise ArgvError('--writer=%s takes no --format' % consumername)
+      urlconsumerparams['urlformat'] = self.urlformatclass(formatstring)
+    if 'gzip' in parsedargv:
+      if consumername not in self.gzipconsumers:
+        raise ArgvError('--writer=%s takes no --gzip' % consumername)
+      urlconsumerparams['compresslevel'] = self.compresslevel
+    stream = self.stream
+    if stats is not None:
+      stream = CountingStream(stream, stats)
+    urlconsumer = urlconsumerclass(stream=stream, **urlconsumerparams)
+    return urlconsumer
+
+class SessionStoreParser(object):
+  def __init__(self,
+        sessionstoreproducer, urlproducer, urlfilter, urlconsumer):
+    self.sessionstoreproducer = sessionstoreproducer
+    self.urlproducer = urlproducer
+    self.urlfilter = urlfilter
+    self.urlconsumer = urlconsumer
+
+  def parse(self):
+    sessionstore = self.sessionstoreproducer.produce()
+    urls = self.urlproducer.produce(sessionstore, self.urlfilter)
+    filteredurls = self.urlfilter.filter(urls)
+    self.urlconsumer.consume(filteredurls)
+
+class SummaryWriter(object):
+  # one line per level and state: level state count
+
+  LINES = [
+        ('windows', WINDOWOPEN, 'open'),
+        ('windows', WINDOWSELECTED, 'selected'),
+        ('windows', WINDOWCLOSED, 'closed'),
+        ('tabs', TABOPEN, 'open'),
+        ('tabs', TABSELECTED, 'selected'),
+        ('tabs', TABCLOSED, 'closed'),
+        ('urls', ENTRYBACK, 'back'),
+        ('urls', ENTRYSELECTED, 'selected'),
+        ('urls', ENTRYFORWARD, 'forward')]
+
+  def __init__(self, stream):
+    self.stream = stream
+
+  def write(self, counts):
+    for levelname, bit, statename in self.LINES:
+      self.stream.write(u'%s %s %d\n' % (levelname, statename, counts[bit]))
+
+class SummarySessionStoreParser(object):
+  def __init__(self,
+        sessionstoreproducer, sessionstorecounter, urlfilter, summarywriter):
+    self.sessionstoreproducer = sessionstoreproducer
+    self.sessionstorecounter = sessionstorecounter
+    self.urlfilter = urlfilter
+    self.summarywriter = summarywriter
+
+  def parse(self):
+    sessionstore = self.sessionstoreproducer.produce()
+    counts = self.sessionstorecounter.count(sessionstore, self.urlfilter)
+    self.summarywriter.write(counts)
+
+class SessionStoreWriter(object):
+  # writes the session store with only the windows, tabs and entries
+  # urlfilter selects, a tab is kept with at least one entry and a
+  # window with at least one tab
+  # the output is made of parts, spans of the text copied as they are
+  # and text made anew for the arrays which lost items and the numbers
+  # pointing into them, so opaque data as form data and images is never
+  # encoded again
+  # values are decoded one window or tab at a time only to find where
+  # they end, windows and tabs which keep everything are not looked into
+
+  def __init__(self, stream, jsondecoder, chunksize):
+    import re
+    self.stream = stream
+    self.jsondecoder = jsondecoder
+    self.chunksize = chunksize
+    self.whitespace = re.compile(r'[ \t\n\r]*')
+
+  def skipwhitespace(self, text, pos):
+    return self.whitespace.match(text, pos).end()
+
+  def expect(self, text, pos, char):
+    if text[pos:pos+1] != char:
+      raise ValueError('expected %s at offset %d' % (char, pos))
+    return self.skipwhitespace(text, pos + 1)
+
+  def separator(self, text, pos, closing):
+    # the position of the next item, None after the closing bracket
+    pos = self.skipwhitespace(text, pos)
+    if text[pos:pos+1] == closing:
+      return None
+    return self.expect(text, pos, ',')
+
+  def readelements(self, text, pos, keepvalues):
+    # [(start, end, value)] of each element of the array at pos and the
+    # end of the array, value is None unless keepvalues
+    elements = []
+    pos = self.expect(text, pos, '[')
+    if text[pos:pos+1] == ']':
+      return elements, pos + 1
+    while True:
+      value, end = self.jsondecoder.raw_decode(text, pos)
+      elements.append((pos, end, value if keepvalues else None))
+      pos = self.separator(text, end, ']')
+      if pos is None:
+        return elements, self.skipwhitespace(text, end) + 1
+
+  def readmembers(self, text, pos, arrays):
+    # {key: (start, end, value)} of each member of the object at pos and
+    # the end of the object, the value of a member named in arrays are
+    # its elements as readelements makes them, keeping their values if
+    # arrays[key]
+    members = {}
+    pos = self.expect(text, pos, '{')
+    if text[pos:pos+1] == '}':
+      return members, pos + 1
+    while True:
+      key, end = self.jsondecoder.raw_decode(text, pos)
+      pos = self.expect(text, self.skipwhitespace(text, end), ':')
+      if key in arrays:
+        value, end = self.readelements(text, pos, arrays[key])
+      else:
+        value, end = self.jsondecoder.raw_decode(text, pos)
+      members[key] = (pos, end, value)
+      pos = self.separator(text, end, '}')
+      if pos is None:
+        return members, self.skipwhitespace(text, end) + 1
+
+  @staticmethod
+  def makearray(items):
+    parts = ['[']
+    for index, itemparts in enumerate(items):
+      if index != 0:
+        parts.append(',')
+      parts.extend(itemparts)
+    parts.append(']')
+    return parts
+
+  @staticmethod
+  def makeobject(span, members, values):
+    # the members named in values get the parts given there
+    parts = []
+    position = span[0]
+    for start, end, key in sorted((members[key][0], members[key][1], key)
+          for key in values if key in members):
+      parts.append((position, start))
+      parts.extend(values[key])
+      position = end
+    parts.append((position, span[1]))
+    return parts
+
+  @staticmethod
+  def getnumber(value, name, default):
+    number = value.get(name, default)
+    if not isinstance(number, int):
+      raise ValueError('%s is not a number' % name)
+    return number
+
+  def handletab(self, text, span, tab, state, table):
+    #pylint: disable=too-many-arguments
+    entrycount = len(tab.get('entries', []))
+    openindex = self.getnumber(tab, 'index', entrycount) - 1
+    kept = []
+    index = 0
+    for number in range(entrycount):
+      if number < openindex:
+        entrystate = state | ENTRYBACK
+      elif number == openindex:
+        entrystate = state | ENTRYSELECTED
+      else:
+        entrystate = state | ENTRYFORWARD
+      if table[entrystate]:
+        kept.append(number)
+        if number <= openindex:
+          index = len(kept)
+    if len(kept) == 0:
+      return None
+    if len(kept) == entrycount:
+      return [span]
+    members, dummy_end = self.readmembers(text, span[0], {'entries': False})
+    entries = members['entries'][2]
+    return self.makeobject(span, members, {
+          'entries': self.makearray(
+            [[entries[number][:2]] for number in kept]),
+          'index': [str(max(index, 1))]})
+
+  def handleclosedtab(self, text, span, closedtab, state, table):
+    #pylint: disable=too-many-arguments
+    if (not isinstance(closedtab, dict) or
+          not isinstance(closedtab.get('state'), dict)):
+      return None
+    members, dummy_end = self.readmembers(text, span[0], {})
+    tabspan = members['state'][:2]
+    tab = self.handletab(text, tabspan, closedtab['state'], state, table)
+    if tab is None:
+      return None
+    if tab == [tabspan]:
+      return [span]
+    return self.makeobject(span, members, {'state': tab})
+
+  def handletabs(self, text, tabs, state, selected, coverage, table):
+    #pylint: disable=too-many-arguments
+    kept = []
+    newselected = 0
+    for number, (start, end, tab) in enumerate(tabs):
+      tabstate = state | TABOPEN
+      if number == selected:
+        tabstate |= TABSELECTED
+      if tabstate not in coverage:
+        continue
+      if coverage[tabstate]:
+        parts = [(start, end)]
+      else:
+        parts = self.handletab(text, (start, end), tab, tabstate, table)
+      if parts is not None:
+        kept.append(parts)
+        if number <= selected:
+          newselected = len(kept)
+    return kept, newselected
+
+  def handleclosedtabs(self, text, closedtabs, state, coverage, table):
+    #pylint: disable=too-many-arguments
+    kept = []
+    if state not in coverage:
+      return kept
+    for start, end, closedtab in closedtabs:
+      if coverage[state]:
+        parts = [(start, end)]
+      else:
+        parts = self.handleclosedtab(
+              text, (start, end), closedtab, state, table)
+      if parts is not None:
+        kept.append(parts)
+    return kept
+
+  def handlewindow(self, text, span, state, coverage, table):
+    #pylint: disable=too-many-arguments
+    if coverage[state]:
+      return [span]
+    members, dummy_end = self.readmembers(
+          text, span[0], {'tabs': True, '_closedTabs': True})
+    tabs = members.get('tabs', (0, 0, []))[2]
+    selected = members.get('selected', (0, 0, 0))[2]
+    if not isinstance(selected, int):
+      raise ValueError('selected is not a number')
+    kepttabs, newselected = self.handletabs(
+          text, tabs, state, selected - 1, coverage, table)
+    closedtabs = members.get('_closedTabs', (0, 0, []))[2]
+    keptclosedtabs = self.handleclosedtabs(
+          text, closedtabs, state | TABCLOSED, coverage, table)
+    if len(kepttabs) == 0 and len(keptclosedtabs) == 0:
+      return None
+    if (kepttabs == [[tab[:2]] for tab in tabs] and
+          keptclosedtabs == [[tab[:2]] for tab in closedtabs]):
+      return [span]
+    if len(kepttabs) != 0:
+      newselected = max(newselected, 1)
+    return self.makeobject(span, members, {
+          'tabs': self.makearray(kepttabs),
+          'selected': [str(newselected)],
+          '_closedTabs': self.makearray(keptclosedtabs)})
+
+  def handlewindows(self, text, windows, selected, coverage, table):
+    #pylint: disable=too-many-arguments
+    kept = []
+    newselected = 0
+    for number, (start, end, dummy_value) in enumerate(windows):
+      state = WINDOWOPEN
+      if number == selected:
+        state |= WINDOWSELECTED
+      if state not in coverage:
+        continue
+      window = self.handlewindow(text, (start, end), state, coverage, table)
+      if window is not None:
+        kept.append(window)
+        if number <= selected:
+          newselected = len(kept)
+    return kept, newselected
+
+  def handleclosedwindows(self, text, closedwindows, coverage, table):
+    kept = []
+    if WINDOWCLOSED not in coverage:
+      return kept
+    for start, end, dummy_value in closedwindows:
+      window = self.handlewindow(
+            text, (start, end), WINDOWCLOSED, coverage, table)
+      if window is not None:
+        kept.append(window)
+    return kept
+
+  def handlesessionstore(self, text, span, members, coverage, table):
+    #pylint: disable=too-many-arguments
+    windows = members.get('windows', (0, 0, []))[2]
+    selected = members.get('selectedWindow', (0, 0, 0))[2]
+    if not isinstance(selected, int):
+      raise ValueError('selectedWindow is not a number')
+    keptwindows, newselected = self.handlewindows(
+          text, windows, selected - 1, coverage, table)
+    closedwindows = members.get('_closedWindows', (0, 0, []))[2]
+    keptclosedwindows = self.handleclosedwindows(
+          text, closedwindows, coverage, table)
+    if (keptwindows == [[window[:2]] for window in windows] and
+          keptclosedwindows == [[window[:2]] for window in closedwindows]):
+      return [span]
+    if len(keptwindows) != 0:
+      newselected = max(newselected, 1)
+    return self.makeobject(span, members, {
+          'windows': self.makearray(keptwindows),
+          'selectedWindow': [str(newselected)],
+          '_closedWindows': self.makearray(keptclosedwindows)})
+
+  @staticmethod
+  def getcoverage(table):
+    # for each state from which a match is reachable whether everything
+    # below it matches
+    matches = set()
+    allmatch = {}
+    for states in getvalidstates():
+      for state in states:
+        allmatch[state] = allmatch.get(state, True) and table[states[-1]]
+        if table[states[-1]]:
+          matches.add(state)
+    return dict((state, allmatch[state]) for state in matches)
+
+  @staticmethod
+  def joinspans(parts):
+    joined = []
+    for part in parts:
+      if (isinstance(part, tuple) and len(joined) != 0 and
+            isinstance(joined[-1], tuple) and joined[-1][1] == part[0]):
+        joined[-1] = (joined[-1][0], part[1])
+      else:
+        joined.append(part)
+    return joined
+
+  def writeparts(self, text, parts):
+    # text written before must not be overtaken
+    self.stream.flush()
+    stream = getattr(self.stream, 'buffer', self.stream)
+    chunksize = self.chunksize
+    for part in self.joinspans(parts):
+      if isinstance(part, tuple):
+        for start in range(part[0], part[1], chunksize):
+          chunk = text[start:min(start + chunksize, part[1])]
+          if not isinstance(chunk, bytes):
+            chunk = chunk.encode('utf-8')
+          stream.write(chunk)
+      elif isinstance(part, bytes):
+        stream.write(part)
+      else:
+        stream.write(part.encode('ascii'))
+    self.stream.flush()
+
+  def write(self, text, urlfilter):
+    # text is str as readtext gives it, on python 2 with a byte order mark
+    bom = codecs.BOM_UTF8 if isinstance(text, bytes) else u'\ufeff'
+    start = len(bom) if text.startswith(bom) else 0
+    start = self.skipwhitespace(text, start)
+    members, end = self.readmembers(
+          text, start, {'windows': False, '_closedWindows': False})
+    if self.skipwhitespace(text, end) != len(text):
+      raise ValueError('extra data at offset %d' % end)
+    parts = self.handlesessionstore(text, (start, end), members,
+          self.getcoverage(urlfilter.table), urlfilter.table)
+    try:
+      self.writeparts(text, [(0, start)] + parts + [(end, len(text))])
+    except IOError as err:
+      if err.errno != errno.EPIPE:
+        raise
+      silencebrokenpipe(self.stream)
+
+class SessionStoreWriterParser(object):
+  # --writer=sessionstore, the writer needs the text of the file
+
+  def __init__(self, jsonreader, filename, urlfilter, sessionstorewriter):
+    self.jsonreader = jsonreader
+    self.filename = filename
+    self.urlfilter = urlfilter
+    self.sessionstorewriter = sessionstorewriter
+
+  def parse(self):
+    with self.jsonreader.openfile(self.filename) as fileob:
+      try:
+        text = readtext(fileob)
+      except ValueError:
+        raise Error('error: cannot read session store from file %s.' %
+              self.filename)
+    try:
+      self.sessionstorewriter.write(text, self.urlfilter)
+    except ValueError:
+      raise Error('error: cannot read session store from file %s.' %
+            self.filename)
+
+class UrlCache(object):
+  # one file per session store in directory holding all its urls
+  # keyed by path, size, mtime and inode, on a change of mtime or inode
+  # alone a sha1 of the content decides, so a warm hit reads only the
+  # cache file
+  # files are replaced atomically with rename so that several processes
+  # can share a directory, the least recently used are removed above
+  # maxsize bytes
+
+  MAGIC = b'sessionstoreparser urls 2\n'
+
+  def __init__(self, directory, maxsize, statfunc, openfunc):
+    self.directory = directory
+    self.maxsize = maxsize
+    self.statfunc = statfunc
+    self.openfunc = openfunc
+
+  def hashcontent(self, filename):
+    import hashlib
+    contenthash = hashlib.sha1()
+    with self.openfunc(filename) as fileob:
+      while True:
+        chunk = fileob.read(1 << 20)
+        if len(chunk) == 0:
+          break
+        if not isinstance(chunk, bytes):
+          chunk = chunk.encode('utf-8')
+        contenthash.update(chunk)
+    return contenthash.hexdigest()
+
+  def getidentity(self, filename):
+    # None if the file cannot be cached, the parse then reports why
+    try:
+      stat = self.statfunc(filename)
+    except (IOError, OSError):
+      return None
+    path = os.path.abspath(filename)
+    return path, stat.st_size, stat.st_mtime, stat.st_ino
+
+  def gethash(self, identity):
+    # None if the file cannot be read or is no longer the one of
+    # identity, whatever was hashed may then be a mix of both
+    try:
+      contenthash = self.hashcontent(identity[0])
+    except (IOError, OSError):
+      return None
+    if self.getidentity(identity[0]) != identity:
+      return None
+    return contenthash
+
+  def getcachepath(self, identity):
+    # marshal data is not compatible between python versions
+    import hashlib
+    key = '%s %d.%d' % (identity[0], sys.version_info[0], sys.version_info[1])
+    name = hashlib.sha1(key.encode('utf-8')).hexdigest() + '.urls'
+    return os.path.join(self.directory, name)
+
+  def load(self, identity):
+    import array
+    cachepath = self.getcachepath(identity)
+    try:
+      with open(cachepath, 'rb') as cachefile:
+        data = cachefile.read()
+      os.utime(cachepath, None)
+    except (IOError, OSError):
+      return None
+    if not data.startswith(self.MAGIC):
+      return None
+    try:
+      cachedidentity, contenthash, states, plainurls = marshal.loads(
+            data[len(self.MAGIC):])
+    except (EOFError, ValueError, TypeError):
+      return None
+    cachedidentity = tuple(cachedidentity)
+    if cachedidentity != identity:
+      # a touch or a copy back keeps path, size and content
+      if cachedidentity[:2] != identity[:2]:
+        return None
+      if self.gethash(identity) != contenthash:
+        return None
+      self.write(identity, contenthash, states, plainurls)
+    return IMAP(UrlRecord, plainurls, array.array('H', states))
+
+  def evict(self):
+    entries = []
+    for name in os.listdir(self.directory):
+      if name.endswith('.urls'):
+        path = os.path.join(self.directory, name)
+        try:
+          stat = os.stat(path)
+        except OSError:
+          continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+    totalsize = sum(size for dummy_mtime, size, dummy_path in entries)
+    for dummy_mtime, size, path in entries:
+      if totalsize <= self.maxsize:
+        break
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+      totalsize -= size
+
+  def write(self, identity, contenthash, statesbytes, plainurls):
+    # the cache is optional, a full disk must not fail the parse
+    import tempfile
+    data = self.MAGIC + marshal.dumps(
+          (identity, contenthash, statesbytes, plainurls))
+    try:
+      if not os.path.isdir(self.directory):
+        os.makedirs(self.directory)
+      filedescriptor, temppath = tempfile.mkstemp(
+            dir=self.directory, suffix='.tmp')
+    except (IOError, OSError):
+      return
+    try:
+      with os.fdopen(filedescriptor, 'wb') as cachefile:
+        cachefile.write(data)
+      os.rename(temppath, self.getcachepath(identity))
+    except (IOError, OSError):
+      try:
+        os.remove(temppath)
+      except OSError:
+        pass
+      return
+    try:
+      self.evict()
+    except OSError:
+      pass
+
+  def store(self, identity, urls):
+    import array
+    contenthash = self.gethash(identity)
+    if contenthash is None:
+      return
+    plainurls = [url.url for url in urls]
+    states = array.array('H', [url.state for url in urls])
+    if hasattr(states, 'tobytes'):
+      statesbytes = states.tobytes()
+    else:
+      statesbytes = states.tostring()
+    self.write(identity, contenthash, statesbytes, plainurls)
+
+class UrlCacheFactory(object):
+  def __init__(self, urlcacheclass, statfunc, defaultmaxsize, openfunc):
+    self.urlcacheclass = urlcacheclass
+    self.statfunc = statfunc
+    self.defaultmaxsize = defaultmaxsize
+    self.openfunc = openfunc
+
+  @staticmethod
+  def getinitparams():
+    initparams = {
+          'urlcacheclass': UrlCache,
+          'statfunc': os.stat,
+          'defaultmaxsize': '256'}
+    return initparams
+
+  def make(self, parsedargv):
+    maxsize = parsedargv.get('cachesize', self.defaultmaxsize)
+    try:
+      maxsizebytes = int(float(maxsize) * (1 << 20))
+    except ValueError:
+      maxsizebytes = -1
+    if maxsizebytes < 0:
+      raise ArgvError('illegal value for "cache-size": "%s"' % maxsize)
+    urlcache = self.urlcacheclass(
+          parsedargv['cache'], maxsizebytes, self.statfunc, self.openfunc)
+    return urlcache
+
+class CachedSessionStoreParser(SessionStoreParser):
+  # all urls are cached unfiltered so any filter can be applied later
+
+  def __init__(self,
+        sessionstoreproducer, urlproducer, urlfilter, urlconsumer, urlcache):
+    #pylint: disable=too-many-arguments
+    SessionStoreParser.__init__(self,
+          sessionstoreproducer, urlproducer, urlfilter, urlconsumer)
+    self.urlcache = urlcache
+
+  def produceurls(self, identity):
+    if identity is not None:
+      urls = self.urlcache.load(identity)
+      if urls is not None:
+        return urls
+    sessionstore = self.sessionstoreproducer.produce()
+    urls = list(self.urlproducer.produce(sessionstore))
+    if identity is not None:
+      self.urlcache.store(identity, urls)
+    return iter(urls)
+
+  def parse(self):
+    identity = self.urlcache.getidentity(self.sessionstoreproducer.filename)
+    urls = self.produceurls(identity)
+    filteredurls = self.urlfilter.filter(urls)
+    self.urlconsumer.consume(filteredurls)
+
+class SqliteQueryParser(object):
+  # answers the filter from a database written by SqliteUrlWriter
+  # the filter is turned into the list of matching states
+  # so the query can use the index on state
+
+  def __init__(self, database, source, urlfilter, urlconsumer):
+    self.database = database
+    self.source = source
+    self.urlfilter = urlfilter
+    self.urlconsumer = urlconsumer
+
+  def getquery(self):
+    states = [state for state, match in enumerate(self.urlfilter.table)
+          if match]
+    query = ('SELECT url, state, windownumber, tabnumber, entrynumber '
+          'FROM urls WHERE state IN (%s)' % ', '.join('?' * len(states)))
+    params = states
+    if self.source is not None:
+      query += ' AND source = ?'
+      params.append(getsourcepath(self.source))
+    query += ' ORDER BY rowid'
+    return query, params
+
+  def makeurls(self, rows):
+    if not self.urlconsumer.fields:
+      for row in rows:
+        yield UrlRecord(row[0], row[1])
+      return
+    for row in rows:
+      url = DetailedUrlRecord(row[0], row[1])
+      url.windownumber, url.tabnumber, url.entrynumber = row[2:]
+      yield url
+
+  def parse(self):
+    import sqlite3
+    if not os.path.isfile(self.database):
+      raise Error('error: cannot open database %s.' % self.database)
+    connection = sqlite3.connect(self.database, timeout=60)
+    try:
+      query, params = self.getquery()
+      rows = connection.execute(query, params)
+      self.urlconsumer.consume(self.makeurls(rows))
+    except sqlite3.Error as err:
+      raise Error('error: cannot read from database %s: %s.' % (
+            self.database, err))
+    finally:
+      connection.close()
+
+def gettracemalloc():
+  # tracemalloc.reset_peak is in python 3.9 and later
+  try:
+    import tracemalloc
+  except ImportError:
+    return None
+  if not hasattr(tracemalloc, 'reset_peak'):
+    return None
+  return tracemalloc
+
+def getcputimefunc():
+  return getattr(time, 'process_time', None) or time.clock
+
+class PipelineStats(object):
+  # time, cpu time and with tracemalloc the memory peak of each stage
+  # the stages nest and take turns as urls are pulled through the
+  # pipeline, each switch charges the time since the last switch to
+  # the stage which was running, so each stage gets only its own time
+  # iterators are pulled in chunks so a switch is not paid per url
+
+  # stages holds the wall and cpu time, memory peak and count of each
+  # stage, the count is of the urls for produce and filter and of the
+  # bytes for read and consume, total is the whole run
+
+  STAGES = ['read', 'decode', 'produce', 'filter', 'consume']
+  CHUNKSIZE = 1024
+
+  def __init__(self, timefunc, cputimefunc, tracemalloc=None):
+    self.clocks = {'wall': timefunc, 'cpu': cputimefunc}
+    self.tracemalloc = tracemalloc
+    self.startedtracing = False
+    self.reset()
+
+  def readclocks(self):
+    return dict((name, clock()) for name, clock in self.clocks.items())
+
+  def reset(self):
+    self.stages = dict(
+          (stage, {'wall': 0.0, 'cpu': 0.0, 'memory': 0, 'count': 0})
+          for stage in self.STAGES + ['total'])
+    self.sessionstore = None
+    self.stack = []
+    readings = self.readclocks()
+    self.readings = {'start': readings, 'last': readings}
+
+  def switch(self):
+    readings = self.readclocks()
+    if len(self.stack) != 0:
+      timing = self.stages[self.stack[-1]]
+      for name, reading in readings.items():
+        timing[name] += reading - self.readings['last'][name]
+      if self.tracemalloc is not None:
+        peak = self.tracemalloc.get_traced_memory()[1]
+        timing['memory'] = max(timing['memory'], peak)
+    if self.tracemalloc is not None:
+      self.tracemalloc.reset_peak()
+    self.readings['last'] = readings
+
+  def enter(self, stage):
+    self.switch()
+    self.stack.append(stage)
+
+  def leave(self):
+    self.switch()
+    self.stack.pop()
+
+  def call(self, stage, func, *args):
+    self.enter(stage)
+    try:
+      return func(*args)
+    finally:
+      self.leave()
+
+  def wrapfunc(self, stage, func):
+    def measuredfunc(*args):
+      return self.call(stage, func, *args)
+    return measuredfunc
+
+  def iterate(self, stage, iterable):
+    iterator = iter(iterable)
+    islice = itertools.islice
+    chunksize = self.CHUNKSIZE
+    while True:
+      self.enter(stage)
+      try:
+        chunk = list(islice(iterator, chunksize))
+      finally:
+        self.leave()
+      if len(chunk) == 0:
+        return
+      self.stages[stage]['count'] += len(chunk)
+      for item in chunk:
+        yield item
+
+  def start(self):
+    if self.tracemalloc is not None and not self.tracemalloc.is_tracing():
+      self.tracemalloc.start()
+      self.startedtracing = True
+    self.reset()
+
+  def stop(self):
+    self.switch()
+    for name, reading in self.readings['last'].items():
+      self.stages['total'][name] = reading - self.readings['start'][name]
+    if self.startedtracing:
+      self.tracemalloc.stop()
+      self.startedtracing = False
+
+  def getsessionstorecounts(self):
+    if not isinstance(self.sessionstore, dict):
+      return None
+    counts = SessionStoreCounter().count(self.sessionstore)
+    return (counts[WINDOWOPEN], counts[WINDOWCLOSED],
+          counts[TABOPEN], counts[TABCLOSED],
+          counts[ENTRYBACK] + counts[ENTRYSELECTED] + counts[ENTRYFORWARD])
+
+  def write(self, stream, filename):
+    lines = ['stats: %s\n' % filename]
+    header = '  stage        wall s     cpu s'
+    if self.tracemalloc is not None:
+      header += '   peak MB'
+    lines.append(header + '\n')
+    for stage in self.STAGES + ['total']:
+      timing = self.stages[stage]
+      line = '  %-8s %10.3f %9.3f' % (stage, timing['wall'], timing['cpu'])
+      if self.tracemalloc is not None and stage != 'total':
+        line += ' %9.1f' % (timing['memory'] / float(1 << 20))
+      lines.append(line + '\n')
+    sessionstorecounts = self.getsessionstorecounts()
+    if sessionstorecounts is not None:
+      lines.append('  windows %d open, %d closed; tabs %d open, %d closed; '
+            'entries %d\n' % sessionstorecounts)
+    lines.append('  urls %d produced, %d passed filter\n' % (
+          self.stages['produce']['count'], self.stages['filter']['count']))
+    lines.append('  bytes %d read, %d written\n' % (
+          self.stages['read']['count'], self.stages['consume']['count']))
+    stream.write(''.join(lines))
+
+class CountingFile(object):
+  # counts the bytes read from the file opened by filecontext and
+  # charges the reads to read, the stream reader reads as it produces
+  # and may not close the file before the stats are written
+  # a file read through a mapping is counted with its size
+
+  def __init__(self, filecontext, stats):
+    self.filecontext = filecontext
+    self.stats = stats
+    self.fileob = None
+    self.count = 0
+
+  def read(self, size=-1):
+    data = self.stats.call('read', self.fileob.read, size)
+    self.count += len(data)
+    self.stats.stages['read']['count'] += len(data)
+    return data
+
+  def __getattr__(self, name):
+    return getattr(self.fileob, name)
+
+  def __enter__(self):
+    self.fileob = self.filecontext.__enter__()
+    return self
+
+  def __exit__(self, *exc_info):
+    if self.count == 0:
+      try:
+        self.count = os.fstat(self.fileob.fileno()).st_size
+      except (AttributeError, EnvironmentError, ValueError):
+        pass
+      self.stats.stages['read']['count'] += self.count
+    return self.filecontext.__exit__(*exc_info)
+
+class CountingOpener(object):
+  def __init__(self, openfunc, stats):
+    self.openfunc = openfunc
+    self.stats = stats
+
+  def __call__(self, filename):
+    return CountingFile(self.openfunc(filename), self.stats)
+
+class CountingStream(object):
+  # counts the utf-8 encoded bytes written through it
+  # text and bytes written to the buffer under stream are counted apart
+  # ascii text is only encoded to count it where str.isascii is missing
+
+  ISASCII = staticmethod(getattr(type(u''), 'isascii', lambda text: False))
+
+  def __init__(self, stream, stats):
+    self.stream = stream
+    self.stats = stats
+    if hasattr(stream, 'buffer'):
+      self.buffer = CountingStream(stream.buffer, stats)
+
+  def write(self, data):
+    if isinstance(data, bytes) or self.ISASCII(data):
+      self.stats.stages['consume']['count'] += len(data)
+    else:
+      self.stats.stages['consume']['count'] += len(data.encode('utf-8'))
+    return self.stream.write(data)
+
+  def __getattr__(self, name):
+    return getattr(self.stream, name)
+
+class MeasuredSessionStoreProducer(object):
+  def __init__(self, sessionstoreproducer, stats):
+    self.sessionstoreproducer = sessionstoreproducer
+    self.filename = sessionstoreproducer.filename
+    self.stats = stats
+
+  def produce(self):
+    sessionstore = self.stats.call('read', self.sessionstoreproducer.produce)
+    self.stats.sessionstore = sessionstore
+    return sessionstore
+
+class MeasuredJsonDecoder(object):
+  # charges the values decoded by the stream and salvage readers to
+  # decode, they decode as they read or produce
+
+  def __init__(self, jsondecoder, stats):
+    self.jsondecoder = jsondecoder
+    self.stats = stats
+
+  def decode(self, text):
+    return self.stats.call('decode', self.jsondecoder.decode, text)
+
+  def raw_decode(self, text, pos=0):
+    #pylint: disable=invalid-name
+    return self.stats.call('decode', self.jsondecoder.raw_decode, text, pos)
+
+class MeasuredUrlProducer(object):
+  def __init__(self, urlproducer, stats):
+    self.urlproducer = urlproducer
+    self.stats = stats
+
+  def produce(self, sessionstore, urlfilter=None):
+    return self.stats.iterate(
+          'produce', self.urlproducer.produce(sessionstore, urlfilter))
+
+class MeasuredUrlFilter(object):
+  # acts as urlfilter for UrlProducer as UniqueUrlFilter does
+
+  def __init__(self, urlfilter, stats):
+    self.urlfilter = urlfilter
+    self.stats = stats
+    self.table = urlfilter.table
+    self.reachable = urlfilter.reachable
+
+  def attributesmatch(self, url):
+    return self.urlfilter.attributesmatch(url)
+
+  def filter(self, urls):
+    return self.stats.iterate('filter', self.urlfilter.filter(urls))
+
+class MeasuredUrlConsumer(object):
+  def __init__(self, urlconsumer, stats):
+    self.urlconsumer = urlconsumer
+    self.stats = stats
+    self.fields = urlconsumer.fields
+
+  def consume(self, urls):
+    self.stats.call('consume', self.urlconsumer.consume, urls)
+
+class StatsSessionStoreParser(object):
+  # writes the stats of each parse to stderr, also when it failed
+
+  def __init__(self, sessionstoreparser, stats, filename, stderr):
+    self.sessionstoreparser = sessionstoreparser
+    self.stats = stats
+    self.filename = filename
+    self.stderr = stderr
+
+  def parse(self):
+    self.stats.start()
+    try:
+      self.sessionstoreparser.parse()
+    finally:
+      self.stats.stop()
+      self.stats.write(self.stderr, self.filename)
+      self.stats.sessionstore = None
+
+class PipelineStatsFactory(object):
+  # makes nothing unless --stats or --trace-memory is given
+  # so the pipeline is not touched by default
+
+  def __init__(self, pipelinestatsclass, statsparserclass,
+        timefunc, cputimefunc, tracemallocfunc, stderr):
+    #pylint: disable=too-many-arguments
+    self.pipelinestatsclass = pipelinestatsclass
+    self.statsparserclass = statsparserclass
+    self.timefunc = timefunc
+    self.cputimefunc = cputimefunc
+    self.tracemallocfunc = tracemallocfunc
+    self.stderr = stderr
+
+  @staticmethod
+  def getinitparams():
+    initparams = {
+          'pipelinestatsclass': PipelineStats,
+          'statsparserclass': StatsSessionStoreParser,
+          'timefunc': time.time,
+          'cputimefunc': getcputimefunc(),
+          'tracemallocfunc': gettracemalloc}
+    return initparams
+
+  def make(self, parsedargv):
+    if 'stats' not in parsedargv and 'tracememory' not in parsedargv:
+      return None
+    for name in ['query', 'summary']:
+      if name in parsedargv:
+        raise ArgvError('--%s takes no --stats or --trace-memory' % name)
+    if parsedargv.get('writer') == 'sessionstore':
+      raise ArgvError(
+            '--writer=sessionstore takes no --stats or --trace-memory')
+    tracemalloc = None
+    if 'tracememory' in parsedargv:
+      tracemalloc = self.tracemallocfunc()
+      if tracemalloc is None:
+        raise ArgvError('--trace-memory needs python 3.9 or later')
+    stats = self.pipelinestatsclass(
+          self.timefunc, self.cputimefunc, tracemalloc)
+    return stats
+
+  def makeparser(self, sessionstoreparser, stats, filename):
+    return self.statsparserclass(
+          sessionstoreparser, stats, filename, self.stderr)
+
+def makeprofiler():
+  import cProfile
+  return cProfile.Profile()
+
+class ProfilingSessionStoreParser(object):
+  def __init__(self, sessionstoreparser, filename, profilerfunc):
+    self.sessionstoreparser = sessionstoreparser
+    self.filename = filename
+    self.profilerfunc = profilerfunc
+
+  def parse(self):
+    profiler = self.profilerfunc()
+    profiler.enable()
+    try:
+      self.sessionstoreparser.parse()
+    finally:
+      profiler.disable()
+      try:
+        profiler.dump_stats(self.filename)
+      except (IOError, OSError):
+        raise Error('error: cannot write profile to %s.' % self.filename)
+
+class ProfilingSessionStoreParserFactory(object):
+  # --profile covers the whole run, with --jobs only the parent process
+
+  def __init__(self,
+        sessionstoreparserfactory, profilingparserclass, profilerfunc):
+    self.sessionstoreparserfactory = sessionstoreparserfactory
+    self.profilingparserclass = profilingparserclass
+    self.profilerfunc = profilerfunc
+
+  @staticmethod
+  def getinitparams():
+    initparams = {
+          'profilingparserclass': ProfilingSessionStoreParser,
+          'profilerfunc': makeprofiler}
+    return initparams
+
+  def make(self, parsedargv):
+    sessionstoreparser = self.sessionstoreparserfactory.make(parsedargv)
+    if 'profile' not in parsedargv:
+      return sessionstoreparser
+    profilingparser = self.profilingparserclass(
+          sessionstoreparser, parsedargv['profile'], self.profilerfunc)
+    return profilingparser
+
+class SessionStoreParserFactory(object):
+  #pylint: disable=too-many-instance-attributes
+  def __init__(self,
+        sessionstoreproducerfactory,
+        urlproducerfactory,
+        urlfilterfactory,
+        urlconsumerfactory,
+        urlcachefactory,
+        pipelinestatsfactory,
+        sessionstoreparserclass,
+        cachedparserclass,
+        queryparserclass,
+        summaryparserclass,
+        sessionstorecounterclass,
+        sessionstorewriterparserclass):
+    #pylint: disable=too-many-arguments
+    self.sessionstoreproducerfactory = sessionstoreproducerfactory
+    self.urlproducerfactory = urlproducerfactory
+    self.urlfilterfactory = urlfilterfactory
+    self.urlconsumerfactory = urlconsumerfactory
+    self.urlcachefactory = urlcachefactory
+    self.pipelinestatsfactory = pipelinestatsfactory
+    self.sessionstoreparserclass = sessionstoreparserclass
+    self.cachedparserclass = cachedparserclass
+    self.queryparserclass = queryparserclass
+    self.summaryparserclass = summaryparserclass
+    self.sessionstorecounterclass = sessionstorecounterclass
+    self.sessionstorewriterparserclass = sessionstorewriterparserclass
+
+  @staticmethod
+  def getinitparams():
+    initparams = {
+          'sessionstoreparserclass': SessionStoreParser,
+          'cachedparserclass': CachedSessionStoreParser,
+          'queryparserclass': SqliteQueryParser,
+          'summaryparserclass': SummarySessionStoreParser,
+          'sessionstorecounterclass': SessionStoreCounter,
+          'sessionstorewriterparserclass': SessionStoreWriterParser}
+    return initparams
+
+  def makesummaryparser(self, parsedargv):
+    sessionstoreproducer = self.sessionstoreproducerfactory.make(parsedargv)
+    urlfilter = self.urlfilterfactory.make(parsedargv)
+    summarywriter = self.urlconsumerfactory.makesummarywriter(parsedargv)
+    summaryparser = self.summaryparserclass(sessionstoreproducer,
+          self.sessionstorecounterclass(), urlfilter, summarywriter)
+    return summaryparser
+
+  def makesessionstorewriterparser(self, parsedargv):
+    for name in ['morefilenames', 'filesfrom', 'jobs', 'order']:
+      if name in parsedargv:
+        raise ArgvError('--writer=sessionstore takes exactly one filename')
+    for name in ['reader', 'producer', 'frames', 'format', 'unique', 'cache',
+          'watch', 'gzip']:
+      if name in parsedargv:
+        raise ArgvError('--writer=sessionstore takes no --%s' % name)
+    sessionstoreproducer = self.sessionstoreproducerfactory.make(parsedargv)
+    urlfilter = self.urlfilterfactory.make(parsedargv)
+    sessionstorewriter = self.urlconsumerfactory.makesessionstorewriter(
+          parsedargv)
+    writerparser = self.sessionstorewriterparserclass(
+          sessionstoreproducer.jsonreader, sessionstoreproducer.filename,
+          urlfilter, sessionstorewriter)
+    return writerparser
+
+  def makequeryparser(self, parsedargv):
+    if 'database' not in parsedargv:
+      raise ArgvError('--query needs --database')
+    urlfilter = self.urlfilterfactory.make(parsedargv)
+    urlconsumer = self.urlconsumerfactory.make(parsedargv)
+    queryparser = self.queryparserclass(parsedargv['database'],
+          parsedargv.get('filename'), urlfilter, urlconsumer)
+    return queryparser
+
+  def make(self, parsedargv, keys=None):
+    # with keys the url of each url consumed is appended to it
+    stats = self.pipelinestatsfactory.make(parsedargv)
+    if 'query' in parsedargv:
+      return self.makequeryparser(parsedargv)
+    if 'summary' in parsedargv:
+      return self.makesummaryparser(parsedargv)
+    if parsedargv.get('writer') == 'sessionstore':
+      return self.makesessionstorewriterparser(parsedargv)
+    sessionstoreproducer = self.sessionstoreproducerfactory.make(
+          parsedargv, stats)
+    urlfilter = self.urlfilterfactory.make(parsedargv)
+    if keys is not None:
+      urlfilter = KeyedUrlFilter(urlfilter, keys)
+    urlconsumer = self.urlconsumerfactory.make(parsedargv, stats)
+    urlproducer = self.urlproducerfactory.make(
+          parsedargv, urlconsumer.fields)
+    if stats is not None:
+      sessionstoreproducer = MeasuredSessionStoreProducer(
+            sessionstoreproducer, stats)
+      urlproducer = MeasuredUrlProducer(urlproducer, stats)
+      urlfilter = MeasuredUrlFilter(urlfilter, stats)
+      urlconsumer = MeasuredUrlConsumer(urlconsumer, stats)
+    # the cache holds only urls and states of the pages
+    if ('cache' in parsedargv and not urlconsumer.fields and
+          'frames' not in parsedargv):
+      urlcache = self.urlcachefactory.make(parsedargv)
+      sessionstoreparser = self.cachedparserclass(
+            sessionstoreproducer, urlproducer, urlfilter, urlconsumer,
+            urlcache)
+    else:
+      sessionstoreparser = self.sessionstoreparserclass(
+            sessionstoreproducer, urlproducer, urlfilter, urlconsumer)
+    if stats is not None:
+      sessionstoreparser = self.pipelinestatsfactory.makeparser(
+            sessionstoreparser, stats, sessionstoreproducer.filename)
+    return sessionstoreparser
+
+def writeoutput(stream, data):
+  # data is utf-8 encoded, nothing written as text may overtake it
+  stream.flush()
+  getattr(stream, 'buffer', stream).write(data)
+
+class MessageBuffer(object):
+  # collects what is written to it, for warnings from worker processes
+
+  def __init__(self):
+    self.parts = []
+
+  def write(self, text):
+    self.parts.append(text)
+
+  def flush(self):
+    pass
+
+  def pop(self):
+    text = ''.join(self.parts)
+    del self.parts[:]
+    return text
+
+class BatchWorker(object):
+  # parses one file at a time into a buffer
+  # runs in the worker processes of BatchSessionStoreParser
+  # if keyed the url of each line of the output is returned with it,
+  # otherwise None
+
+  def __init__(self, sspf_factory, openfunc, parsedargv, keyed=False):
+    self.sspf_factory = sspf_factory
+    self.openfunc = openfunc
+    self.parsedargv = parsedargv
+    self.keyed = keyed
+    self.stream = None
+    self.warnings = None
+    self.sessionstoreparserfactory = None
+
+  def setup(self):
+    self.stream = io.TextIOWrapper(
+          io.BytesIO(), encoding='utf-8', newline='\n')
+    self.warnings = MessageBuffer()
+    self.sessionstoreparserfactory = self.sspf_factory.make(
+          self.stream, self.openfunc, self.warnings)
+
+  def tryparsefile(self, filename):
+    parsedargv = dict(self.parsedargv, filename=filename)
+    keys = [] if self.keyed else None
+    sessionstoreparser = self.sessionstoreparserfactory.make(
+          parsedargv, keys)
+    sessionstoreparser.parse()
+    self.stream.flush()
+    return self.stream.buffer.getvalue(), keys
+
+  def clear(self):
+    if self.stream is None:
+      self.setup()
+    self.stream.flush()
+    self.stream.buffer.seek(0)
+    self.stream.buffer.truncate()
+
+  def parsefile(self, filename):
+    #pylint: disable=broad-except
+    self.clear()
+    output = b''
+    keys = None
+    message = None
+    try:
+      output, keys = self.tryparsefile(filename)
+    except Error as err:
+      message = str(err)
+    except Exception as err:
+      # one damaged file must not abort the whole batch
+      message = 'error: cannot parse session store from file %s: %r' % (
+            filename, err)
+    return filename, output, keys, self.warnings.pop(), message
+
+BATCHWORKERS = {}
+
+def uniquelines(urlset, output, keys):
+  # the lines of output whose url in keys is not yet in urlset
+  # raises ValueError unless there is one line per url, as a title
+  # with a newline in it would make
+  addnew = urlset.addnew
+  lines = output.split(b'\n')
+  lastline = lines.pop()
+  if len(lines) != len(keys) or len(lastline) != 0:
+    raise ValueError('%d lines for %d urls' % (len(lines), len(keys)))
+  newlines = [line for line, key in zip(lines, keys) if addnew(key)]
+  newlines.append(lastline)
+  return b'\n'.join(newlines)
+
+def initbatchworker(worker):
+  BATCHWORKERS['worker'] = worker
+
+def runbatchworker(filename):
+  return BATCHWORKERS['worker'].parsefile(filename)
+
+def makepool(processes, initializer, initargs):
+  import multiprocessing
+  return multiprocessing.Pool(processes, initializer, initargs)
+
+class BatchSessionStoreParser(object):
+  # with urlset the lines of all outputs are made unique by their urls,
+  # each worker has already done so within its file
+  #pylint: disable=too-many-instance-attributes
+
+  def __init__(self,
+        worker, filenames, jobs, ordered, poolfunc, stdout, stderr,
+        urlset=None):
+    #pylint: disable=too-many-arguments
+    self.worker = worker
+    self.filenames = filenames
+    self.jobs = jobs
+    self.ordered = ordered
+    self.poolfunc = poolfunc
+    self.stdout = stdout
+    self.stderr = stderr
+    self.urlset = urlset
+
+  def getchunksize(self):
+    return max(1, min(32, len(self.filenames) // (self.jobs * 8)))
+
+  def writeresults(self, results):
+    failed = 0
+    for filename, output, keys, warnings, message in results:
+      self.stderr.write(warnings)
+      if message is None and self.urlset is not None:
+        try:
+          output = uniquelines(self.urlset, output, keys)
+        except ValueError:
+          message = ('error: cannot make the urls of file %s unique, '
+                'the output is not one line per url.' % filename)
+      if message is None:
+        writeoutput(self.stdout, output)
+      else:
+        self.stderr.write(message + '\n')
+        failed += 1
+    return failed
+
+  def tryparse(self):
+    if self.jobs == 1:
+      return self.writeresults(IMAP(self.worker.parsefile, self.filenames))
+    pool = self.poolfunc(self.jobs, initbatchworker, (self.worker,))
+    try:
+      if self.ordered:
+        mapfunc = pool.imap
+      else:
+        mapfunc = pool.imap_unordered
+      results = mapfunc(runbatchworker, self.filenames, self.getchunksize())
+      failed = self.writeresults(results)
+      pool.close()
+    finally:
+      pool.terminate()
+      pool.join()
+    return failed
+
+  def parse(self):
+    try:
+      failed = self.tryparse()
+    except IOError as err:
+      if err.errno != errno.EPIPE:
+        raise
+      silencebrokenpipe(self.stdout)
+      return
+    if failed != 0:
+      raise Error('error: %d of %d files failed.' % (
+            failed, len(self.filenames)))
+
+class BatchSessionStoreParserFactory(object):
+  # makes a BatchSessionStoreParser if more than one file is given
+  # or any of the batch options, otherwise hands over to
+  # sessionstoreparserfactory
+  #pylint: disable=too-many-instance-attributes
+
+  def __init__(self,
+        sessionstoreparserfactory, sspf_factory,
+        openfunc, stdout, stderr, stdin,
+        batchparserclass, workerclass, poolfunc, orders,
+        urlsetfactoryclass, urlsetfactoryparams, uniquewriters):
+    #pylint: disable=too-many-arguments
+    self.sessionstoreparserfactory = sessionstoreparserfactory
+    self.sspf_factory = sspf_factory
+    self.openfunc = openfunc
+    self.stdout = stdout
+    self.stderr = stderr
+    self.stdin = stdin
+    self.batchparserclass = batchparserclass
+    self.workerclass = workerclass
+    self.poolfunc = poolfunc
+    self.orders = orders
+    self.urlsetfactory = urlsetfactoryclass(**urlsetfactoryparams)
+    self.uniquewriters = uniquewriters
+
+  @staticmethod
+  def getinitparams():
+    # uniquewriters write one line per url, the first is the default
+    initparams = {
+          'batchparserclass': BatchSessionStoreParser,
+          'workerclass': BatchWorker,
+          'poolfunc': makepool,
+          'orders': {
+            'input': True,
+            'completed': False},
+          'urlsetfactoryclass': UrlSetFactory,
+          'urlsetfactoryparams': UrlSetFactory.getinitparams(),
+          'uniquewriters': ['plain', 'batched', 'ndjson']}
+    return initparams
+
+  @staticmethod
+  def isbatch(parsedargv):
+    for name in ['morefilenames', 'filesfrom', 'jobs', 'order']:
+      if name in parsedargv:
+        return True
+    return False
+
+  def readfilenames(self, filesfrom):
+    if filesfrom == '-':
+      lines = list(self.stdin)
+    else:
+      try:
+        with self.openfunc(filesfrom) as fileob:
+          lines = list(fileob)
+      except IOError:
+        raise Error('error: cannot open file %s.' % filesfrom)
+    filenames = []
+    for line in lines:
+      if not isinstance(line, (str, type(u''))):
+        line = line.decode('utf-8')
+      line = line.rstrip('\r\n')
+      if len(line) != 0:
+        filenames.append(line)
+    return filenames
+
+  def getfilenames(self, parsedargv):
+    filenames = []
+    if 'filename' in parsedargv:
+      filenames.append(parsedargv['filename'])
+    filenames.extend(parsedargv.get('morefilenames', []))
+    if 'filesfrom' in parsedargv:
+      filenames.extend(self.readfilenames(parsedargv['filesfrom']))
+    return filenames
+
+  @staticmethod
+  def getjobs(parsedargv):
+    jobs = parsedargv.get('jobs', '1')
+    try:
+      jobscount = int(jobs)
+    except ValueError:
+      jobscount = 0
+    if jobscount < 1:
+      raise ArgvError('illegal value for "jobs": "%s"' % jobs)
+    return jobscount
+
+  def getordered(self, parsedargv):
+    order = parsedargv.get('order', 'input')
+    try:
+      return self.orders[order]
+    except KeyError:
+      raise ArgvError('illegal value for "order": "%s"' % order)
+
+  def checkunique(self, parsedargv):
+    # the lines of the outputs are made unique here by their urls
+    for name in ['summary', 'query', 'gzip']:
+      if name in parsedargv:
+        raise ArgvError('--unique with several files takes no --%s' % name)
+    writer = parsedargv.get('writer', self.uniquewriters[0])
+    if writer not in self.uniquewriters:
+      raise ArgvError(
+            '--unique with several files takes no --writer=%s' % writer)
+
+  def make(self, parsedargv):
+    if not self.isbatch(parsedargv):
+      return self.sessionstoreparserfactory.make(parsedargv)
+    jobs = self.getjobs(parsedargv)
+    ordered = self.getordered(parsedargv)
+    filenames = self.getfilenames(parsedargv)
+    if len(filenames) == 0:
+      raise ArgvError('missing argument: filename')
+    # option errors should be reported once and not per file
+    self.sessionstoreparserfactory.make(
+          dict(parsedargv, filename=filenames[0]))
+    urlset = self.urlsetfactory.make(parsedargv)
+    if urlset is not None:
+      self.checkunique(parsedargv)
+    workerargv = parsedargv
+    if urlset is not None and jobs == 1:
+      # the urls are made unique here anyway
+      workerargv = dict(parsedargv)
+      del workerargv['unique']
+    worker = self.workerclass(self.sspf_factory, self.openfunc, workerargv,
+          urlset is not None)
+    batchparser = self.batchparserclass(worker, filenames, jobs, ordered,
+          self.poolfunc, self.stdout, self.stderr, urlset)
+    return batchparser
+
+class WindowSharder(object):
+  # splits the windows and closed windows of a session store given as
+  # bytes into shards of about shardsize bytes without decoding them
+  # a shard is guessed to end before a comma and marker, the text the
+  # first window of the array begins with as in {"tabs":, a shard is
+  # only trusted if it decodes as whole windows, and if numbered as
+  # one window per marker, the last window of each array is scanned
+  # a guess stops before the next array key so as not to run past the
+  # end of its array
+
+  ARRAYS = {
+        'windows': False,
+        '_closedWindows': True}
+
+  def __init__(self, jsondecoder, chunksize):
+    self.jsondecoder = jsondecoder
+    self.chunksize = chunksize
+
+  @staticmethod
+  def getmarker(data, pos):
+    import re
+    match = re.compile(br'\{[ \t\n\r]*"[^"\\]*"[ \t\n\r]*:').match(data, pos)
+    if match is None:
+      return None
+    return match.group()
+
+  @staticmethod
+  def findkeys(data, pos, keys):
+    limit = len(data)
+    for key in keys:
+      found = data.find(b'"' + key.encode('ascii') + b'"', pos, limit)
+      if found != -1:
+        limit = found
+    return limit
+
+  @staticmethod
+  def findlast(boundary, data, pos, limit):
+    match = None
+    for match in boundary.finditer(data, pos, limit):
+      pass
+    return match
+
+  def sliceshards(self, data, start, closed, shardsize, limit, numbered):
+    # the guessed shards from start on, the start and number of the
+    # rest of the array which is left to scan
+    #pylint: disable=too-many-arguments
+    import re
+    shards = []
+    number = 1
+    count = None
+    marker = self.getmarker(data, start)
+    if marker is None:
+      return shards, start, number
+    boundary = re.compile(br',[ \t\n\r]*' + re.escape(marker))
+    while True:
+      match = boundary.search(data, start + shardsize, limit)
+      if match is None:
+        match = self.findlast(boundary, data, start + 1, limit)
+        if match is None:
+          return shards, start, number
+      shard = data[start:match.start()]
+      if numbered:
+        count = shard.count(marker)
+      shards.append((closed, number, count, shard))
+      if numbered:
+        number += count
+      start = match.end() - len(marker)
+
+  @staticmethod
+  def scanrest(scanner):
+    # the end and count of the windows from pos to the end of the array
+    count = 0
+    while True:
+      scanner.skipvalue()
+      end = scanner.pos
+      count += 1
+      if not scanner.separator(']'):
+        return end, count
+
+  def splitarray(self, scanner, closed, shardsize, limit, numbered):
+    #pylint: disable=too-many-arguments
+    scanner.expect('[')
+    if scanner.peek() == scanner.chars[']']:
+      scanner.pos += 1
+      return []
+    shards, start, number = self.sliceshards(scanner.buf, scanner.pos,
+          closed, shardsize, limit, numbered)
+    scanner.pos = start
+    end, count = self.scanrest(scanner)
+    shards.append((closed, number, count, scanner.buf[start:end]))
+    return shards
+
+  def split(self, data, shardsize, numbered):
+    # returns selectedWindow and the shards as (closed, number, count,
+    # data), number is that of the first window in the shard, open
+    # windows first whatever the order in data
+    # closed windows are only numbered and counted if numbered
+    # raises ValueError if data cannot be split
+    scanner = JsonScanner(None, self.jsondecoder, self.chunksize, data)
+    selected = 0
+    shards = []
+    pending = set(self.ARRAYS)
+    for key in scanner.iterobject():
+      if key == 'selectedWindow':
+        selected = scanner.readvalue()
+      elif key in pending:
+        pending.discard(key)
+        closed = self.ARRAYS[key]
+        limit = self.findkeys(data, scanner.pos, pending)
+        shards.extend(self.splitarray(scanner, closed, shardsize, limit,
+              numbered or not closed))
+      elif key in self.ARRAYS:
+        raise ValueError('%s twice' % key)
+      else:
+        scanner.skipvalue()
+    scanner.skipwhitespace()
+    if scanner.pos != len(data):
+      raise ValueError('extra data at offset %d' % scanner.pos)
+    shards.sort(key=lambda shard: shard[0])
+    return selected, shards
+
+class ShardSessionStoreProducer(object):
+  # a session store of the windows of one shard alone, raises
+  # ValueError unless the shard is whole windows, count of them if
+  # counted
+
+  def __init__(self, jsondecoder, shard):
+    self.jsondecoder = jsondecoder
+    self.shard = shard
+
+  def produce(self):
+    closed, number, count, data, selected = self.shard
+    windows = self.jsondecoder.decode('[' + decodetext(data, 'strict') + ']')
+    if count is not None and len(windows) != count:
+      raise ValueError('%d windows instead of %d' % (len(windows), count))
+    if closed:
+      return {'windows': [], 'selectedWindow': 0, '_closedWindows': windows}
+    return {
+          'windows': windows,
+          'selectedWindow': selected - number + 1,
+          '_closedWindows': []}
+
+class ShardSessionStoreParser(SessionStoreParser):
+  # the producers count windows from the first window of the shard
+
+  def __init__(self,
+        sessionstoreproducer, urlproducer, urlfilter, urlconsumer, number):
+    #pylint: disable=too-many-arguments
+    SessionStoreParser.__init__(self,
+          sessionstoreproducer, urlproducer, urlfilter, urlconsumer)
+    self.number = number
+
+  @staticmethod
+  def renumber(urls, offset):
+    for url in urls:
+      url.windownumber += offset
+      yield url
+
+  def parse(self):
+    sessionstore = self.sessionstoreproducer.produce()
+    urls = self.urlproducer.produce(sessionstore, self.urlfilter)
+    if self.urlconsumer.fields and self.number != 1:
+      urls = self.renumber(urls, self.number - 1)
+    filteredurls = self.urlfilter.filter(urls)
+    self.urlconsumer.consume(filteredurls)
+
+class ShardWorker(BatchWorker):
+  # walks one shard at a time into a buffer, the output and keys are
+  # None if the shard failed, the whole file is then parsed again as
+  # usual
+
+  def __init__(self,
+        sspf_factory, openfunc, parsedargv, jsondecoder, keyed=False):
+    #pylint: disable=too-many-arguments
+    BatchWorker.__init__(self, sspf_factory, openfunc, parsedargv, keyed)
+    self.jsondecoder = jsondecoder
+
+  def tryparseshard(self, shard):
+    factory = self.sessionstoreparserfactory
+    urlfilter = factory.urlfilterfactory.make(self.parsedargv)
+    keys = None
+    if self.keyed:
+      keys = []
+      urlfilter = KeyedUrlFilter(urlfilter, keys)
+    urlconsumer = factory.urlconsumerfactory.make(self.parsedargv)
+    urlproducer = factory.urlproducerfactory.make(
+          self.parsedargv, urlconsumer.fields)
+    sessionstoreproducer = ShardSessionStoreProducer(self.jsondecoder, shard)
+    shardparser = ShardSessionStoreParser(sessionstoreproducer,
+          urlproducer, urlfilter, urlconsumer, shard[1])
+    shardparser.parse()
+    self.stream.flush()
+    return self.stream.buffer.getvalue(), keys
+
+  def parseshard(self, shard):
+    # the errors the whole file would fail with as well, anything else
+    # is a bug and propagates
+    self.clear()
+    try:
+      return self.tryparseshard(shard)
+    except (ValueError, IOError, OSError):
+      return None
+
+def runshardworker(shard):
+  return BATCHWORKERS['worker'].parseshard(shard)
+
+class ShardedSessionStoreParser(object):
+  # walks the windows of one session store in jobs worker processes,
+  # the outputs are written in the order of the windows once all
+  # shards are whole windows, otherwise sessionstoreparser parses the
+  # file as without --window-jobs and reports what is wrong with it
+  #pylint: disable=too-many-instance-attributes
+
+  def __init__(self,
+        sessionstoreparser, sharder, worker, jobs, minshardsize, poolfunc,
+        stdout, urlset=None):
+    #pylint: disable=too-many-arguments
+    self.sessionstoreparser = sessionstoreparser
+    self.sharder = sharder
+    self.worker = worker
+    self.jobs = jobs
+    self.minshardsize = minshardsize
+    self.poolfunc = poolfunc
+    self.stdout = stdout
+    self.urlset = urlset
+
+  def readshards(self):
+    sessionstoreproducer = self.sessionstoreparser.sessionstoreproducer
+    jsonreader = sessionstoreproducer.jsonreader
+    with jsonreader.openfile(sessionstoreproducer.filename) as fileob:
+      mapping = mapfile(fileob)
+      data = fileob.read() if mapping is None else mapping
+      try:
+        shardsize = max(self.minshardsize, len(data) // (self.jobs * 4))
+        selected, shards = self.sharder.split(data, shardsize,
+              bool(self.sessionstoreparser.urlconsumer.fields))
+      finally:
+        if mapping is not None:
+          mapping.close()
+    return [shard + (selected,) for shard in shards]
+
+  def runshards(self, shards):
+    if self.jobs == 1:
+      return [self.worker.parseshard(shard) for shard in shards]
+    pool = self.poolfunc(self.jobs, initbatchworker, (self.worker,))
+    try:
+      outputs = pool.map(runshardworker, shards, 1)
+      pool.close()
+    finally:
+      pool.terminate()
+      pool.join()
+    return outputs
+
+  def tryparse(self):
+    try:
+      shards = self.readshards()
+    except ValueError:
+      return False
+    results = self.runshards(shards)
+    if None in results:
+      return False
+    outputs = [output for output, dummy_keys in results]
+    if self.urlset is not None:
+      # nothing is written before all shards are made unique
+      try:
+        outputs = [uniquelines(self.urlset, output, keys)
+              for output, keys in results]
+      except ValueError:
+        return False
+    for output in outputs:
+      writeoutput(self.stdout, output)
+    return True
+
+  def parse(self):
+    try:
+      if self.tryparse():
+        return
+    except IOError as err:
+      if err.errno != errno.EPIPE:
+        raise
+      silencebrokenpipe(self.stdout)
+      return
+    self.sessionstoreparser.parse()
+
+class ShardedSessionStoreParserFactory(object):
+  # makes a ShardedSessionStoreParser for --window-jobs, otherwise
+  # hands over to sessionstoreparserfactory
+  #pylint: disable=too-many-instance-attributes
+
+  def __init__(self,
+        sessionstoreparserfactory, sspf_factory, openfunc, stdout,
+        shardedparserclass, workerclass, sharderclass, sharderparams,
+        minshardsize, poolfunc, writers, urlsetfactoryclass,
+        urlsetfactoryparams):
+    #pylint: disable=too-many-arguments
+    self.sessionstoreparserfactory = sessionstoreparserfactory
+    self.sspf_factory = sspf_factory
+    self.openfunc = openfunc
+    self.stdout = stdout
+    self.shardedparserclass = shardedparserclass
+    self.workerclass = workerclass
+    self.sharderclass = sharderclass
+    self.sharderparams = sharderparams
+    self.minshardsize = minshardsize
+    self.poolfunc = poolfunc
+    self.writers = writers
+    self.urlsetfactory = urlsetfactoryclass(**urlsetfactoryparams)
 
   @staticmethod
   def getinitparams():
+    import json
     initparams = {
-          'urlconsumerclass': UrlWriter}
+          'shardedparserclass': ShardedSessionStoreParser,
+          'workerclass': ShardWorker,
+          'sharderclass': WindowSharder,
+          'sharderparams': {
+            'jsondecoder': json.JSONDecoder(),
+            'chunksize': 1 << 20},
+          'minshardsize': 1 << 20,
+          'poolfunc': makepool,
+          'writers': ['plain', 'batched'],
+          'urlsetfactoryclass': UrlSetFactory,
+          'urlsetfactoryparams': UrlSetFactory.getinitparams()}
     return initparams
 
+  @staticmethod
+  def getjobs(parsedargv):
+    jobs = parsedargv['windowjobs']
+    try:
+      jobscount = int(jobs)
+    except ValueError:
+      jobscount = 0
+    if jobscount < 1:
+      raise ArgvError('illegal value for "window-jobs": "%s"' % jobs)
+    return jobscount
+
+  def checkoptions(self, parsedargv):
+    for name in ['morefilenames', 'filesfrom', 'jobs', 'order']:
+      if name in parsedargv:
+        raise ArgvError('--window-jobs takes exactly one filename')
+    for name, option in [('reader', 'reader'), ('summary', 'summary'),
+          ('cache', 'cache'), ('watch', 'watch'), ('query', 'query'),
+          ('stats', 'stats'), ('tracememory', 'trace-memory'),
+          ('gzip', 'gzip')]:
+      if name in parsedargv:
+        raise ArgvError('--window-jobs takes no --%s' % option)
+    writer = parsedargv.get('writer', self.writers[0])
+    if writer not in self.writers:
+      raise ArgvError('--window-jobs takes no --writer=%s' % writer)
+
   def make(self, parsedargv):
-    #pylint: disable=unused-argument
-    urlconsumer = self.urlconsumerclass(self.stream)
-    return urlconsumer
+    if 'windowjobs' not in parsedargv:
+      return self.sessionstoreparserfactory.make(parsedargv)
+    self.checkoptions(parsedargv)
+    jobs = self.getjobs(parsedargv)
+    sessionstoreparser = self.sessionstoreparserfactory.make(parsedargv)
+    urlset = self.urlsetfactory.make(parsedargv)
+    workerargv = parsedargv
+    if urlset is not None and jobs == 1:
+      # the urls are made unique here anyway
+      workerargv = dict(parsedargv)
+      del workerargv['unique']
+    worker = self.workerclass(self.sspf_factory, self.openfunc, workerargv,
+          self.sharderparams['jsondecoder'], urlset is not None)
+    sharder = self.sharderclass(**self.sharderparams)
+    shardedparser = self.shardedparserclass(sessionstoreparser, sharder,
+          worker, jobs, self.minshardsize, self.poolfunc, self.stdout, urlset)
+    return shardedparser
 
-class SessionStoreParser(object):
-  def __init__(self,
-        sessionstoreproducer, urlproducer, urlfilter, urlconsumer):
-    self.sessionstoreproducer = sessionstoreproducer
+class UrlIndex(object):
+  # the places of each url, one int or a list of them if there are
+  # more, and the urls in the order first seen so that the output
+  # follows the session stores on python 2 too
+
+  def __init__(self):
+    self.places = {}
+    self.keys = []
+
+  def add(self, key, place):
+    known = self.places.get(key)
+    if known is None:
+      self.places[key] = place
+      self.keys.append(key)
+    elif isinstance(known, list):
+      known.append(place)
+    else:
+      self.places[key] = [known, place]
+
+  def get(self, key):
+    places = self.places.get(key)
+    if places is None:
+      return []
+    if isinstance(places, list):
+      return places
+    return [places]
+
+  def __contains__(self, key):
+    return key in self.places
+
+class DigestUrlIndex(object):
+  # the places of each url by the 64 bit hash of the url in an open
+  # addressing table at most half full, one slot per place, so 32 to
+  # 64 bytes per place and 8 per url instead of about 200 for the url
+  # and its entry in a UrlIndex
+  # the places of a hash stay in the order added, a probe sequence never
+  # runs over a free slot and a resize starts at one
+  # 0 marks free slots
+
+  def __init__(self):
+    import array
+    typecode = getdigesttypecode()
+    self.digests = array.array(typecode, [0]) * 1024
+    self.places = array.array(typecode, [0]) * 1024
+    self.keys = array.array(typecode)
+    self.count = 0
+
+  def resize(self):
+    import array
+    olddigests = self.digests
+    oldplaces = self.places
+    size = len(olddigests)
+    self.digests = array.array(olddigests.typecode, [0]) * (size * 2)
+    self.places = array.array(oldplaces.typecode, [0]) * (size * 2)
+    start = olddigests.index(0)
+    for oldindex in itertools.chain(range(start, size), range(start)):
+      digest = olddigests[oldindex]
+      if digest != 0:
+        self.insert(digest, oldplaces[oldindex])
+
+  def insert(self, digest, place):
+    # true if digest was not added before
+    digests = self.digests
+    mask = len(digests) - 1
+    index = digest & mask
+    new = True
+    while True:
+      value = digests[index]
+      if value == 0:
+        break
+      if value == digest:
+        new = False
+      index = (index + 1) & mask
+    digests[index] = digest
+    self.places[index] = place
+    return new
+
+  def add(self, key, place):
+    if self.insert(key, place):
+      self.keys.append(key)
+    self.count += 1
+    if self.count * 2 > len(self.digests):
+      self.resize()
+
+  def get(self, key):
+    digests = self.digests
+    mask = len(digests) - 1
+    index = key & mask
+    places = []
+    while True:
+      value = digests[index]
+      if value == 0:
+        return places
+      if value == key:
+        places.append(self.places[index])
+      index = (index + 1) & mask
+
+  def __contains__(self, key):
+    return len(self.get(key)) != 0
+
+class UrlDiffer(object):
+  # pairs the places of each url in two session stores, a place is
+  # window number, tab number and state packed into one int
+  # equal places are unchanged, the others are paired as moved (>) if
+  # the state is the same and as changed (~) if not, the rest are
+  # added (+) or removed (-)
+  # indexclass keeps the places by the key of each url
+
+  FIELDS = frozenset(['windownumber', 'tabnumber'])
+
+  # a window number takes at most 23 bits so places fit in 64
+  TABSHIFT = 9
+  WINDOWSHIFT = 41
+
+  def __init__(self, indexclass):
+    self.indexclass = indexclass
+
+  def getkey(self, url):
+    #pylint: disable=no-self-use
+    return url
+
+  def makeplace(self, url):
+    return ((url.windownumber << self.WINDOWSHIFT) |
+          (url.tabnumber << self.TABSHIFT) | url.state)
+
+  def makerecord(self, url, place):
+    record = DetailedUrlRecord(url, place & ((1 << self.TABSHIFT) - 1))
+    record.windownumber = place >> self.WINDOWSHIFT
+    record.tabnumber = (
+          (place & ((1 << self.WINDOWSHIFT) - 1)) >> self.TABSHIFT)
+    return record
+
+  def index(self, urls):
+    getkey = self.getkey
+    makeplace = self.makeplace
+    urlindex = self.indexclass()
+    add = urlindex.add
+    for url in urls:
+      add(getkey(url.url), makeplace(url))
+    return urlindex
+
+  @staticmethod
+  def takecounted(places, counts):
+    # the places still in counts, in their order
+    taken = []
+    for place in places:
+      if counts.get(place):
+        counts[place] -= 1
+        taken.append(place)
+    return taken
+
+  def unmatched(self, oldplaces, newplaces):
+    # the old and new places left once equal places are paired as
+    # unchanged, of equal old places the last are left
+    counts = {}
+    for place in oldplaces:
+      counts[place] = counts.get(place, 0) + 1
+    newrest = []
+    for place in newplaces:
+      if counts.get(place):
+        counts[place] -= 1
+      else:
+        newrest.append(place)
+    oldrest = self.takecounted(reversed(oldplaces), counts)
+    oldrest.reverse()
+    return oldrest, newrest
+
+  def pairmoved(self, oldrest, newrest):
+    # > for each new place which takes the first old place left in its
+    # state, None for the others, and the counts of the old places left
+    statemask = (1 << self.TABSHIFT) - 1
+    bystate = {}
+    for place in reversed(oldrest):
+      bystate.setdefault(place & statemask, []).append(place)
+    signs = []
+    for place in newrest:
+      olds = bystate.get(place & statemask)
+      if olds:
+        olds.pop()
+        signs.append('>')
+      else:
+        signs.append(None)
+    counts = {}
+    for olds in bystate.values():
+      for place in olds:
+        counts[place] = counts.get(place, 0) + 1
+    return signs, counts
+
+  @staticmethod
+  def pairchanged(signs, newrest, oldrest):
+    # ~ for each new place left which takes the first old place left,
+    # + once there are none, and the old places left
+    oldrest = oldrest[::-1]
+    changes = []
+    for sign, place in zip(signs, newrest):
+      if sign is None:
+        if oldrest:
+          oldrest.pop()
+          sign = '~'
+        else:
+          sign = '+'
+      changes.append((sign, place))
+    oldrest.reverse()
+    return changes, oldrest
+
+  def match(self, oldplaces, newplaces):
+    # (sign, place) for the new places in their order, then for the
+    # old places left in theirs, which are removed
+    if len(oldplaces) == 1 and len(newplaces) == 1:
+      # most urls are at one place, and not there any more
+      oldplace, newplace = oldplaces[0], newplaces[0]
+      if oldplace == newplace:
+        return []
+      statemask = (1 << self.TABSHIFT) - 1
+      if oldplace & statemask == newplace & statemask:
+        return [('>', newplace)]
+      return [('~', newplace)]
+    oldrest, newrest = self.unmatched(oldplaces, newplaces)
+    signs, counts = self.pairmoved(oldrest, newrest)
+    changes, oldrest = self.pairchanged(
+          signs, newrest, self.takecounted(oldplaces, counts))
+    changes.extend(('-', place) for place in oldrest)
+    return changes
+
+  def getchanges(self, oldindex, newindex):
+    # (key, changes) for the keys in new, then for those only in old
+    for key in newindex.keys:
+      oldplaces = oldindex.get(key)
+      newplaces = newindex.get(key)
+      if oldplaces != newplaces:
+        yield key, self.match(oldplaces, newplaces)
+    for key in oldindex.keys:
+      if key not in newindex:
+        yield key, [('-', place) for place in oldindex.get(key)]
+
+  def diff(self, readold, readnew):
+    # yields (sign, record), each session store is decoded while it is
+    # indexed and then let go
+    oldindex = self.index(readold())
+    newindex = self.index(readnew())
+    for url, changes in self.getchanges(oldindex, newindex):
+      for sign, place in changes:
+        yield sign, self.makerecord(url, place)
+
+class DigestUrlDiffer(UrlDiffer):
+  # keys urls by their 64 bit hash so the indexes hold no urls, the
+  # urls of the changes are found by reading both session stores again
+  # two of n urls have the same hash with probability n ** 2 / 2 ** 65
+
+  DIGESTMASK = (1 << 64) - 1
+
+  def getkey(self, url):
+    return (hash(url) & self.DIGESTMASK) or 1
+
+  def diff(self, readold, readnew):
+    oldindex = self.index(readold())
+    newindex = self.index(readnew())
+    pending = dict(self.getchanges(oldindex, newindex))
+    del oldindex, newindex
+    # the keys left after new are those only in old
+    for readurls in [readnew, readold]:
+      if not pending:
+        break
+      for url in readurls():
+        changes = pending.pop(self.getkey(url.url), None)
+        if changes is None:
+          continue
+        for sign, place in changes:
+          yield sign, self.makerecord(url.url, place)
+
+class SessionDiffWriter(object):
+  # one line per change, the sign and the url or the urlformat of its
+  # record, at the new place but for removed urls
+
+  FIELDS = UrlDiffer.FIELDS
+
+  def __init__(self, stream, urlformat=None):
+    self.stream = stream
+    self.urlformat = urlformat
+
+  def write(self, changes):
+    if self.urlformat is None:
+      for sign, url in changes:
+        self.stream.write(sign + u' ' + url.url + u'\n')
+      return
+    formaturl = self.urlformat.format
+    for sign, url in changes:
+      self.stream.write(sign + u' ' + formaturl(url) + u'\n')
+
+class DiffSessionStoreParser(object):
+  # reports how the urls of newproducer differ from those of oldproducer
+
+  def __init__(self, oldproducer, newproducer, urlproducer, urlfilter,
+        urldiffer, diffwriter):
+    #pylint: disable=too-many-arguments
+    self.oldproducer = oldproducer
+    self.newproducer = newproducer
     self.urlproducer = urlproducer
     self.urlfilter = urlfilter
-    self.urlconsumer = urlconsumer
+    self.urldiffer = urldiffer
+    self.diffwriter = diffwriter
+
+  def readurls(self, sessionstoreproducer):
+    sessionstore = sessionstoreproducer.produce()
+    urls = self.urlproducer.produce(sessionstore, self.urlfilter)
+    return self.urlfilter.filter(urls)
+
+  def readold(self):
+    return self.readurls(self.oldproducer)
+
+  def readnew(self):
+    return self.readurls(self.newproducer)
 
   def parse(self):
-    sessionstore = self.sessionstoreproducer.produce()
-    urls = self.urlproducer.produce(sessionstore)
-    filteredurls = self.urlfilter.filter(urls)
-    self.urlconsumer.consume(filteredurls)
+    changes = self.urldiffer.diff(self.readold, self.readnew)
+    self.diffwriter.write(changes)
 
-class SessionStoreParserFactory(object):
-  def __init__(self,
-        sessionstoreproducerfactory,
-        urlproducerfactory,
-        urlfilterfactory,
-        urlconsumerfactory,
-        sessionstoreparserclass):
+class DiffSessionStoreParserFactory(object):
+  # makes a DiffSessionStoreParser for --diff from the first filename to
+  # the second, otherwise hands over to sessionstoreparserfactory
+  # baseparserfactory is the SessionStoreParserFactory with the
+  # factories of the parts
+
+  def __init__(self, sessionstoreparserfactory, baseparserfactory,
+        diffparserclass, urldiffers, rereading):
     #pylint: disable=too-many-arguments
-    self.sessionstoreproducerfactory = sessionstoreproducerfactory
-    self.urlproducerfactory = urlproducerfactory
-    self.urlfilterfactory = urlfilterfactory
-    self.urlconsumerfactory = urlconsumerfactory
-    self.sessionstoreparserclass = sessionstoreparserclass
+    self.sessionstoreparserfactory = sessionstoreparserfactory
+    self.baseparserfactory = baseparserfactory
+    self.diffparserclass = diffparserclass
+    self.urldiffers = urldiffers
+    self.rereading = rereading
 
   @staticmethod
   def getinitparams():
     initparams = {
-          'sessionstoreparserclass': SessionStoreParser}
+          'diffparserclass': DiffSessionStoreParser,
+          'urldiffers': {
+            'urls': (UrlDiffer, {
+              'indexclass': UrlIndex}),
+            'digests': (DigestUrlDiffer, {
+              'indexclass': DigestUrlIndex})},
+          'rereading': ['digests']}
     return initparams
 
+  @staticmethod
+  def checkoptions(parsedargv):
+    for name in ['filesfrom', 'jobs', 'order']:
+      if name in parsedargv:
+        raise ArgvError('--diff takes exactly two filenames')
+    if len(parsedargv.get('morefilenames', [])) != 1:
+      raise ArgvError('--diff takes exactly two filenames')
+    for name, option in [('writer', 'writer'), ('unique', 'unique'),
+          ('windowjobs', 'window-jobs'), ('summary', 'summary'),
+          ('cache', 'cache'), ('query', 'query'), ('stats', 'stats'),
+          ('tracememory', 'trace-memory'), ('gzip', 'gzip')]:
+      if name in parsedargv:
+        raise ArgvError('--diff takes no --%s' % option)
+
   def make(self, parsedargv):
-    sessionstoreproducer = self.sessionstoreproducerfactory.make(parsedargv)
-    urlproducer = self.urlproducerfactory.make(parsedargv)
-    urlfilter = self.urlfilterfactory.make(parsedargv)
-    urlconsumer = self.urlconsumerfactory.make(parsedargv)
-    sessionstoreparser = self.sessionstoreparserclass(
-          sessionstoreproducer, urlproducer, urlfilter, urlconsumer)
-    return sessionstoreparser
+    if 'diff' not in parsedargv:
+      return self.sessionstoreparserfactory.make(parsedargv)
+    self.checkoptions(parsedargv)
+    keys = parsedargv['diff']
+    try:
+      urldifferclass, urldifferparams = self.urldiffers[keys]
+    except KeyError:
+      raise ArgvError('illegal value for "diff": "%s"' % keys)
+    filenames = [parsedargv['filename']] + parsedargv['morefilenames']
+    if keys in self.rereading and '-' in filenames:
+      raise ArgvError('--diff=%s cannot read from stdin' % keys)
+    factory = self.baseparserfactory
+    oldproducer = factory.sessionstoreproducerfactory.make(parsedargv)
+    newproducer = factory.sessionstoreproducerfactory.make(
+          dict(parsedargv, filename=parsedargv['morefilenames'][0]))
+    urlfilter = factory.urlfilterfactory.make(parsedargv)
+    diffwriter = factory.urlconsumerfactory.makediffwriter(parsedargv)
+    urlproducer = factory.urlproducerfactory.make(
+          parsedargv, urldifferclass.FIELDS)
+    diffparser = self.diffparserclass(oldproducer, newproducer,
+          urlproducer, urlfilter, urldifferclass(**urldifferparams),
+          diffwriter)
+    return diffparser
+
+class WatchSessionStoreParser(object):
+  # parses again when size, mtime or inode of the file changed
+  # and then stayed the same for one interval
+  # so a file still being written is not read
+  # between checks it only sleeps
+
+  def __init__(self, sessionstoreparser, filename, interval,
+        statfunc, sleepfunc, stderr):
+    #pylint: disable=too-many-arguments
+    self.sessionstoreparser = sessionstoreparser
+    self.filename = filename
+    self.interval = interval
+    self.statfunc = statfunc
+    self.sleepfunc = sleepfunc
+    self.stderr = stderr
+
+  def getidentity(self):
+    try:
+      stat = self.statfunc(self.filename)
+    except OSError:
+      return None
+    return stat.st_ino, stat.st_size, stat.st_mtime
+
+  def parseonce(self):
+    try:
+      self.sessionstoreparser.parse()
+    except Error as err:
+      self.stderr.write(str(err) + '\n')
+
+  def watch(self):
+    previous = None
+    parsed = None
+    while True:
+      identity = self.getidentity()
+      if identity is not None and identity == previous and identity != parsed:
+        self.parseonce()
+        parsed = identity
+      previous = identity
+      self.sleepfunc(self.interval)
+
+  def parse(self):
+    try:
+      self.watch()
+    except KeyboardInterrupt:
+      pass
+
+class WatchSessionStoreParserFactory(object):
+  # makes a WatchSessionStoreParser for --watch,
+  # otherwise hands over to sessionstoreparserfactory
+
+  def __init__(self, sessionstoreparserfactory, stderr,
+        watchparserclass, statfunc, sleepfunc, defaultinterval):
+    #pylint: disable=too-many-arguments
+    self.sessionstoreparserfactory = sessionstoreparserfactory
+    self.stderr = stderr
+    self.watchparserclass = watchparserclass
+    self.statfunc = statfunc
+    self.sleepfunc = sleepfunc
+    self.defaultinterval = defaultinterval
+
+  @staticmethod
+  def getinitparams():
+    initparams = {
+          'watchparserclass': WatchSessionStoreParser,
+          'statfunc': os.stat,
+          'sleepfunc': time.sleep,
+          'defaultinterval': '1'}
+    return initparams
+
+  def getinterval(self, parsedargv):
+    interval = parsedargv.get('interval', self.defaultinterval)
+    try:
+      seconds = float(interval)
+    except ValueError:
+      seconds = 0
+    if not seconds > 0:
+      raise ArgvError('illegal value for "interval": "%s"' % interval)
+    return seconds
+
+  def make(self, parsedargv):
+    if 'watch' not in parsedargv:
+      return self.sessionstoreparserfactory.make(parsedargv)
+    for name in ['morefilenames', 'filesfrom', 'jobs', 'order']:
+      if name in parsedargv:
+        raise ArgvError('--watch takes exactly one filename')
+    if parsedargv.get('filename') == '-':
+      raise ArgvError('--watch cannot read from stdin')
+    interval = self.getinterval(parsedargv)
+    sessionstoreparser = self.sessionstoreparserfactory.make(parsedargv)
+    watchparser = self.watchparserclass(
+          sessionstoreparser, parsedargv['filename'], interval,
+          self.statfunc, self.sleepfunc, self.stderr)
+    return watchparser
 
 class SessionStoreParserFactoryFactory(object):
   #pylint: disable=too-many-instance-attributes
@@ -423,6 +4858,10 @@ class SessionStoreParserFactoryFactory(object):
         urlfilterfactoryparams,
         urlconsumerfactoryclass,
         urlconsumerfactoryparams,
+        urlcachefactoryclass,
+        urlcachefactoryparams,
+        pipelinestatsfactoryclass,
+        pipelinestatsfactoryparams,
         sessionstoreparserfactoryclass,
         sessionstoreparserfactoryparams):
     #pylint: disable=too-many-arguments
@@ -435,6 +4874,10 @@ class SessionStoreParserFactoryFactory(object):
     self.urlfilterfactoryparams = urlfilterfactoryparams
     self.urlconsumerfactoryclass = urlconsumerfactoryclass
     self.urlconsumerfactoryparams = urlconsumerfactoryparams
+    self.urlcachefactoryclass = urlcachefactoryclass
+    self.urlcachefactoryparams = urlcachefactoryparams
+    self.pipelinestatsfactoryclass = pipelinestatsfactoryclass
+    self.pipelinestatsfactoryparams = pipelinestatsfactoryparams
     self.sessionstoreparserfactoryclass = sessionstoreparserfactoryclass
     self.sessionstoreparserfactoryparams = sessionstoreparserfactoryparams
 
@@ -453,14 +4896,21 @@ class SessionStoreParserFactoryFactory(object):
           'urlconsumerfactoryclass': UrlConsumerFactory,
           'urlconsumerfactoryparams':
                 UrlConsumerFactory.getinitparams(),
+          'urlcachefactoryclass': UrlCacheFactory,
+          'urlcachefactoryparams':
+                UrlCacheFactory.getinitparams(),
+          'pipelinestatsfactoryclass': PipelineStatsFactory,
+          'pipelinestatsfactoryparams':
+                PipelineStatsFactory.getinitparams(),
           'sessionstoreparserfactoryclass': SessionStoreParserFactory,
           'sessionstoreparserfactoryparams':
                 SessionStoreParserFactory.getinitparams()}
     return initparams
 
-  def make(self, stdout, openfunc):
+  def make(self, stdout, openfunc, stderr):
     sessionstoreproducerfactory = self.sessionstoreproducerfactoryclass(
           openfunc=openfunc,
+          stderr=stderr,
           **self.sessionstoreproducerfactoryparams)
     urlproducerfactory = self.urlproducerfactoryclass(
           **self.urlproducerfactoryparams)
@@ -469,11 +4919,19 @@ class SessionStoreParserFactoryFactory(object):
     urlconsumerfactory = self.urlconsumerfactoryclass(
           stream=stdout,
           **self.urlconsumerfactoryparams)
+    urlcachefactory = self.urlcachefactoryclass(
+          openfunc=openfunc,
+          **self.urlcachefactoryparams)
+    pipelinestatsfactory = self.pipelinestatsfactoryclass(
+          stderr=stderr,
+          **self.pipelinestatsfactoryparams)
     sessionstoreparserfactory = self.sessionstoreparserfactoryclass(
           sessionstoreproducerfactory=sessionstoreproducerfactory,
           urlproducerfactory=urlproducerfactory,
           urlfilterfactory=urlfilterfactory,
           urlconsumerfactory=urlconsumerfactory,
+          urlcachefactory=urlcachefactory,
+          pipelinestatsfactory=pipelinestatsfactory,
           **self.sessionstoreparserfactoryparams)
     return sessionstoreparserfactory
 
@@ -513,18 +4971,136 @@ class Application(object):
       exitstatus = 1
     return exitstatus
 
+class LazySessionStoreParserFactory(object):
+  # builds the factories behind it on the first make, --version and
+  # --help never need them
+
+  def __init__(self, buildfunc, buildargs):
+    self.buildfunc = buildfunc
+    self.buildargs = buildargs
+    self.sessionstoreparserfactory = None
+
+  def make(self, parsedargv):
+    if self.sessionstoreparserfactory is None:
+      self.sessionstoreparserfactory = self.buildfunc(*self.buildargs)
+    return self.sessionstoreparserfactory.make(parsedargv)
+
+class ParserFactoryBuilder(object):
+  # wires the chain of session store parser factories, params of None
+  # are the getinitparams of their class, got when the first parse
+  # needs them
+  #pylint: disable=too-many-instance-attributes
+
+  def __init__(self,
+        sessionstoreparserfactoryfactoryclass,
+        sessionstoreparserfactoryfactoryparams,
+        batchparserfactoryclass,
+        batchparserfactoryparams,
+        shardedparserfactoryclass,
+        shardedparserfactoryparams,
+        diffparserfactoryclass,
+        diffparserfactoryparams,
+        watchparserfactoryclass,
+        watchparserfactoryparams,
+        profilingparserfactoryclass,
+        profilingparserfactoryparams):
+    #pylint: disable=too-many-arguments
+    self.sspf_factoryclass = sessionstoreparserfactoryfactoryclass
+    self.sspf_factoryparams = sessionstoreparserfactoryfactoryparams
+    self.batchparserfactoryclass = batchparserfactoryclass
+    self.batchparserfactoryparams = batchparserfactoryparams
+    self.shardedparserfactoryclass = shardedparserfactoryclass
+    self.shardedparserfactoryparams = shardedparserfactoryparams
+    self.diffparserfactoryclass = diffparserfactoryclass
+    self.diffparserfactoryparams = diffparserfactoryparams
+    self.watchparserfactoryclass = watchparserfactoryclass
+    self.watchparserfactoryparams = watchparserfactoryparams
+    self.profilingparserfactoryclass = profilingparserfactoryclass
+    self.profilingparserfactoryparams = profilingparserfactoryparams
+
+  @staticmethod
+  def getinitparams():
+    initparams = {
+          'sessionstoreparserfactoryfactoryclass':
+                SessionStoreParserFactoryFactory,
+          'sessionstoreparserfactoryfactoryparams': None,
+          'batchparserfactoryclass': BatchSessionStoreParserFactory,
+          'batchparserfactoryparams': None,
+          'shardedparserfactoryclass': ShardedSessionStoreParserFactory,
+          'shardedparserfactoryparams': None,
+          'diffparserfactoryclass': DiffSessionStoreParserFactory,
+          'diffparserfactoryparams': None,
+          'watchparserfactoryclass': WatchSessionStoreParserFactory,
+          'watchparserfactoryparams': None,
+          'profilingparserfactoryclass': ProfilingSessionStoreParserFactory,
+          'profilingparserfactoryparams': None}
+    return initparams
+
+  @staticmethod
+  def getparams(factoryclass, params):
+    if params is None:
+      return factoryclass.getinitparams()
+    return params
+
+  def make(self, stdout, stderr, openfunc, stdin):
+    sspf_factory = self.sspf_factoryclass(**self.getparams(
+          self.sspf_factoryclass, self.sspf_factoryparams))
+    sessionstoreparserfactory = sspf_factory.make(stdout, openfunc, stderr)
+    shardedparserfactory = self.shardedparserfactoryclass(
+          sessionstoreparserfactory=sessionstoreparserfactory,
+          sspf_factory=sspf_factory,
+          openfunc=openfunc,
+          stdout=stdout,
+          **self.getparams(
+            self.shardedparserfactoryclass, self.shardedparserfactoryparams))
+    batchparserfactory = self.batchparserfactoryclass(
+          sessionstoreparserfactory=shardedparserfactory,
+          sspf_factory=sspf_factory,
+          openfunc=openfunc,
+          stdout=stdout,
+          stderr=stderr,
+          stdin=stdin,
+          **self.getparams(
+            self.batchparserfactoryclass, self.batchparserfactoryparams))
+    diffparserfactory = self.diffparserfactoryclass(
+          sessionstoreparserfactory=batchparserfactory,
+          baseparserfactory=sessionstoreparserfactory,
+          **self.getparams(
+            self.diffparserfactoryclass, self.diffparserfactoryparams))
+    watchparserfactory = self.watchparserfactoryclass(
+          sessionstoreparserfactory=diffparserfactory,
+          stderr=stderr,
+          **self.getparams(
+            self.watchparserfactoryclass, self.watchparserfactoryparams))
+    profilingparserfactory = self.profilingparserfactoryclass(
+          sessionstoreparserfactory=watchparserfactory,
+          **self.getparams(
+            self.profilingparserfactoryclass,
+            self.profilingparserfactoryparams))
+    return profilingparserfactory
+
 class ApplicationFactory(object):
+  # the parser factories are built by the lazy factory on the first
+  # parse, params of None for the builder are its getinitparams
+  #pylint: disable=too-many-instance-attributes
+
   def __init__(self,
         argvparserclass,
         argvparserparams,
-        sessionstoreparserfactoryfactoryclass,
-        sessionstoreparserfactoryfactoryparams,
+        parserfactorybuilderclass,
+        parserfactorybuilderparams,
+        lazyparserfactoryclass,
+        stdinopenerclass,
+        stdinopenerparams,
         applicationclass):
     #pylint: disable=too-many-arguments
     self.argvparserclass = argvparserclass
     self.argvparserparams = argvparserparams
-    self.sspf_factoryclass = sessionstoreparserfactoryfactoryclass
-    self.sspf_factoryparams = sessionstoreparserfactoryfactoryparams
+    self.builderclass = parserfactorybuilderclass
+    self.builderparams = parserfactorybuilderparams
+    self.lazyparserfactoryclass = lazyparserfactoryclass
+    self.stdinopenerclass = stdinopenerclass
+    self.stdinopenerparams = stdinopenerparams
     self.applicationclass = applicationclass
 
   @staticmethod
@@ -537,38 +5113,202 @@ class ApplicationFactory(object):
           ('closed', ['--closed'], 0),
           ('window', ['--window'], 1),
           ('tab', ['--tab'], 1),
-          ('entry', ['--url'], 1)]
+          ('entry', ['--url'], 1),
+          ('reader', ['--reader'], 1),
+          ('producer', ['--producer'], 1),
+          ('frames', ['--frames'], 0),
+          ('writer', ['--writer'], 1),
+          ('gzip', ['--gzip'], 0),
+          ('filesfrom', ['--files-from'], 1),
+          ('jobs', ['--jobs'], 1),
+          ('windowjobs', ['--window-jobs'], 1),
+          ('order', ['--order'], 1),
+          ('watch', ['--watch'], 0),
+          ('interval', ['--interval'], 1),
+          ('cache', ['--cache'], 1),
+          ('cachesize', ['--cache-size'], 1),
+          ('database', ['--database'], 1),
+          ('query', ['--query'], 0),
+          ('unique', ['--unique'], 1),
+          ('uniquememory', ['--unique-memory'], 1),
+          ('uniqueerror', ['--unique-error'], 1),
+          ('summary', ['--summary'], 0),
+          ('diff', ['--diff'], 1),
+          ('stats', ['--stats'], 0),
+          ('tracememory', ['--trace-memory'], 0),
+          ('profile', ['--profile'], 1),
+          ('format', ['--format'], 1)]
     argumentsdata = [
           'filename']
     argvparserparams = {
           'optionsdata': optionsdata,
-          'argumentsdata': argumentsdata}
+          'argumentsdata': argumentsdata,
+          'restargumentsname': 'morefilenames'}
     initparams = {
           'argvparserclass': ArgvParser,
           'argvparserparams': argvparserparams,
-          'sessionstoreparserfactoryfactoryclass':
-                SessionStoreParserFactoryFactory,
-          'sessionstoreparserfactoryfactoryparams':
-                SessionStoreParserFactoryFactory.getinitparams(),
+          'parserfactorybuilderclass': ParserFactoryBuilder,
+          'parserfactorybuilderparams': None,
+          'lazyparserfactoryclass': LazySessionStoreParserFactory,
+          'stdinopenerclass': StdinOpener,
+          'stdinopenerparams': {
+            'chunksize': 1 << 20},
           'applicationclass': Application}
     return initparams
 
-  def make(self, stdout, stderr, openfunc):
+  def make(self, stdout, stderr, openfunc, stdin=None):
+    openfunc = self.stdinopenerclass(
+          openfunc, stdin, **self.stdinopenerparams)
     argvparser = self.argvparserclass(**self.argvparserparams)
-    sspf_factory = self.sspf_factoryclass(**self.sspf_factoryparams)
-    sessionstoreparserfactory = sspf_factory.make(stdout, openfunc)
+    builderparams = self.builderparams
+    if builderparams is None:
+      builderparams = self.builderclass.getinitparams()
+    builder = self.builderclass(**builderparams)
+    parserfactory = self.lazyparserfactoryclass(
+          builder.make, (stdout, stderr, openfunc, stdin))
     application = self.applicationclass(
-          argvparser, sessionstoreparserfactory, stdout, stderr)
+          argvparser, parserfactory, stdout, stderr)
     return application
 
-def secludedmain(argv, stdout, stderr, openfunc):
+class UrlExtractor(object):
+  # library interface, made once with the options of the command line
+  # as parsedargv, iterurls gives the url records of one session store
+  # per call without building factories, argv or output streams
+  # the reader, producer and filter it shares between calls hold no
+  # state and --unique gets a new url set per call, so one extractor
+  # can be used from several threads at once
+
+  def __init__(self, jsonreader, urlproducer, urlfilter, uniquefilterclass,
+        urlsetfactory, parsedargv):
+    #pylint: disable=too-many-arguments
+    self.jsonreader = jsonreader
+    self.urlproducer = urlproducer
+    self.urlfilter = urlfilter
+    self.uniquefilterclass = uniquefilterclass
+    self.urlsetfactory = urlsetfactory
+    self.parsedargv = parsedargv
+
+  def makefilter(self):
+    urlset = self.urlsetfactory.make(self.parsedargv)
+    if urlset is None:
+      return self.urlfilter
+    return self.uniquefilterclass(self.urlfilter, urlset)
+
+  def iterurls(self, source, name='data'):
+    # source is a filename or the content of a session store as bytes,
+    # bytearray or memoryview, python 2 takes str as filename
+    # name is used for content in error messages
+    if isdata(source):
+      source = DataSource(source, name)
+    sessionstore = self.jsonreader.read(source)
+    urlfilter = self.makefilter()
+    urls = self.urlproducer.produce(sessionstore, urlfilter)
+    return urlfilter.filter(urls)
+
+class UrlExtractorFactory(object):
+  # the options of the command line which make sense without output,
+  # %-fields of --format select the fields of DetailedUrlRecord
+  #pylint: disable=too-many-instance-attributes
+
+  def __init__(self,
+        options,
+        sessionstoreproducerfactoryclass,
+        sessionstoreproducerfactoryparams,
+        urlproducerfactoryclass,
+        urlproducerfactoryparams,
+        urlfilterfactoryclass,
+        urlfilterfactoryparams,
+        urlsetfactoryclass,
+        urlsetfactoryparams,
+        uniquefilterclass,
+        urlformatclass,
+        urlextractorclass,
+        openerclass,
+        openfunc):
+    #pylint: disable=too-many-arguments
+    #pylint: disable=invalid-name
+    self.options = options
+    self.sessionstoreproducerfactoryclass = sessionstoreproducerfactoryclass
+    self.sessionstoreproducerfactoryparams = sessionstoreproducerfactoryparams
+    self.urlproducerfactoryclass = urlproducerfactoryclass
+    self.urlproducerfactoryparams = urlproducerfactoryparams
+    self.urlfilterfactoryclass = urlfilterfactoryclass
+    self.urlfilterfactoryparams = urlfilterfactoryparams
+    self.urlsetfactoryclass = urlsetfactoryclass
+    self.urlsetfactoryparams = urlsetfactoryparams
+    self.uniquefilterclass = uniquefilterclass
+    self.urlformatclass = urlformatclass
+    self.urlextractorclass = urlextractorclass
+    self.openerclass = openerclass
+    self.openfunc = openfunc
+
+  @staticmethod
+  def getinitparams():
+    initparams = {
+          'options': frozenset([
+            'all', 'selected', 'closed', 'window', 'tab', 'entry',
+            'reader', 'producer', 'frames', 'unique', 'uniquememory',
+            'uniqueerror', 'format']),
+          'sessionstoreproducerfactoryclass': SessionStoreProducerFactory,
+          'sessionstoreproducerfactoryparams':
+                SessionStoreProducerFactory.getinitparams(),
+          'urlproducerfactoryclass': UrlProducerFactory,
+          'urlproducerfactoryparams': UrlProducerFactory.getinitparams(),
+          'urlfilterfactoryclass': UrlFilterFactory,
+          'urlfilterfactoryparams': UrlFilterFactory.getinitparams(),
+          'urlsetfactoryclass': UrlSetFactory,
+          'urlsetfactoryparams': UrlSetFactory.getinitparams(),
+          'uniquefilterclass': UniqueUrlFilter,
+          'urlformatclass': UrlFormat,
+          'urlextractorclass': UrlExtractor,
+          'openerclass': DataOpener,
+          'openfunc': openbinary}
+    return initparams
+
+  def make(self, parsedargv, stderr=None):
+    for name in sorted(parsedargv):
+      if name not in self.options:
+        raise ArgvError('the url extractor takes no --%s' % name)
+    sessionstoreproducerfactory = self.sessionstoreproducerfactoryclass(
+          openfunc=self.openerclass(self.openfunc), stderr=stderr,
+          **self.sessionstoreproducerfactoryparams)
+    jsonreader = sessionstoreproducerfactory.makejsonreader(parsedargv)
+    fields = frozenset()
+    if 'format' in parsedargv:
+      fields = self.urlformatclass(parsedargv['format']).fields
+    urlproducerfactory = self.urlproducerfactoryclass(
+          **self.urlproducerfactoryparams)
+    urlproducer = urlproducerfactory.make(parsedargv, fields)
+    urlfilterfactory = self.urlfilterfactoryclass(
+          **self.urlfilterfactoryparams)
+    filterargv = dict(parsedargv)
+    filterargv.pop('unique', None)
+    urlfilter = urlfilterfactory.make(filterargv)
+    urlsetfactory = self.urlsetfactoryclass(**self.urlsetfactoryparams)
+    # option errors of --unique now and not on the first call
+    urlsetfactory.make(parsedargv)
+    urlextractor = self.urlextractorclass(jsonreader, urlproducer,
+          urlfilter, self.uniquefilterclass, urlsetfactory, parsedargv)
+    return urlextractor
+
+def makeurlextractor(parsedargv=None, stderr=None):
+  # stderr gets the warnings of --reader=salvage
+  urlextractorfactory = UrlExtractorFactory(
+        **UrlExtractorFactory.getinitparams())
+  return urlextractorfactory.make(
+        {} if parsedargv is None else parsedargv, stderr)
+
+def secludedmain(argv, stdout, stderr, openfunc, stdin=None):
   initparams = ApplicationFactory.getinitparams()
   applicationfactory = ApplicationFactory(**initparams)
-  application = applicationfactory.make(stdout, stderr, openfunc)
+  application = applicationfactory.make(stdout, stderr, openfunc, stdin)
   exitstatus = application.run(argv)
   return exitstatus
 
+def openbinary(filename):
+  return open(filename, 'rb')
+
 def main(): # pragma: no cover
-  import sys
-  exitstatus = secludedmain(sys.argv, sys.stdout, sys.stderr, open)
+  exitstatus = secludedmain(
+        sys.argv, sys.stdout, sys.stderr, openbinary, sys.stdin)
   return exitstatus
@@ -2,3 +2,27 @@
 from . import test_argvparser
 from . import test_main
 from . import test_main2
+from . import test_mozlz4
+from . import test_urlrecord
+from . import test_urlfilter
+from . import test_urlwriter
+from . import test_batch
+from . import test_watch
+from . import test_urlcache
+from . import test_sqlite
+from . import test_unique
+from . import test_summary
+from . import test_format
+from . import test_salvage
+from . import test_input
+from . import test_benchmark
+from . import test_stats
+from . import test_sessionstorewriter
+from . import test_projector
+from . import test_flatproducer
+from . import test_shards
+from . import test_diff
+from . import test_recordwriters
+from . import test_extractor
+from . import test_async
+from . import test_streamreader
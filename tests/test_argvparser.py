@@ -145,3 +145,47 @@ class TestParse(unittest.TestCase):
           'foo': 'somefoo',
           'filename': 'filename'})
     self.assertEqual(restargv, ['rest1', 'rest2'])
+
+  def test_restarguments(self):
+    optionsdata = [('foo', ['-f', '--foo'], 0)]
+    argumentsdata = ['filename']
+    argvparser = p.ArgvParser(optionsdata, argumentsdata, 'morefilenames')
+    argv = ['-f', 'file1', 'file2', '-', 'file3', '--foo', 'rest']
+    parsedargv, restargv = argvparser.parse(argv)
+    self.assertEqual(parsedargv, {
+          'foo': '',
+          'filename': 'file1',
+          'morefilenames': ['file2', '-', 'file3']})
+    self.assertEqual(restargv, ['--foo', 'rest'])
+
+class TestSplitFlags(unittest.TestCase):
+
+  optionsdata = [
+        ('help', ['-h', '--help'], 0),
+        ('foo', ['-f', '--foo'], 1),
+        ('bar', ['-b', '--bar'], 0)]
+
+  def test_flags(self):
+    argvparser = p.ArgvParser(self.optionsdata, ['filename'])
+    split = argvparser.splitflags(['--bar', '-h', 'file1', '--help'])
+    self.assertEqual(split, ({'bar': '', 'help': ''}, ['file1', '--help']))
+
+  def test_stdin(self):
+    argvparser = p.ArgvParser(self.optionsdata, ['filename'])
+    split = argvparser.splitflags(['--bar', '-'])
+    self.assertEqual(split, ({'bar': ''}, ['-']))
+
+  def test_leftforgetopt(self):
+    argvparser = p.ArgvParser(self.optionsdata, ['filename'])
+    for argv in [['--foo', 'x'], ['--foo=x'], ['--ba'], ['-hb'], ['--']]:
+      self.assertEqual(argvparser.splitflags(argv), None)
+
+  def test_sameasgetopt(self):
+    argvparser = p.ArgvParser(self.optionsdata, ['filename'])
+    for argv in [['--bar', 'file1'], ['--ba', 'file1'], ['-hb', 'file1']]:
+      optsdict, args = argvparser.splitopts(argv)
+      shortopts, longopts, optnames = argvparser.prepareoptionsdata(
+            self.optionsdata)
+      opts, getoptargs = getopt.getopt(argv, shortopts, longopts)
+      self.assertEqual(optsdict, argvparser.dictifyopts(opts, optnames))
+      self.assertEqual(args, getoptargs)
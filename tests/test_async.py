@@ -0,0 +1,182 @@
+import unittest
+
+import io
+import json
+import os
+import subprocess
+import sys
+
+import sessionstoreparser as p
+
+# the async modules do not compile on python 2
+HASASYNC = sys.version_info >= (3, 5)
+
+def gettestdatafilename(extension='js'):
+  return os.path.join(os.path.dirname(__file__), 'sessionstore.' + extension)
+
+def readurls(parsedargv, filename):
+  initparams = p.SessionStoreParserFactoryFactory.getinitparams()
+  sspf_factory = p.SessionStoreParserFactoryFactory(**initparams)
+  stream = io.StringIO()
+  sessionstoreparserfactory = sspf_factory.make(
+        stream, p.openbinary, io.StringIO())
+  sessionstoreparser = sessionstoreparserfactory.make(
+        dict(parsedargv, filename=filename))
+  sessionstoreparser.parse()
+  return stream.getvalue().splitlines()
+
+@unittest.skipIf(not HASASYNC, 'needs python 3.5 or later')
+class TestAsyncSessionStoreParser(unittest.TestCase):
+
+  def setUp(self):
+    import asyncio
+    self.loop = asyncio.new_event_loop()
+
+  def tearDown(self):
+    self.loop.close()
+
+  def consume(self, urls):
+    consumed = []
+    while True:
+      try:
+        consumed.append(self.loop.run_until_complete(urls.__anext__()))
+      except StopAsyncIteration: #pylint: disable=undefined-variable
+        return consumed
+
+  def parse(self, parser, source):
+    # fails instead of hanging when no place comes free
+    import asyncio
+    return self.loop.run_until_complete(
+          asyncio.wait_for(parser.parse(source), 5))
+
+  def test_sameurls(self):
+    import asyncsessionstoreparser as assp
+    for parsedargv in [{}, {'all': None, 'entry': 'all'}, {'closed': None}]:
+      parser = assp.AsyncSessionStoreParser(parsedargv, batchsize=2)
+      urls = self.parse(parser, gettestdatafilename())
+      self.assertEqual([url.url for url in self.consume(urls)],
+            readurls(parsedargv, gettestdatafilename()))
+
+  def test_upload(self):
+    import asyncsessionstoreparser as assp
+    parser = assp.AsyncSessionStoreParser({'all': None, 'entry': 'all'})
+    with open(gettestdatafilename('jsonlz4'), 'rb') as fileob:
+      urls = self.parse(parser, fileob.read())
+    self.assertEqual([url.url for url in self.consume(urls)],
+          readurls({'all': None, 'entry': 'all'}, gettestdatafilename()))
+
+  def test_concurrency(self):
+    # a parse keeps its place until its urls are consumed
+    import asyncio
+    import asyncsessionstoreparser as assp
+    parser = assp.AsyncSessionStoreParser(concurrency=1)
+    first = self.parse(parser, gettestdatafilename())
+    second = asyncio.ensure_future(
+          parser.parse(gettestdatafilename()), loop=self.loop)
+    self.loop.run_until_complete(asyncio.sleep(0.01))
+    self.assertFalse(second.done())
+    count = len(self.consume(first))
+    second = self.loop.run_until_complete(second)
+    self.assertEqual(len(self.consume(second)), count)
+
+  def test_close(self):
+    import asyncsessionstoreparser as assp
+    parser = assp.AsyncSessionStoreParser(concurrency=1)
+    urls = self.parse(parser, gettestdatafilename())
+    self.loop.run_until_complete(urls.aclose())
+    urls = self.parse(parser, gettestdatafilename())
+    self.assertEqual(len(self.consume(urls)), 9)
+
+  def test_break(self):
+    # an async for which breaks early gives the place back when its urls
+    # are dropped, an async with block when it is left
+    import asyncsessionstoreparser as assp
+    parser = assp.AsyncSessionStoreParser(concurrency=1)
+    for dummy in range(3):
+      urls = self.parse(parser, gettestdatafilename())
+      self.loop.run_until_complete(urls.__anext__())
+      del urls
+      urls = self.loop.run_until_complete(
+            self.parse(parser, gettestdatafilename()).__aenter__())
+      self.loop.run_until_complete(urls.__anext__())
+      self.loop.run_until_complete(urls.__aexit__(None, None, None))
+
+  def test_streaming(self):
+    # the urls are walked a batch at a time as they are consumed
+    import asyncsessionstoreparser as assp
+    parser = assp.AsyncSessionStoreParser(batchsize=2)
+    urls = self.parse(parser, gettestdatafilename())
+    self.loop.run_until_complete(urls.__anext__())
+    self.assertEqual(len(list(urls.batch)), 1)
+    self.assertEqual(len(list(urls.urls)), 7)
+    urls.close()
+
+  def test_processpool(self):
+    import concurrent.futures
+    import asyncsessionstoreparser as assp
+    parsedargv = {'all': None, 'entry': 'all'}
+    with concurrent.futures.ProcessPoolExecutor(1) as executor:
+      parser = assp.AsyncSessionStoreParser(
+            parsedargv, executor=executor, batchsize=2)
+      urls = self.parse(parser, gettestdatafilename())
+      self.assertEqual([url.url for url in self.consume(urls)],
+            readurls(parsedargv, gettestdatafilename()))
+
+  def test_errors(self):
+    import asyncsessionstoreparser as assp
+    parser = assp.AsyncSessionStoreParser(concurrency=1)
+    with self.assertRaises(p.Error) as context:
+      self.parse(parser, b'{"windows": [')
+    self.assertEqual(str(context.exception),
+          'error: cannot read session store from file upload.')
+    with self.assertRaises(p.Error) as context:
+      self.parse(parser, 'nonexistent.js')
+    self.assertEqual(str(context.exception),
+          'error: cannot open file nonexistent.js.')
+    # failed parses give their place back
+    self.assertEqual(len(self.consume(self.parse(parser, json.dumps({
+          'windows': [], 'selectedWindow': 0,
+          '_closedWindows': []}).encode('utf-8')))), 0)
+
+  def test_options(self):
+    import asyncsessionstoreparser as assp
+    self.assertRaises(p.ArgvError,
+          assp.AsyncSessionStoreParser, {'writer': 'plain'})
+    self.assertRaises(p.ArgvError,
+          assp.AsyncSessionStoreParser, {'window': 'nonsense'})
+
+@unittest.skipIf(not HASASYNC, 'needs python 3.5 or later')
+class TestLoadTest(unittest.TestCase):
+
+  def test_loadtest(self):
+    import runloadtest
+    stages, urlcount = runloadtest.loadtestfile(
+          gettestdatafilename(), 10, 2, 0)
+    self.assertEqual(urlcount, 90)
+    self.assertEqual(sorted(stages), ['lag', 'p50', 'p99', 'wall'])
+    self.assertTrue(stages['p50'] <= stages['p99'] <= stages['wall'])
+
+  def test_percentile(self):
+    import runloadtest
+    values = list(range(1, 101))
+    self.assertEqual(runloadtest.percentile(values, 0.5), 50)
+    self.assertEqual(runloadtest.percentile(values, 0.99), 99)
+    self.assertEqual(runloadtest.percentile([3], 0.99), 3)
+
+@unittest.skipIf(HASASYNC, 'the tests above run directly')
+class TestAsyncOnPython3(unittest.TestCase):
+  # python 2 runs this file with the python3 on the path, as a module of
+  # its own since the other test modules do not import on python 3
+
+  def test_python3(self):
+    from distutils.spawn import find_executable
+    python3 = find_executable('python3')
+    if python3 is None:
+      self.skipTest('needs python3 on the path')
+    directory = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(directory))
+    process = subprocess.Popen(
+          [python3, '-m', 'unittest', '-q', 'test_async'], cwd=directory,
+          env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0]
+    self.assertEqual(process.returncode, 0, output)
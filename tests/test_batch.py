@@ -0,0 +1,102 @@
+
+import unittest
+
+import contextlib
+import StringIO
+import textwrap
+
+import sessionstoreparser as p
+
+def makesessionstore(name):
+  return textwrap.dedent('''\
+        {
+          "windows": [
+            {
+              "tabs": [
+                {"index": 1, "entries": [{"url": "http://%s/"}]}
+              ],
+              "selected": 1,
+              "_closedTabs": []
+            }
+          ],
+          "_closedWindows": [],
+          "selectedWindow": 1
+        }
+        ''' % name)
+
+FAKEFILES = {
+      'one': makesessionstore('one'),
+      'two': makesessionstore('two'),
+      'three': makesessionstore('three'),
+      'broken': 'what is this',
+      'list': 'two\nthree\n\n'}
+
+def fakeopen(filename):
+  try:
+    content = FAKEFILES[filename]
+  except KeyError:
+    raise IOError('ignored error message')
+  return contextlib.closing(StringIO.StringIO(content))
+
+def runmain(argv, stdin=None):
+  fakestdout = StringIO.StringIO()
+  fakestderr = StringIO.StringIO()
+  exitstatus = p.secludedmain(
+        ['progname'] + argv, fakestdout, fakestderr, fakeopen, stdin)
+  return exitstatus, fakestdout.getvalue(), fakestderr.getvalue()
+
+class TestBatch(unittest.TestCase):
+
+  def test_manyfiles(self):
+    exitstatus, stdout, stderr = runmain(['one', 'two', 'three'])
+    self.assertEqual(stderr, '')
+    self.assertEqual(stdout, 'http://one/\nhttp://two/\nhttp://three/\n')
+    self.assertEqual(exitstatus, 0)
+
+  def test_failedfile(self):
+    exitstatus, stdout, stderr = runmain(['one', 'broken', 'missing', 'two'])
+    self.assertEqual(stderr,
+          'error: cannot read session store from file broken.\n'
+          'error: cannot open file missing.\n'
+          'error: 2 of 4 files failed.\n')
+    self.assertEqual(stdout, 'http://one/\nhttp://two/\n')
+    self.assertEqual(exitstatus, 1)
+
+  def test_filesfrom(self):
+    exitstatus, stdout, dummy_stderr = runmain(['--files-from=list', 'one'])
+    self.assertEqual(stdout, 'http://one/\nhttp://two/\nhttp://three/\n')
+    self.assertEqual(exitstatus, 0)
+
+  def test_filesfromstdin(self):
+    fakestdin = StringIO.StringIO('three\none\n')
+    exitstatus, stdout, dummy_stderr = runmain(['--files-from=-'], fakestdin)
+    self.assertEqual(stdout, 'http://three/\nhttp://one/\n')
+    self.assertEqual(exitstatus, 0)
+
+  def test_pool(self):
+    filenames = ['one', 'two', 'three'] * 10
+    exitstatus, stdout, stderr = runmain(['--jobs=3'] + filenames)
+    self.assertEqual(stderr, '')
+    self.assertEqual(stdout, ''.join(
+          'http://%s/\n' % filename for filename in filenames))
+    self.assertEqual(exitstatus, 0)
+
+  def test_poolcompleted(self):
+    filenames = ['one', 'two', 'broken', 'three']
+    argv = ['--jobs=2', '--order=completed'] + filenames
+    exitstatus, stdout, stderr = runmain(argv)
+    self.assertEqual(sorted(stdout.splitlines()),
+          ['http://one/', 'http://three/', 'http://two/'])
+    self.assertTrue(stderr.endswith('error: 1 of 4 files failed.\n'))
+    self.assertEqual(exitstatus, 1)
+
+  def test_illegaljobs(self):
+    for jobs in ['0', 'many']:
+      exitstatus, dummy_stdout, stderr = runmain(['--jobs=' + jobs, 'one'])
+      self.assertEqual(stderr, 'illegal value for "jobs": "%s"\n' % jobs)
+      self.assertEqual(exitstatus, 2)
+
+  def test_illegaloptiononce(self):
+    exitstatus, dummy_stdout, stderr = runmain(['--tab=wrong', 'one', 'two'])
+    self.assertEqual(stderr, 'illegal value for "tab": "wrong"\n')
+    self.assertEqual(exitstatus, 2)
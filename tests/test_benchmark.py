@@ -0,0 +1,139 @@
+import unittest
+
+import os
+import shutil
+import StringIO
+import tempfile
+
+import runbenchmark as b
+import sessionstoreparser as p
+
+class TestSessionStoreGenerator(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_deterministic(self):
+    parameters = dict(b.GENERATORDEFAULTS, bloat=16)
+    filenames = [os.path.join(self.directory, name) for name in 'ab']
+    for filename in filenames:
+      b.SessionStoreGenerator(**parameters).write(filename)
+    with open(filenames[0], 'rb') as first:
+      with open(filenames[1], 'rb') as second:
+        self.assertEqual(first.read(), second.read())
+
+  def test_counts(self):
+    generator = b.SessionStoreGenerator(windows=3, tabs=4, history=1,
+          closedtabs=2, closedwindows=1, bloat=0, seed=7)
+    counts = p.SessionStoreCounter().count(generator.make())
+    self.assertEqual(counts[p.WINDOWOPEN], 3)
+    self.assertEqual(counts[p.WINDOWCLOSED], 1)
+    self.assertEqual(counts[p.TABOPEN], 16)
+    self.assertEqual(counts[p.TABCLOSED], 8)
+    self.assertEqual(counts[p.ENTRYSELECTED], 24)
+    self.assertEqual(counts[p.ENTRYBACK] + counts[p.ENTRYFORWARD], 0)
+
+  def test_bloat(self):
+    generator = b.SessionStoreGenerator(windows=1, tabs=1, history=3,
+          closedtabs=0, closedwindows=0, bloat=100, seed=1)
+    tab = generator.make()['windows'][0]['tabs'][0]
+    self.assertEqual(len(tab['image']), len('data:image/png;base64,') + 100)
+    selected = tab['entries'][tab['index'] - 1]
+    self.assertEqual(len(selected['formdata']['id']['comment']), 100)
+
+  def test_stages(self):
+    filename = os.path.join(self.directory, 'sessionstore.js')
+    b.SessionStoreGenerator(**b.GENERATORDEFAULTS).write(filename)
+    stages, urlcount = b.benchmarkfile(filename, {}, 1)
+    self.assertEqual(sorted(stages), sorted(b.STAGES))
+    self.assertEqual(urlcount, 20)
+
+  def test_shards(self):
+    filename = os.path.join(self.directory, 'sessionstore.js')
+    b.SessionStoreGenerator(**b.GENERATORDEFAULTS).write(filename)
+    results = b.runshards(filename, 1, StringIO.StringIO())
+    self.assertEqual([result['case'] for result in results],
+          ['serial'] + ['jobs-%d' % jobs for jobs in b.getshardjobs()])
+    self.assertIn(2, b.getshardjobs())
+    self.assertEqual(sorted(results[-1]['stages']), ['speedup', 'wall'])
+
+  def test_diff(self):
+    filenames = [os.path.join(self.directory, name) for name in 'ab']
+    for filename, closedwindows in zip(filenames, [2, 3]):
+      b.SessionStoreGenerator(**dict(b.GENERATORDEFAULTS,
+            closedwindows=closedwindows)).write(filename)
+    results = b.rundiff(filenames[0], filenames[1], 1, StringIO.StringIO())
+    self.assertEqual([result['case'] for result in results], b.DIFFCASES)
+
+  def test_writers(self):
+    filename = os.path.join(self.directory, 'sessionstore.js')
+    b.SessionStoreGenerator(**b.GENERATORDEFAULTS).write(filename)
+    results = b.runwriters(filename, 100, 1, StringIO.StringIO())
+    self.assertEqual([result['case'] for result in results],
+          [case for case, dummy in b.WRITERCASES])
+    self.assertEqual(results[0]['stages']['relative'], 1.0)
+    self.assertEqual(results[-1]['urls'], 100)
+
+class TestCompareResults(unittest.TestCase):
+
+  @staticmethod
+  def makeresults(produce):
+    return {'results': [{
+          'scale': 'small', 'case': 'all',
+          'stages': {'decode': 1.0, 'produce': produce}}]}
+
+  def test_regression(self):
+    stdout = StringIO.StringIO()
+    regressions = b.compareresults(
+          self.makeresults(1.0), self.makeresults(1.2), 0.1, stdout)
+    self.assertEqual(regressions, [('small', 'all', 'produce')])
+    self.assertIn('REGRESSION', stdout.getvalue())
+
+  def test_withinthreshold(self):
+    regressions = b.compareresults(self.makeresults(1.0),
+          self.makeresults(1.05), 0.1, StringIO.StringIO())
+    self.assertEqual(regressions, [])
+
+  def test_tooshort(self):
+    regressions = b.compareresults(self.makeresults(0.0001),
+          self.makeresults(0.0005), 0.1, StringIO.StringIO())
+    self.assertEqual(regressions, [])
+
+  def test_startupstages(self):
+    results = {'results': [{
+          'scale': 'startup', 'case': 'version', 'stages': {'wall': 0.02}}]}
+    slower = {'results': [{
+          'scale': 'startup', 'case': 'version', 'stages': {'wall': 0.03}}]}
+    regressions = b.compareresults(
+          results, slower, 0.1, StringIO.StringIO())
+    self.assertEqual(regressions, [('startup', 'version', 'wall')])
+
+  def test_savedresults(self):
+    directory = tempfile.mkdtemp()
+    try:
+      filename = os.path.join(directory, 'results.json')
+      b.saveresults(self.makeresults(1.0), filename)
+      self.assertEqual(b.loadresults(filename), self.makeresults(1.0))
+    finally:
+      shutil.rmtree(directory)
+
+class TestImportTime(unittest.TestCase):
+
+  def test_parse(self):
+    text = (
+          'import time: self [us] | cumulative | imported package\n'
+          'import time:       100 |        100 |       _sre\n'
+          'import time:       900 |       1000 |     re\n'
+          'import time:       500 |       1500 |   json\n'
+          'import time:       300 |        300 |   math\n'
+          'import time:      2000 |       3800 | sessionstoreparser\n'
+          'import time:       400 |        400 | unrelated\n')
+    imports = b.parseimporttime(text, 'sessionstoreparser')
+    self.assertEqual(imports, {'json': 0.0015, 'math': 0.0003})
+
+  def test_notimported(self):
+    text = 'import time:       400 |        400 | unrelated\n'
+    self.assertEqual(b.parseimporttime(text, 'sessionstoreparser'), {})
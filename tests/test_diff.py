@@ -0,0 +1,163 @@
+import unittest
+
+import json
+import os
+import shutil
+import StringIO
+import tempfile
+
+import sessionstoreparser as p
+
+def maketab(url):
+  return {'index': 1, 'entries': [{'url': url}]}
+
+# a and b swap places, c is closed, d is gone and e is new
+OLD = {
+      'windows': [{
+        'tabs': [maketab('a'), maketab('b'), maketab('c')],
+        'selected': 3,
+        '_closedTabs': [{'state': maketab('d')}]}],
+      '_closedWindows': [],
+      'selectedWindow': 1}
+
+NEW = {
+      'windows': [{
+        'tabs': [maketab('b'), maketab('a'), maketab('e')],
+        'selected': 3,
+        '_closedTabs': [{'state': maketab('c')}]}],
+      '_closedWindows': [],
+      'selectedWindow': 1}
+
+OPEN = p.WINDOWOPEN | p.WINDOWSELECTED | p.TABOPEN | p.ENTRYSELECTED
+CLOSED = p.WINDOWOPEN | p.WINDOWSELECTED | p.TABCLOSED | p.ENTRYSELECTED
+
+def makeplace(windownumber, tabnumber, state=OPEN):
+  url = p.DetailedUrlRecord('', state)
+  url.windownumber = windownumber
+  url.tabnumber = tabnumber
+  return p.UrlDiffer(p.UrlIndex).makeplace(url)
+
+def runmain(argv):
+  fakestdout = StringIO.StringIO()
+  fakestderr = StringIO.StringIO()
+  exitstatus = p.secludedmain(
+        ['progname'] + argv, fakestdout, fakestderr, p.openbinary)
+  return exitstatus, fakestdout.getvalue(), fakestderr.getvalue()
+
+class TestUrlDiffer(unittest.TestCase):
+
+  def setUp(self):
+    self.urldiffer = p.UrlDiffer(p.UrlIndex)
+
+  def test_place(self):
+    place = makeplace(3, 70000, CLOSED)
+    url = self.urldiffer.makerecord(u'x', place)
+    self.assertEqual((url.url, url.windownumber, url.tabnumber, url.state),
+          (u'x', 3, 70000, CLOSED))
+    self.assertTrue(makeplace((1 << 23) - 1, (1 << 32) - 1) < 1 << 64)
+
+  def test_single(self):
+    match = self.urldiffer.match
+    one = makeplace(1, 1)
+    two = makeplace(1, 2)
+    closed = makeplace(1, 1, CLOSED)
+    self.assertEqual(match([one], [one]), [])
+    self.assertEqual(match([one], [two]), [('>', two)])
+    self.assertEqual(match([one], [closed]), [('~', closed)])
+    self.assertEqual(match([], [one]), [('+', one)])
+    self.assertEqual(match([one], []), [('-', one)])
+
+  def test_many(self):
+    match = self.urldiffer.match
+    places = [makeplace(1, number) for number in range(1, 5)]
+    closed = makeplace(1, 2, CLOSED)
+    # the equal place is kept even after a moved one
+    self.assertEqual(match(places[:2], [places[2], places[0]]),
+          [('>', places[2])])
+    self.assertEqual(match(places[:2], [closed]),
+          [('~', closed), ('-', places[1])])
+    self.assertEqual(match(places[:1], [places[3], places[0], places[2]]),
+          [('+', places[3]), ('+', places[2])])
+    self.assertEqual(match(places, [places[3], closed]),
+          [('~', closed), ('-', places[1]), ('-', places[2])])
+
+  def test_indexes(self):
+    # keys which share slots, more than the first table holds
+    keys = [1 + (number % 7) * 1024 for number in range(3000)]
+    urlindex = p.UrlIndex()
+    digestindex = p.DigestUrlIndex()
+    for place, key in enumerate(keys):
+      urlindex.add(key, place)
+      digestindex.add(key, place)
+    self.assertEqual(list(digestindex.keys), urlindex.keys)
+    self.assertEqual(urlindex.keys, keys[:7])
+    for key in urlindex.keys:
+      self.assertEqual(digestindex.get(key), urlindex.get(key))
+      self.assertIn(key, digestindex)
+    self.assertEqual(urlindex.get(2), [])
+    self.assertEqual(digestindex.get(2), [])
+    self.assertNotIn(2, digestindex)
+
+class TestMainDiff(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.oldfilename = os.path.join(self.directory, 'old.js')
+    self.newfilename = os.path.join(self.directory, 'new.js')
+    for filename, sessionstore in [
+          (self.oldfilename, OLD), (self.newfilename, NEW)]:
+      with open(filename, 'w') as fileob:
+        json.dump(sessionstore, fileob)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_diff(self):
+    filenames = [self.oldfilename, self.newfilename]
+    for keys in ['urls', 'digests']:
+      self.assertEqual(runmain(['--diff=' + keys] + filenames),
+            (0, '> b\n> a\n+ e\n- c\n', ''))
+      self.assertEqual(runmain(['--diff=' + keys, '--all'] + filenames),
+            (0, '> b\n> a\n+ e\n~ c\n- d\n', ''))
+
+  def test_format(self):
+    argv = ['--diff=urls', '--all',
+          '--format=%windownumber%:%tabnumber% %tabstate% %url%',
+          self.oldfilename, self.newfilename]
+    self.assertEqual(runmain(argv), (0,
+          '> 1:1 open b\n> 1:2 open a\n+ 1:3 open,selected e\n'
+          '~ 1:1 closed c\n- 1:1 closed d\n', ''))
+
+  def test_same(self):
+    testdatafilename = os.path.join(
+          os.path.dirname(__file__), 'sessionstore.js')
+    for keys in ['urls', 'digests']:
+      self.assertEqual(runmain(['--diff=' + keys, '--all', '--url=all',
+            testdatafilename, testdatafilename]), (0, '', ''))
+    exitstatus, stdout, dummy_stderr = runmain(['--diff=digests', '--all',
+          '--url=all', self.oldfilename, testdatafilename])
+    self.assertEqual(exitstatus, 0)
+    self.assertEqual(stdout.splitlines()[-4:], ['- a', '- b', '- c', '- d'])
+
+  def test_errors(self):
+    filenames = [self.oldfilename, self.newfilename]
+    for argv, message in [
+          (['--diff=urls', self.oldfilename],
+            '--diff takes exactly two filenames'),
+          (['--diff=urls'] + filenames + [self.oldfilename],
+            '--diff takes exactly two filenames'),
+          (['--diff=urls', '--jobs=2'] + filenames,
+            '--diff takes exactly two filenames'),
+          (['--diff=urls', '--writer=batched'] + filenames,
+            '--diff takes no --writer'),
+          (['--diff=urls', '--unique=exact'] + filenames,
+            '--diff takes no --unique'),
+          (['--diff=lines'] + filenames,
+            'illegal value for "diff": "lines"'),
+          (['--diff=urls', '--format=%title%'] + filenames,
+            '--diff takes no %title% in --format'),
+          (['--diff=digests', '-', self.newfilename],
+            '--diff=digests cannot read from stdin')]:
+      self.assertEqual(runmain(argv), (2, '', message + '\n'))
+    self.assertEqual(runmain(['--diff=urls', self.oldfilename, 'missing']),
+          (1, '', 'error: cannot open file missing.\n'))
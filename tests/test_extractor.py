@@ -0,0 +1,104 @@
+import unittest
+
+import os
+import StringIO
+import threading
+
+import sessionstoreparser as p
+
+def gettestdatafilename(name='sessionstore.js'):
+  return os.path.join(os.path.dirname(__file__), name)
+
+def gettestdata(name='sessionstore.js'):
+  with open(gettestdatafilename(name), 'rb') as testdatafile:
+    testdata = testdatafile.read()
+  return bytearray(testdata)
+
+def runmain(argv):
+  fakestdout = StringIO.StringIO()
+  fakestderr = StringIO.StringIO()
+  exitstatus = p.secludedmain(
+        ['progname'] + argv, fakestdout, fakestderr, p.openbinary)
+  return exitstatus, fakestdout.getvalue(), fakestderr.getvalue()
+
+class TestUrlExtractor(unittest.TestCase):
+
+  def test_sameasmain(self):
+    for parsedargv, argv in [
+          ({}, []),
+          ({'all': None, 'entry': 'all'}, ['--all', '--url=all']),
+          ({'closed': None}, ['--closed']),
+          ({'window': 'selected', 'entry': 'back'},
+            ['--window=selected', '--url=back'])]:
+      urlextractor = p.makeurlextractor(parsedargv)
+      urls = [url.url for url in urlextractor.iterurls(
+            gettestdatafilename())]
+      dummy_exitstatus, stdout, dummy_stderr = runmain(
+            argv + [gettestdatafilename()])
+      self.assertEqual(urls, stdout.splitlines())
+
+  def test_data(self):
+    urlextractor = p.makeurlextractor({'all': None, 'entry': 'all'})
+    expected = [(url.url, url.state) for url in urlextractor.iterurls(
+          gettestdatafilename())]
+    for name in ['sessionstore.js', 'sessionstore.jsonlz4']:
+      urls = [(url.url, url.state) for url in urlextractor.iterurls(
+            gettestdata(name))]
+      self.assertEqual(urls, expected)
+
+  def test_uniquepercall(self):
+    urlextractor = p.makeurlextractor(
+          {'all': None, 'entry': 'all', 'unique': 'exact'})
+    first = list(urlextractor.iterurls(gettestdatafilename()))
+    second = list(urlextractor.iterurls(gettestdatafilename()))
+    self.assertEqual(len(first), len(set(url.url for url in first)))
+    self.assertEqual(len(second), len(first))
+
+  def test_format(self):
+    urlextractor = p.makeurlextractor(
+          {'format': '%windownumber% %title%'})
+    url = next(urlextractor.iterurls(gettestdatafilename()))
+    self.assertEqual(url.windownumber, 1)
+    self.assertEqual(url.title, u'')
+
+  def test_errors(self):
+    urlextractor = p.makeurlextractor()
+    with self.assertRaises(p.Error) as context:
+      urlextractor.iterurls(bytearray(b'{"windows": ['), 'upload 7')
+    self.assertEqual(str(context.exception),
+          'error: cannot read session store from file upload 7.')
+    with self.assertRaises(p.Error) as context:
+      urlextractor.iterurls('nonexistent.js')
+    self.assertEqual(str(context.exception),
+          'error: cannot open file nonexistent.js.')
+
+  def test_options(self):
+    self.assertRaises(p.ArgvError, p.makeurlextractor, {'writer': 'plain'})
+    self.assertRaises(p.ArgvError, p.makeurlextractor, {'tab': 'nonsense'})
+    self.assertRaises(p.ArgvError, p.makeurlextractor, {'unique': 'maybe'})
+    self.assertRaises(p.ArgvError, p.makeurlextractor, {'format': '%x%'})
+
+  def test_salvage(self):
+    stderr = StringIO.StringIO()
+    urlextractor = p.makeurlextractor({'reader': 'salvage'}, stderr)
+    data = gettestdata()
+    urls = list(urlextractor.iterurls(data[:len(data) // 2], 'half'))
+    self.assertNotEqual(urls, [])
+    self.assertIn('warning: half: ', stderr.getvalue())
+
+  def test_threads(self):
+    urlextractor = p.makeurlextractor(
+          {'all': None, 'entry': 'all', 'unique': 'exact'})
+    expected = [(url.url, url.state) for url in urlextractor.iterurls(
+          gettestdatafilename())]
+    results = []
+    def work():
+      for dummy in range(20):
+        results.append([(url.url, url.state)
+              for url in urlextractor.iterurls(gettestdata())])
+    threads = [threading.Thread(target=work) for dummy in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(results, [expected] * 80)
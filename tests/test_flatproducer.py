@@ -0,0 +1,208 @@
+import unittest
+
+import json
+import os
+import shutil
+import StringIO
+import tempfile
+
+import sessionstoreparser as p
+
+FIELDS = frozenset(['title', 'lastaccessed', 'windownumber', 'tabnumber',
+      'entrynumber', 'depth'])
+
+# frames of frames, and pages with and without them
+SESSIONSTORE = {
+      'windows': [{
+        'tabs': [
+          {'index': 2, 'lastAccessed': 5, 'entries': [
+            {'url': 'b', 'children': [
+              {'url': 'b.1', 'children': [{'url': 'b.1.1'}]},
+              {'url': 'b.2'}]},
+            {'url': 's', 'title': 'selected', 'children': []},
+            {'url': 'f', 'children': [{'url': 'f.1'}]}]},
+          {'index': 1, 'entries': [{'url': 't'}]}],
+        'selected': 2,
+        '_closedTabs': [
+          {'state': {'index': 1, 'entries': [
+            {'url': 'c', 'children': [{'url': 'c.1'}]}]}}]}],
+      '_closedWindows': [],
+      'selectedWindow': 1}
+
+def gettestdatafilename():
+  return os.path.join(os.path.dirname(__file__), 'sessionstore.js')
+
+def gettestdata():
+  with open(gettestdatafilename()) as testdatafile:
+    testdata = json.load(testdatafile)
+  return testdata
+
+def makefilter(**templates):
+  initparams = p.UrlFilterFactory.getinitparams()
+  urlfilterfactory = p.UrlFilterFactory(**initparams)
+  return urlfilterfactory.make(templates)
+
+def describe(urls):
+  return [(url.url, url.state, url.windownumber, url.tabnumber,
+        url.entrynumber, url.depth, url.title, url.lastaccessed)
+        for url in urls]
+
+def runmain(argv):
+  fakestdout = StringIO.StringIO()
+  fakestderr = StringIO.StringIO()
+  exitstatus = p.secludedmain(
+        ['progname'] + argv, fakestdout, fakestderr, p.openbinary)
+  return exitstatus, fakestdout.getvalue(), fakestderr.getvalue()
+
+class TestFlatUrlProducer(unittest.TestCase):
+
+  def test_sameasnested(self):
+    for templates in [{}, {'all': '', 'entry': 'all'}, {'closed': ''},
+          {'window': 'selected', 'tab': 'all', 'entry': 'back'},
+          {'selected': ''}]:
+      urlfilter = makefilter(**templates)
+      for sessionstore in [gettestdata(), SESSIONSTORE]:
+        self.assertEqual(
+              [(url.url, url.state) for url in
+                p.FlatUrlProducer().produce(sessionstore, urlfilter)],
+              [(url.url, url.state) for url in
+                p.UrlProducer().produce(sessionstore, urlfilter)])
+        self.assertEqual(
+              describe(p.DetailedFlatUrlProducer(FIELDS).produce(
+                sessionstore, urlfilter)),
+              describe(p.DetailedUrlProducer(FIELDS).produce(
+                sessionstore, urlfilter)))
+
+  def test_unfiltered(self):
+    sessionstore = gettestdata()
+    self.assertEqual(
+          describe(p.DetailedFlatUrlProducer(FIELDS).produce(sessionstore)),
+          describe(p.DetailedUrlProducer(FIELDS).produce(sessionstore)))
+
+  def test_pruning(self):
+    # the pruned parts are invalid so visiting them would raise
+    sessionstore = {
+          'windows': [{
+            'tabs': [
+              {'index': 2, 'entries': [None, {'url': 's'}, None]},
+              {'index': 1, 'entries': [{'url': 't'}]}],
+            'selected': 1,
+            '_closedTabs': None}],
+          'selectedWindow': 1}
+    urls = p.FlatUrlProducer().produce(sessionstore, makefilter())
+    self.assertEqual([url.url for url in urls], ['s', 't'])
+    urls = p.FlatUrlProducer().produce(sessionstore, makefilter(selected=''))
+    self.assertEqual([url.url for url in urls], ['s'])
+
+  def test_indexoutofrange(self):
+    sessionstore = {
+          'windows': [{
+            'tabs': [
+              {'index': 0, 'entries': [{'url': 'f1'}, {'url': 'f2'}]},
+              {'index': 3, 'entries': [{'url': 'b1'}, {'url': 'b2'}]}],
+            'selected': 1,
+            '_closedTabs': []}],
+          '_closedWindows': [],
+          'selectedWindow': 1}
+    self.assertEqual(
+          describe(p.DetailedFlatUrlProducer(FIELDS).produce(sessionstore)),
+          describe(p.DetailedUrlProducer(FIELDS).produce(sessionstore)))
+
+  def test_frames(self):
+    urls = p.DetailedFlatUrlProducer(FIELDS, descend=True).produce(
+          SESSIONSTORE, makefilter(all='', entry='all'))
+    window = p.WINDOWOPEN | p.WINDOWSELECTED
+    back = window | p.TABOPEN | p.ENTRYBACK
+    forward = window | p.TABOPEN | p.ENTRYFORWARD
+    self.assertEqual(
+          [(url.url, url.state, url.entrynumber, url.depth) for url in urls], [
+          ('b', back, 1, 0),
+          ('b.1', back, 1, 1),
+          ('b.1.1', back, 1, 2),
+          ('b.2', back, 1, 1),
+          ('s', window | p.TABOPEN | p.ENTRYSELECTED, 2, 0),
+          ('f', forward, 3, 0),
+          ('f.1', forward, 3, 1),
+          ('t', window | p.TABOPEN | p.TABSELECTED | p.ENTRYSELECTED, 1, 0),
+          ('c', window | p.TABCLOSED | p.ENTRYSELECTED, 1, 0),
+          ('c.1', window | p.TABCLOSED | p.ENTRYSELECTED, 1, 1)])
+
+  def test_framesfiltered(self):
+    urls = p.FlatUrlProducer(descend=True).produce(
+          SESSIONSTORE, makefilter(entry='back'))
+    self.assertEqual([url.url for url in urls], ['b', 'b.1', 'b.1.1', 'b.2'])
+
+class TestUrlProducerFactory(unittest.TestCase):
+
+  def make(self, parsedargv, fields=frozenset()):
+    initparams = p.UrlProducerFactory.getinitparams()
+    urlproducerfactory = p.UrlProducerFactory(**initparams)
+    return urlproducerfactory.make(parsedargv, fields)
+
+  def test_make(self):
+    self.assertEqual(type(self.make({})), p.UrlProducer)
+    self.assertEqual(type(self.make({}, FIELDS)), p.DetailedUrlProducer)
+    self.assertEqual(type(self.make({'producer': 'flat'})), p.FlatUrlProducer)
+    urlproducer = self.make({'frames': None}, FIELDS)
+    self.assertEqual(type(urlproducer), p.DetailedFlatUrlProducer)
+    self.assertTrue(urlproducer.descend)
+    self.assertFalse(self.make({'producer': 'flat'}).descend)
+
+  def test_errors(self):
+    self.assertRaises(p.ArgvError, self.make, {'producer': 'wrong'})
+    self.assertRaises(p.ArgvError, self.make,
+          {'producer': 'nested', 'frames': None})
+
+class TestMainFlatProducer(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.filename = os.path.join(self.directory, 'sessionstore.js')
+    with open(self.filename, 'w') as fileob:
+      json.dump(SESSIONSTORE, fileob)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_sameoutput(self):
+    for argv in [[], ['--all', '--url=all'], ['--closed', '--url=back'],
+          ['--all', '--format=%windownumber%:%tabnumber%:%entrynumber% %url%'],
+          ['--reader=stream', '--all', '--url=all']]:
+      self.assertEqual(
+            runmain(['--producer=flat'] + argv + [gettestdatafilename()]),
+            runmain(argv + [gettestdatafilename()]))
+
+  def test_frames(self):
+    for reader in ['json', 'stream', 'project']:
+      self.assertEqual(runmain(['--frames', '--reader=' + reader,
+            '--format=%depth% %url%', self.filename]),
+            (0, '0 s\n0 t\n', ''))
+      self.assertEqual(runmain(['--frames', '--reader=' + reader,
+            '--url=all', '--format=%depth% %url%', self.filename]),
+            (0, '0 b\n1 b.1\n2 b.1.1\n1 b.2\n0 s\n0 f\n1 f.1\n0 t\n', ''))
+
+  def test_framescache(self):
+    cache = os.path.join(self.directory, 'cache')
+    argv = ['--url=all', '--cache=' + cache, self.filename]
+    self.assertEqual(runmain(argv), (0, 'b\ns\nf\nt\n', ''))
+    self.assertEqual(runmain(['--frames'] + argv),
+          (0, 'b\nb.1\nb.1.1\nb.2\ns\nf\nf.1\nt\n', ''))
+    self.assertEqual(runmain(argv), (0, 'b\ns\nf\nt\n', ''))
+
+  def test_depthnested(self):
+    self.assertEqual(runmain(['--format=%depth% %url%', self.filename]),
+          (0, '0 s\n0 t\n', ''))
+
+  def test_errors(self):
+    self.assertEqual(runmain(['--producer=wrong', self.filename]),
+          (2, '', 'illegal value for "producer": "wrong"\n'))
+    self.assertEqual(
+          runmain(['--producer=nested', '--frames', self.filename]),
+          (2, '', '--frames needs --producer=flat\n'))
+
+  def test_extractor(self):
+    urlextractor = p.makeurlextractor(
+          {'all': None, 'entry': 'all', 'frames': None})
+    self.assertEqual([url.url for url in urlextractor.iterurls(
+          self.filename)],
+          ['b', 'b.1', 'b.1.1', 'b.2', 's', 'f', 'f.1', 't', 'c', 'c.1'])
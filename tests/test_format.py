@@ -0,0 +1,109 @@
+import unittest
+
+import os
+import StringIO
+
+import sessionstoreparser as p
+
+def gettestdatafilename():
+  return os.path.join(os.path.dirname(__file__), 'sessionstore.js')
+
+def runmain(argv):
+  fakestdout = StringIO.StringIO()
+  fakestderr = StringIO.StringIO()
+  exitstatus = p.secludedmain(
+        ['progname'] + argv, fakestdout, fakestderr, p.openbinary)
+  return exitstatus, fakestdout.getvalue(), fakestderr.getvalue()
+
+SESSIONSTORE = {
+      'windows': [{
+        'tabs': [
+          {'index': 2, 'lastAccessed': 1000, 'entries': [
+            {'url': 'b', 'title': 'back'}, {'url': 's'}]}],
+        'selected': 1,
+        '_closedTabs': []}],
+      '_closedWindows': [],
+      'selectedWindow': 1}
+
+class TestUrlFormat(unittest.TestCase):
+
+  def makeurl(self):
+    url = p.DetailedUrlRecord(u'http://a/',
+          p.WINDOWOPEN | p.WINDOWSELECTED | p.TABOPEN | p.ENTRYBACK)
+    url.windownumber, url.tabnumber, url.entrynumber = 1, 2, 3
+    url.title = u'a'
+    url.lastaccessed = 1000
+    return url
+
+  def test_compile(self):
+    urlformat = p.UrlFormat('[%windownumber%:%tabnumber%] 100%% %url%')
+    self.assertEqual(urlformat.template, u'[%s:%s] 100%% %s')
+    self.assertEqual(urlformat.names, ['windownumber', 'tabnumber', 'url'])
+    self.assertEqual(urlformat.fields,
+          frozenset(['windownumber', 'tabnumber']))
+
+  def test_format(self):
+    url = self.makeurl()
+    for formatstring, expected in [
+          ('%url%', u'http://a/'),
+          ('[%windownumber%:%tabnumber%:%entrynumber%] %url%',
+            u'[1:2:3] http://a/'),
+          ('%url% %title% %lastaccessed%', u'http://a/ a 1000'),
+          ('w:%windowstate% t:%tabstate% e:%entrystate%',
+            u'w:open,selected t:open e:back'),
+          ('%%', u'%'),
+          ('text', u'text')]:
+      self.assertEqual(p.UrlFormat(formatstring).format(url), expected)
+
+  def test_illegal(self):
+    self.assertRaises(p.ArgvError, p.UrlFormat, '%nofield%')
+    self.assertRaises(p.ArgvError, p.UrlFormat, '%url')
+    self.assertRaises(p.ArgvError, p.UrlFormat, '100% %url%')
+
+class TestDetailedUrlProducer(unittest.TestCase):
+
+  def test_onlyaskedfields(self):
+    urls = list(p.DetailedUrlProducer(frozenset(['title'])).produce(
+          SESSIONSTORE))
+    self.assertEqual([(url.title, url.lastaccessed) for url in urls],
+          [('back', None), (u'', None)])
+    urls = list(p.DetailedUrlProducer(frozenset(['lastaccessed'])).produce(
+          SESSIONSTORE))
+    self.assertEqual([(url.title, url.lastaccessed) for url in urls],
+          [(None, 1000), (None, 1000)])
+
+class TestMainFormat(unittest.TestCase):
+
+  def test_format(self):
+    exitstatus, stdout, stderr = runmain(
+          ['--format=%windownumber%:%tabnumber%:%entrynumber% %url%',
+            gettestdatafilename()])
+    self.assertEqual(stderr, '')
+    self.assertEqual(stdout.splitlines()[:3], [
+          '1:1:3 http://sw1-ot1-s0u3/',
+          '1:2:2 http://sw1-ot2-s0u2/',
+          '1:3:1 http://sw1-st3-s0u1/'])
+    self.assertEqual(exitstatus, 0)
+
+  def test_defaultformat(self):
+    filename = gettestdatafilename()
+    for writer in ['plain', 'batched']:
+      dummy_exitstatus, expected, dummy_stderr = runmain(
+            ['--writer=' + writer, '--url=all', filename])
+      for formatstring in ['%url%', '%url%%%']:
+        exitstatus, stdout, stderr = runmain(['--writer=' + writer,
+              '--url=all', '--format=' + formatstring, filename])
+        self.assertEqual(stderr, '')
+        self.assertEqual(stdout,
+              expected.replace('\n', formatstring[5:-1] + '\n'))
+        self.assertEqual(exitstatus, 0)
+
+  def test_illegal(self):
+    exitstatus, dummy_stdout, stderr = runmain(
+          ['--format=%nofield%', gettestdatafilename()])
+    self.assertEqual(stderr, 'illegal field in "format": "%nofield%"\n')
+    self.assertEqual(exitstatus, 2)
+    exitstatus, dummy_stdout, stderr = runmain(
+          ['--writer=diff', '--format=x', gettestdatafilename()])
+    self.assertEqual(stderr, '--writer=diff takes no --format\n')
+    self.assertEqual(exitstatus, 2)
@@ -0,0 +1,114 @@
+import unittest
+
+import io
+import json
+import os
+import shutil
+import StringIO
+import tempfile
+
+import sessionstoreparser as p
+
+def gettestdatafilename(name):
+  return os.path.join(os.path.dirname(__file__), name)
+
+def gettestdata(name):
+  with open(gettestdatafilename(name), 'rb') as testdatafile:
+    testdata = testdatafile.read()
+  return testdata
+
+def runmain(argv, stdin):
+  fakestdout = StringIO.StringIO()
+  fakestderr = StringIO.StringIO()
+  exitstatus = p.secludedmain(
+        ['progname'] + argv, fakestdout, fakestderr, p.openbinary, stdin)
+  return exitstatus, fakestdout.getvalue(), fakestderr.getvalue()
+
+class TestReadText(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def writefile(self, data):
+    filename = os.path.join(self.directory, 'sessionstore.js')
+    with open(filename, 'wb') as fileob:
+      fileob.write(data)
+    return filename
+
+  def test_mapped(self):
+    filename = gettestdatafilename('sessionstore.js')
+    with open(filename, 'rb') as fileob:
+      mapping = p.mapfile(fileob)
+      self.assertNotEqual(mapping, None)
+      mapping.close()
+      text = p.readtext(fileob)
+    self.assertEqual(json.loads(text), json.loads(gettestdata(
+          'sessionstore.js')))
+
+  def test_notmapped(self):
+    self.assertEqual(p.mapfile(io.BytesIO(b'{}')), None)
+    self.assertEqual(p.mapfile(StringIO.StringIO('{}')), None)
+    self.assertEqual(p.readtext(io.BytesIO(b'{"a": 1}')), '{"a": 1}')
+
+  def test_emptyfile(self):
+    filename = self.writefile(b'')
+    with open(filename, 'rb') as fileob:
+      self.assertEqual(p.mapfile(fileob), None)
+      self.assertEqual(p.readtext(fileob), '')
+
+  def test_notatstart(self):
+    filename = self.writefile(b'xx{}')
+    with open(filename, 'rb') as fileob:
+      fileob.read(2)
+      self.assertEqual(p.mapfile(fileob), None)
+      self.assertEqual(p.readtext(fileob), '{}')
+
+class TestStdinFile(unittest.TestCase):
+
+  def test_seekback(self):
+    stdinfile = p.StdinFile(io.BytesIO(b'abcdefgh'), 4)
+    self.assertEqual(stdinfile.read(3), b'abc')
+    stdinfile.seek(0)
+    self.assertEqual(stdinfile.read(), b'abcdefgh')
+    self.assertRaises(IOError, stdinfile.seek, 0)
+
+  def test_chunks(self):
+    stdinfile = p.StdinFile(io.BytesIO(b'abcdefgh'), 3)
+    self.assertEqual(stdinfile.read(5), b'abc')
+    self.assertEqual(stdinfile.read(5), b'defgh')
+    self.assertEqual(stdinfile.read(5), b'')
+
+  def test_opener(self):
+    stdin = io.BytesIO(b'{}')
+    opener = p.StdinOpener(p.openbinary, stdin, 1 << 20)
+    with opener('-') as fileob:
+      self.assertEqual(fileob.read(), b'{}')
+    self.assertFalse(stdin.closed)
+
+class TestMainStdin(unittest.TestCase):
+
+  def test_readers(self):
+    filename = gettestdatafilename('sessionstore.js')
+    expected = runmain(['--all', '--url=all', filename], None)
+    self.assertEqual(expected[0], 0)
+    for name in ['sessionstore.js', 'sessionstore.jsonlz4']:
+      for reader in ['json', 'stream', 'salvage']:
+        stdin = io.BytesIO(gettestdata(name))
+        result = runmain(
+              ['--all', '--url=all', '--reader=' + reader, '-'], stdin)
+        self.assertEqual(result, expected)
+
+  def test_nostdin(self):
+    exitstatus, stdout, stderr = runmain(['-'], None)
+    self.assertEqual(exitstatus, 1)
+    self.assertEqual(stdout, '')
+    self.assertEqual(stderr, 'error: cannot open file -.\n')
+
+  def test_watch(self):
+    exitstatus, dummy_stdout, stderr = runmain(
+          ['--watch', '-'], io.BytesIO(b''))
+    self.assertEqual(exitstatus, 2)
+    self.assertIn('--watch cannot read from stdin', stderr)
@@ -126,3 +126,33 @@ class TestMain(unittest.TestCase):
           'error: cannot read session store from file filename.\n')
     self.assertEqual(fakestdout.getvalue(), '')
     self.assertEqual(exitstatus, 1)
+
+class TestLazySessionStoreParserFactory(unittest.TestCase):
+
+  def test_builtonce(self):
+    built = []
+    class FakeFactory(object):
+      def make(self, parsedargv):
+        return parsedargv['filename']
+    def buildfunc(name):
+      built.append(name)
+      return FakeFactory()
+    factory = p.LazySessionStoreParserFactory(buildfunc, ('built',))
+    self.assertEqual(built, [])
+    self.assertEqual(factory.make({'filename': 'file1'}), 'file1')
+    self.assertEqual(factory.make({'filename': 'file2'}), 'file2')
+    self.assertEqual(built, ['built'])
+
+  def test_versionbuildsnothing(self):
+    initparams = p.ApplicationFactory.getinitparams()
+    def failbuild(*dummy_args):
+      raise AssertionError('factories built for --version')
+    initparams['lazyparserfactoryclass'] = (
+          lambda dummy_buildfunc, buildargs:
+            p.LazySessionStoreParserFactory(failbuild, buildargs))
+    applicationfactory = p.ApplicationFactory(**initparams)
+    fakestdout = StringIO.StringIO()
+    application = applicationfactory.make(
+          fakestdout, StringIO.StringIO(), None)
+    self.assertEqual(application.run(['progname', '--version']), 0)
+    self.assertEqual(fakestdout.getvalue(), p.VERSION + '\n')
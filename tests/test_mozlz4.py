@@ -0,0 +1,91 @@
+
+import unittest
+
+import contextlib
+import os
+import StringIO
+
+import sessionstoreparser as p
+
+def gettestdata(name):
+  filename = os.path.join(os.path.dirname(__file__), name)
+  with open(filename, 'rb') as testdatafile:
+    testdata = testdatafile.read()
+  return testdata
+
+class TestDecompressLz4Block(unittest.TestCase):
+
+  def test_literalsonly(self):
+    block = b'\x50hello'
+    self.assertEqual(p.decompresslz4block(block, 5), bytearray(b'hello'))
+
+  def test_overlappingmatch(self):
+    # literals "ab" then match offset 2 length 8 then literal "c"
+    block = b'\x24ab\x02\x00\x10c'
+    self.assertEqual(p.decompresslz4block(block, 11),
+          bytearray(b'ababababab' + b'c'))
+
+  def test_longlengths(self):
+    # literal length 15 + 5 and match length 15 + 1 + 4
+    literals = b'abcdefghijklmnopqrst'
+    block = b'\xff\x05' + literals + b'\x14\x00\x01' + b'\x10z'
+    expected = literals + literals + b'z'
+    self.assertEqual(p.decompresslz4block(block, 41), bytearray(expected))
+
+  def test_start(self):
+    block = b'header\x50hello'
+    self.assertEqual(p.decompresslz4block(block, 5, 6), bytearray(b'hello'))
+
+  def test_badoffset(self):
+    block = b'\x10a\x05\x00'
+    self.assertRaises(ValueError, p.decompresslz4block, block, 5)
+
+  def test_truncated(self):
+    block = b'\x10a'
+    self.assertRaises(ValueError, p.decompresslz4block, block, 5)
+
+class TestDecompressMozlz4(unittest.TestCase):
+
+  testdata = gettestdata('sessionstore.js')
+  testdatalz4 = gettestdata('sessionstore.jsonlz4')
+
+  def test_head(self):
+    # the magic read by MagicOpener and the rest of the file
+    for split in [0, 8, 12]:
+      data = p.decompressmozlz4(self.testdatalz4[split:],
+            head=self.testdatalz4[:split])
+      self.assertEqual(bytes(data), self.testdata)
+
+  def test_notmozlz4(self):
+    for data, head in [(b'mozLz40\0\0', b''), (b'', p.MOZLZ4MAGIC + b'12345'),
+          (b'\0\0\0\0', b'mozLz41\0')]:
+      self.assertRaises(ValueError, p.decompressmozlz4, data, head=head)
+
+class TestMainMozlz4(unittest.TestCase):
+
+  testdata = gettestdata('sessionstore.js')
+  testdatalz4 = gettestdata('sessionstore.jsonlz4')
+
+  def run_main(self, argv, content):
+    def fakeopen(dummy_filename):
+      return contextlib.closing(StringIO.StringIO(content))
+    fakestdout = StringIO.StringIO()
+    fakestderr = StringIO.StringIO()
+    exitstatus = p.secludedmain(argv, fakestdout, fakestderr, fakeopen)
+    return exitstatus, fakestdout.getvalue(), fakestderr.getvalue()
+
+  def test_samethanplain(self):
+    for reader in ['json', 'stream']:
+      argv = ['progname', '--all', '--url=all', '--reader=' + reader, 'f']
+      expected = self.run_main(argv, self.testdata)
+      self.assertEqual(self.run_main(argv, self.testdatalz4), expected)
+      self.assertEqual(expected[0], 0)
+
+  def test_corrupted(self):
+    content = self.testdatalz4[:len(self.testdatalz4) // 2]
+    argv = ['progname', 'filename']
+    exitstatus, stdout, stderr = self.run_main(argv, content)
+    self.assertEqual(stderr,
+          'error: cannot read session store from file filename.\n')
+    self.assertEqual(stdout, '')
+    self.assertEqual(exitstatus, 1)
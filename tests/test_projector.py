@@ -0,0 +1,80 @@
+import unittest
+
+import json
+import os
+import StringIO
+
+import sessionstoreparser as p
+
+def gettestdatafilename(name='sessionstore.js'):
+  return os.path.join(os.path.dirname(__file__), name)
+
+def runmain(argv):
+  fakestdout = StringIO.StringIO()
+  fakestderr = StringIO.StringIO()
+  exitstatus = p.secludedmain(
+        ['progname'] + argv, fakestdout, fakestderr, p.openbinary)
+  return exitstatus, fakestdout.getvalue(), fakestderr.getvalue()
+
+class TestJsonProjector(unittest.TestCase):
+
+  def setUp(self):
+    self.projector = p.JsonProjector(json.JSONDecoder(), {
+          'tabs': {
+            'entries': ('url',),
+            'index': None},
+          'selected': None})
+
+  def test_project(self):
+    text = json.dumps({
+          'tabs': [{
+            'entries': [{'url': 'a', 'formdata': {'id': 'x' * 100}}, 'b'],
+            'index': 1,
+            'image': 'data:image/png;base64,' + 'A' * 100,
+            'attributes': {'a': [1, 2, {'b': None}]}}],
+          'selected': 1,
+          'session': {'lastUpdate': 2}}, indent=1)
+    self.assertEqual(self.projector.loads(text), {
+          'tabs': [{'entries': [{'url': 'a'}, 'b'], 'index': 1}],
+          'selected': 1})
+
+  def test_skipstring(self):
+    text = ('{"a": "x\\\\", "b": "\\"}{", "c": "\\\\\\"]", '
+          '"selected": 2, "d": ""}')
+    self.assertEqual(self.projector.loads(text), {'selected': 2})
+
+  def test_escapedkey(self):
+    text = '{"sel\\u0065cted": 3, "tabs": []}'
+    self.assertEqual(self.projector.loads(text), {'selected': 3, 'tabs': []})
+
+  def test_empty(self):
+    self.assertEqual(self.projector.loads(' { } '), {})
+    self.assertEqual(self.projector.loads('{"tabs": [ ]}'), {'tabs': []})
+
+  def test_invalid(self):
+    for text in ['', '{', '{"a": "b', '{"a" 1}', '{"a": 1 "b": 2}',
+          '{"tabs": [1 2]}', '{"a": 1]', '{} {}', '{1: 2}', '{"a": nul}']:
+      self.assertRaises(ValueError, self.projector.loads, text)
+
+class TestMainProjector(unittest.TestCase):
+
+  def test_sameurls(self):
+    for argv in [[], ['--all', '--url=all'], ['--closed', '--url=back'],
+          ['--all', '--format=%title% %lastaccessed% %entrynumber%'],
+          ['--summary', '--all', '--url=all']]:
+      self.assertEqual(
+            runmain(['--reader=project'] + argv + [gettestdatafilename()]),
+            runmain(argv + [gettestdatafilename()]))
+
+  def test_mozlz4(self):
+    self.assertEqual(
+          runmain(['--reader=project', '--all',
+            gettestdatafilename('sessionstore.jsonlz4')]),
+          runmain(['--all', gettestdatafilename()]))
+
+  def test_error(self):
+    exitstatus, stdout, stderr = runmain(['--reader=project', __file__])
+    self.assertEqual(stdout, '')
+    self.assertEqual(stderr,
+          'error: cannot read session store from file %s.\n' % __file__)
+    self.assertEqual(exitstatus, 1)
@@ -0,0 +1,167 @@
+import unittest
+
+import csv
+import gzip
+import json
+import os
+import shutil
+import StringIO
+import tempfile
+
+import sessionstoreparser as p
+
+# quotes, markup and a comma in urls and titles, and a url without title
+SESSIONSTORE = {
+      'windows': [{
+        'tabs': [
+          {'index': 1, 'entries': [
+            {'url': 'http://a/?q="x"&y=<z>', 'title': 'A, "b" & <c>'}]},
+          {'index': 2, 'entries': [
+            {'url': 'b', 'title': 'back'}, {'url': u'http://\xe4/'}]}],
+        'selected': 2,
+        '_closedTabs': []}],
+      '_closedWindows': [],
+      'selectedWindow': 1}
+
+def gettestdatafilename():
+  return os.path.join(os.path.dirname(__file__), 'sessionstore.js')
+
+def runmain(argv):
+  fakestdout = StringIO.StringIO()
+  fakestderr = StringIO.StringIO()
+  exitstatus = p.secludedmain(
+        ['progname'] + argv, fakestdout, fakestderr, p.openbinary)
+  return exitstatus, fakestdout.getvalue(), fakestderr.getvalue()
+
+def gunzip(data):
+  return gzip.GzipFile(fileobj=StringIO.StringIO(data)).read()
+
+class FakeStream(object):
+
+  def __init__(self):
+    self.writes = []
+
+  def write(self, data):
+    self.writes.append(data)
+
+  def flush(self):
+    pass
+
+class TestRecordWriters(unittest.TestCase):
+
+  def test_empty(self):
+    for writerclass in [p.NdjsonUrlWriter, p.CsvUrlWriter, p.HtmlUrlWriter]:
+      stream = FakeStream()
+      writerclass(stream, 64).consume(iter([]))
+      self.assertEqual(b''.join(stream.writes),
+            (writerclass.HEADER + writerclass.FOOTER).encode('utf-8'))
+
+  def test_chunks(self):
+    urls = []
+    for number in range(100):
+      url = p.DetailedUrlRecord(u'http://u%d/' % number,
+            p.WINDOWOPEN | p.TABOPEN | p.ENTRYSELECTED)
+      url.title = None
+      url.windownumber = 1
+      url.tabnumber = number + 1
+      url.entrynumber = 1
+      urls.append(url)
+    stream = FakeStream()
+    p.NdjsonUrlWriter(stream, 256).consume(iter(urls))
+    self.assertTrue(len(stream.writes) > 1)
+    records = [json.loads(line)
+          for line in b''.join(stream.writes).decode('utf-8').splitlines()]
+    self.assertEqual([record['tabnumber'] for record in records],
+          list(range(1, 101)))
+    self.assertEqual(records[0]['title'], u'')
+
+class TestMainRecordWriters(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.filename = os.path.join(self.directory, 'sessionstore.js')
+    with open(self.filename, 'w') as fileob:
+      json.dump(SESSIONSTORE, fileob)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_ndjson(self):
+    exitstatus, stdout, stderr = runmain(
+          ['--writer=ndjson', '--url=all', self.filename])
+    self.assertEqual((exitstatus, stderr), (0, ''))
+    records = [json.loads(line) for line in stdout.splitlines()]
+    self.assertEqual(records[0], {
+          'url': u'http://a/?q="x"&y=<z>', 'title': u'A, "b" & <c>',
+          'windowstate': u'open,selected', 'tabstate': u'open',
+          'entrystate': u'selected', 'windownumber': 1, 'tabnumber': 1,
+          'entrynumber': 1})
+    self.assertEqual([(record['url'], record['title'], record['entrystate'])
+          for record in records[1:]],
+          [(u'b', u'back', u'back'), (u'http://\xe4/', u'', u'selected')])
+
+  def test_csv(self):
+    exitstatus, stdout, stderr = runmain(
+          ['--writer=csv', '--url=all', self.filename])
+    self.assertEqual((exitstatus, stderr), (0, ''))
+    self.assertTrue(stdout.endswith('\r\n'))
+    rows = list(csv.reader(StringIO.StringIO(stdout)))
+    self.assertEqual(rows[0], ['url', 'title', 'windowstate', 'tabstate',
+          'entrystate', 'windownumber', 'tabnumber', 'entrynumber'])
+    self.assertEqual(rows[1], ['http://a/?q="x"&y=<z>', 'A, "b" & <c>',
+          'open,selected', 'open', 'selected', '1', '1', '1'])
+    self.assertEqual(rows[3][:2], ['http://\xc3\xa4/', ''])
+    self.assertEqual(len(rows), 4)
+
+  def test_html(self):
+    exitstatus, stdout, stderr = runmain(
+          ['--writer=html', self.filename])
+    self.assertEqual((exitstatus, stderr), (0, ''))
+    header = p.HtmlUrlWriter.HEADER.encode('utf-8')
+    footer = p.HtmlUrlWriter.FOOTER.encode('utf-8')
+    self.assertTrue(stdout.startswith(header))
+    self.assertTrue(stdout.endswith(footer))
+    rows = stdout[len(header):-len(footer)]
+    self.assertEqual(rows.splitlines(), [
+          '<tr><td><a href="http://a/?q=&quot;x&quot;&amp;y=&lt;z&gt;">'
+          'A, &quot;b&quot; &amp; &lt;c&gt;</a></td>'
+          '<td>1</td><td>1</td><td>1</td>'
+          '<td>open,selected</td><td>open</td><td>selected</td></tr>',
+          '<tr><td><a href="http://\xc3\xa4/">http://\xc3\xa4/</a></td>'
+          '<td>1</td><td>2</td><td>2</td>'
+          '<td>open,selected</td><td>open,selected</td><td>selected</td>'
+          '</tr>'])
+
+  def test_gzip(self):
+    for writer in ['batched', 'ndjson', 'csv', 'html']:
+      argv = ['--writer=' + writer, '--all', '--url=all',
+            gettestdatafilename()]
+      exitstatus, stdout, stderr = runmain(['--gzip'] + argv)
+      self.assertEqual((exitstatus, stderr), (0, ''))
+      self.assertEqual(gunzip(stdout), runmain(argv)[1])
+      self.assertEqual(runmain(['--gzip'] + argv)[1], stdout)
+
+  def test_gzipformat(self):
+    exitstatus, stdout, stderr = runmain(['--writer=batched', '--gzip',
+          '--format=%tabnumber% %url%', self.filename])
+    self.assertEqual((exitstatus, stderr), (0, ''))
+    self.assertEqual(gunzip(stdout), '1 http://a/?q="x"&y=<z>\n'
+          '2 http://\xc3\xa4/\n')
+
+  def test_errors(self):
+    filenames = [self.filename, self.filename]
+    for argv, message in [
+          (['--gzip', self.filename], '--writer=plain takes no --gzip'),
+          (['--writer=sqlite', '--database=urls.db', '--gzip',
+            self.filename],
+            '--writer=sqlite takes no --gzip'),
+          (['--writer=ndjson', '--format=%title%', self.filename],
+            '--writer=ndjson takes no --format'),
+          (['--writer=sessionstore', '--gzip', self.filename],
+            '--writer=sessionstore takes no --gzip'),
+          (['--writer=batched', '--gzip', '--window-jobs=2', self.filename],
+            '--window-jobs takes no --gzip'),
+          (['--diff=urls', '--gzip'] + filenames, '--diff takes no --gzip'),
+          (['--writer=csv', '--gzip', '--unique=exact'] + filenames,
+            '--unique with several files takes no --gzip')]:
+      self.assertEqual(runmain(argv), (2, '', message + '\n'))
@@ -0,0 +1,103 @@
+import unittest
+
+import io
+import json
+import os
+import StringIO
+
+import sessionstoreparser as p
+
+def gettestdatafilename():
+  return os.path.join(os.path.dirname(__file__), 'sessionstore.js')
+
+def salvage(text):
+  salvager = p.JsonSalvager(text, json.JSONDecoder())
+  salvager.salvage()
+  return salvager
+
+def geturls(sessionstore):
+  urlfilterfactory = p.UrlFilterFactory(
+        **p.UrlFilterFactory.getinitparams())
+  urlfilter = urlfilterfactory.make({'all': None, 'entry': 'all'})
+  return [urlrecord.url for urlrecord in urlfilter.filter(
+        p.UrlProducer().produce(sessionstore))]
+
+class TestJsonSalvager(unittest.TestCase):
+
+  def setUp(self):
+    with open(gettestdatafilename()) as sessionfile:
+      self.text = sessionfile.read().decode('utf-8')
+    self.urls = geturls(json.loads(self.text))
+
+  def test_intact(self):
+    salvager = salvage(self.text)
+    self.assertEqual(geturls(salvager.sessionstore), self.urls)
+    self.assertEqual(salvager.skipped, [])
+    self.assertFalse(salvager.truncated)
+
+  def test_truncated(self):
+    text = self.text[:len(self.text) * 2 // 3]
+    salvager = salvage(text)
+    self.assertTrue(salvager.truncated)
+    urls = geturls(salvager.sessionstore)
+    self.assertTrue(len(urls) > 0)
+    self.assertTrue(set(urls) <= set(self.urls))
+
+  def test_corrupted(self):
+    text = self.text[:3000] + u'@@@garbage"}]],,' + self.text[3100:]
+    salvager = salvage(text)
+    self.assertFalse(salvager.truncated)
+    self.assertEqual(len(salvager.skipped), 1)
+    urls = geturls(salvager.sessionstore)
+    self.assertEqual(len(urls), len(self.urls) - 1)
+    self.assertTrue(set(urls) <= set(self.urls))
+
+  def test_partialtab(self):
+    text = (u'{"windows": [{"tabs": [{"entries": [{"url": "a"}, '
+          u'{"url": "b"}, {"url": "c" ]}], "selected": 1}]')
+    salvager = salvage(text)
+    self.assertEqual(geturls(salvager.sessionstore), ['a', 'b'])
+    self.assertEqual(salvager.getcounts(), (1, 1, 1, 1, 2))
+
+  def test_byteranges(self):
+    text = u'{"windows": [{"tabs": [{"entries": [{"url": "\xe4"}, {"x'
+    salvager = salvage(text)
+    self.assertEqual(geturls(salvager.sessionstore), [u'\xe4'])
+    (start, end), = salvager.getbyteranges()
+    self.assertEqual(end, len(text.encode('utf-8')))
+    self.assertEqual(start, end - len(u'"x'))
+
+class TestSalvagingJsonReader(unittest.TestCase):
+
+  def runmain(self, data):
+    fakestdout = StringIO.StringIO()
+    fakestderr = StringIO.StringIO()
+    def openfunc(dummy_filename):
+      return io.BytesIO(data)
+    exitstatus = p.secludedmain(
+          ['progname', '--reader=salvage', '--all', '--url=all', 'damaged'],
+          fakestdout, fakestderr, openfunc)
+    return exitstatus, fakestdout.getvalue(), fakestderr.getvalue()
+
+  def test_truncated(self):
+    with open(gettestdatafilename()) as sessionfile:
+      data = sessionfile.read()
+    exitstatus, stdout, stderr = self.runmain(data[:len(data) // 2])
+    self.assertEqual(exitstatus, 0)
+    self.assertTrue(stdout)
+    self.assertIn('warning: damaged: data ends early.\n', stderr)
+    self.assertIn('warning: damaged: salvaged ', stderr)
+
+  def test_intact(self):
+    with open(gettestdatafilename()) as sessionfile:
+      data = sessionfile.read()
+    exitstatus, stdout, stderr = self.runmain(data)
+    self.assertEqual(exitstatus, 0)
+    self.assertEqual(stdout.count('\n'), 55)
+    self.assertEqual(stderr, '')
+
+  def test_nothing(self):
+    exitstatus, stdout, stderr = self.runmain('garbage')
+    self.assertEqual(exitstatus, 1)
+    self.assertEqual(stdout, '')
+    self.assertTrue(stderr.startswith('error: '))
@@ -0,0 +1,151 @@
+import unittest
+
+import json
+import os
+import shutil
+import StringIO
+import tempfile
+
+import sessionstoreparser as p
+
+def gettestdatafilename():
+  return os.path.join(os.path.dirname(__file__), 'sessionstore.js')
+
+def runmain(argv):
+  fakestdout = StringIO.StringIO()
+  fakestderr = StringIO.StringIO()
+  exitstatus = p.secludedmain(
+        ['progname'] + argv, fakestdout, fakestderr, p.openbinary)
+  return exitstatus, fakestdout.getvalue(), fakestderr.getvalue()
+
+def makefilter(parsedargv):
+  urlfilterfactory = p.UrlFilterFactory(**p.UrlFilterFactory.getinitparams())
+  return urlfilterfactory.make(parsedargv)
+
+class TestSessionStoreWriter(unittest.TestCase):
+
+  def setUp(self):
+    self.sessionstore = {
+          'windows': [{
+            'tabs': [
+              {'index': 2, 'entries': [{'url': 'b'}, {'url': 's'}]},
+              {'index': 1, 'entries': [{'url': 'f'}, {'url': 'ff'}]}],
+            'selected': 2,
+            '_closedTabs': [
+              {'state': {'index': 1, 'entries': [{'url': 'c'}]}}]}],
+          '_closedWindows': [{
+            'tabs': [{'index': 1, 'entries': [{'url': 'x'}]}],
+            'selected': 1,
+            '_closedTabs': []}],
+          'selectedWindow': 1,
+          'session': {'lastUpdate': 1}}
+    self.stream = StringIO.StringIO()
+    self.writer = p.SessionStoreWriter(
+          self.stream, json.JSONDecoder(), chunksize=4)
+
+  def write(self, text, parsedargv):
+    self.writer.write(text, makefilter(parsedargv))
+    return self.stream.getvalue()
+
+  def test_keepsall(self):
+    text = json.dumps(self.sessionstore, indent=1)
+    self.assertEqual(self.write(text, {'all': None, 'entry': 'all'}), text)
+
+  def test_selectedtab(self):
+    text = json.dumps(self.sessionstore)
+    sessionstore = json.loads(self.write(text, {}))
+    self.assertEqual(sessionstore, {
+          'windows': [{
+            'tabs': [
+              {'index': 1, 'entries': [{'url': 's'}]},
+              {'index': 1, 'entries': [{'url': 'f'}]}],
+            'selected': 2,
+            '_closedTabs': []}],
+          '_closedWindows': [],
+          'selectedWindow': 1,
+          'session': {'lastUpdate': 1}})
+
+  def test_closedtabs(self):
+    text = json.dumps(self.sessionstore)
+    sessionstore = json.loads(
+          self.write(text, {'window': 'all', 'tab': 'closed'}))
+    self.assertEqual(sessionstore['windows'], [{
+          'tabs': [],
+          'selected': 0,
+          '_closedTabs': [
+            {'state': {'index': 1, 'entries': [{'url': 'c'}]}}]}])
+    self.assertEqual(sessionstore['_closedWindows'], [])
+    self.assertEqual(sessionstore['selectedWindow'], 1)
+
+  def test_closedwindows(self):
+    text = json.dumps(self.sessionstore)
+    sessionstore = json.loads(
+          self.write(text, {'window': 'closed', 'tab': 'open'}))
+    self.assertEqual(sessionstore['windows'], [])
+    self.assertEqual(sessionstore['_closedWindows'],
+          self.sessionstore['_closedWindows'])
+    self.assertEqual(sessionstore['selectedWindow'], 0)
+
+  def test_forward(self):
+    text = json.dumps(self.sessionstore)
+    sessionstore = json.loads(self.write(text, {'entry': 'forward'}))
+    self.assertEqual(sessionstore['windows'][0]['tabs'],
+          [{'index': 1, 'entries': [{'url': 'ff'}]}])
+    self.assertEqual(sessionstore['windows'][0]['selected'], 1)
+
+  def test_copiesverbatim(self):
+    # members the writer does not change keep their spelling
+    text = ('{"windows": [{"tabs": [{"entries": [{"url": "\\u0061"}, '
+          '{"url": "b", "x": 1.50}], "index": 2}], "selected": 1}], '
+          '"selectedWindow": 1}')
+    self.assertEqual(self.write(text, {'entry': 'back'}),
+          '{"windows": [{"tabs": [{"entries": [{"url": "\\u0061"}], '
+          '"index": 1}], "selected": 1}], "selectedWindow": 1}')
+
+  def test_invalid(self):
+    for text in ['', '{"windows": [', '{} {}', '[]',
+          '{"windows": [{"tabs": [], "selected": "1"}]}']:
+      self.assertRaises(ValueError, self.write, text, {})
+
+class TestMainSessionStoreWriter(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_sameurls(self):
+    filename = os.path.join(self.directory, 'pruned.js')
+    for argv in [[], ['--closed'], ['--url=back'], ['--selected'],
+          ['--window=closed', '--tab=all', '--url=forward']]:
+      exitstatus, pruned, stderr = runmain(
+            ['--writer=sessionstore'] + argv + [gettestdatafilename()])
+      self.assertEqual((exitstatus, stderr), (0, ''))
+      with open(filename, 'wb') as prunedfile:
+        prunedfile.write(pruned)
+      self.assertEqual(
+            runmain(['--all', '--url=all', filename]),
+            runmain(argv + [gettestdatafilename()]))
+
+  def test_oneinput(self):
+    exitstatus, stdout, stderr = runmain(['--writer=sessionstore',
+          gettestdatafilename(), gettestdatafilename()])
+    self.assertEqual(stdout, '')
+    self.assertEqual(stderr,
+          '--writer=sessionstore takes exactly one filename\n')
+    self.assertEqual(exitstatus, 2)
+
+  def test_nounique(self):
+    exitstatus, stdout, stderr = runmain(
+          ['--writer=sessionstore', '--unique', gettestdatafilename()])
+    self.assertEqual(stdout, '')
+    self.assertEqual(stderr, '--writer=sessionstore takes no --unique\n')
+    self.assertEqual(exitstatus, 2)
+
+  def test_nostats(self):
+    for option in ['--stats', '--trace-memory']:
+      self.assertEqual(runmain(
+            ['--writer=sessionstore', option, gettestdatafilename()]),
+            (2, '', '--writer=sessionstore takes no --stats or '
+            '--trace-memory\n'))
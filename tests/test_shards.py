@@ -0,0 +1,213 @@
+import unittest
+
+import json
+import os
+import shutil
+import StringIO
+import tempfile
+
+import sessionstoreparser as p
+
+def gettestdatafilename(name='sessionstore.js'):
+  return os.path.join(os.path.dirname(__file__), name)
+
+def gettestdata():
+  with open(gettestdatafilename(), 'rb') as testdatafile:
+    testdata = testdatafile.read()
+  return testdata
+
+def makewindow(name, closedtabs=0):
+  return {
+        'tabs': [
+          {'index': 1, 'entries': [{'url': name + '/1'}]},
+          {'index': 2, 'entries': [
+            {'url': name + '/2a'}, {'url': name + '/2b'}]}],
+        'selected': 2,
+        '_closedTabs': [
+          {'state': {'index': 1, 'entries': [{'url': name + '/c%d' % i}]}}
+          for i in range(closedtabs)]}
+
+# more windows than the test data, with urls in common across windows
+SESSIONSTORE = {
+      'windows': [makewindow('w%d' % (i % 3), i % 2) for i in range(7)],
+      '_closedWindows': [makewindow('c%d' % i, 1) for i in range(5)],
+      'selectedWindow': 4}
+
+# the marker of the windows is also that of a nested object
+NESTED = (b'{"windows": ['
+      b'{"tabs": [{"index": 1, "entries": [{"url": "a"}]}], "selected": 1,'
+      b' "extra": [1, {"tabs": []}], "_closedTabs": []},'
+      b'{"tabs": [{"index": 1, "entries": [{"url": "b"}]}], "selected": 1,'
+      b' "_closedTabs": []}],'
+      b' "_closedWindows": [], "selectedWindow": 2}')
+
+def makesharder():
+  initparams = p.ShardedSessionStoreParserFactory.getinitparams()
+  return p.WindowSharder(**initparams['sharderparams'])
+
+def runmain(argv, minshardsize=None):
+  fakestdout = StringIO.StringIO()
+  fakestderr = StringIO.StringIO()
+  initparams = p.ApplicationFactory.getinitparams()
+  if minshardsize is not None:
+    shardedparams = p.ShardedSessionStoreParserFactory.getinitparams()
+    shardedparams['minshardsize'] = minshardsize
+    builderparams = p.ParserFactoryBuilder.getinitparams()
+    builderparams['shardedparserfactoryparams'] = shardedparams
+    initparams['parserfactorybuilderparams'] = builderparams
+  applicationfactory = p.ApplicationFactory(**initparams)
+  application = applicationfactory.make(
+        fakestdout, fakestderr, p.openbinary)
+  exitstatus = application.run(['progname'] + argv)
+  return exitstatus, fakestdout.getvalue(), fakestderr.getvalue()
+
+class TestWindowSharder(unittest.TestCase):
+
+  def decode(self, shards):
+    return [(closed, number, count, json.loads('[' + data.decode() + ']'))
+          for closed, number, count, data in shards]
+
+  def test_onewindowpershard(self):
+    data = json.dumps(SESSIONSTORE).encode('utf-8')
+    selected, shards = makesharder().split(data, 1, True)
+    self.assertEqual(selected, 4)
+    self.assertEqual(self.decode(shards),
+          [(False, i + 1, 1, [window])
+            for i, window in enumerate(SESSIONSTORE['windows'])] +
+          [(True, i + 1, 1, [window])
+            for i, window in enumerate(SESSIONSTORE['_closedWindows'])])
+
+  def test_bigshards(self):
+    # the last window of each array is scanned on its own
+    data = json.dumps(SESSIONSTORE, indent=2).encode('utf-8')
+    selected, shards = makesharder().split(data, len(data), False)
+    self.assertEqual(selected, 4)
+    windows = SESSIONSTORE['windows']
+    closedwindows = SESSIONSTORE['_closedWindows']
+    self.assertEqual(self.decode(shards), [
+          (False, 1, 6, windows[:-1]),
+          (False, 7, 1, windows[-1:]),
+          (True, 1, None, closedwindows[:-1]),
+          (True, 1, 1, closedwindows[-1:])])
+
+  def test_openwindowsfirst(self):
+    data = json.dumps(SESSIONSTORE, sort_keys=True).encode('utf-8')
+    dummy_selected, shards = makesharder().split(data, 200, True)
+    closed = [shard[0] for shard in shards]
+    self.assertEqual(closed, sorted(closed))
+    self.assertEqual(
+          sum(len(windows) for dummy_closed, dummy_number, dummy_count,
+            windows in self.decode(shards)), 12)
+
+  def test_empty(self):
+    data = b'{"windows": [], "_closedWindows": [ ], "selectedWindow": 0}'
+    self.assertEqual(makesharder().split(data, 1, True), (0, []))
+
+  def test_invalid(self):
+    for data in [b'{"windows": [], "windows": []}', b'{"windows": [] } x',
+          b'{"windows": [{"tabs": []}', b'[]']:
+      self.assertRaises(ValueError, makesharder().split, data, 1, True)
+
+  def test_nested(self):
+    # the guess inside the first window gives shards that do not decode
+    jsondecoder = json.JSONDecoder()
+    for numbered in [False, True]:
+      selected, shards = makesharder().split(NESTED, 1, numbered)
+      self.assertEqual(len(shards), 3)
+      producer = p.ShardSessionStoreProducer(
+            jsondecoder, shards[0] + (selected,))
+      self.assertRaises(ValueError, producer.produce)
+
+  def test_miscounted(self):
+    producer = p.ShardSessionStoreProducer(
+          json.JSONDecoder(), (False, 1, 2, b'{}', 1))
+    self.assertRaises(ValueError, producer.produce)
+
+class FailingShardWorker(p.ShardWorker):
+
+  def __init__(self, error):
+    initparams = p.SessionStoreParserFactoryFactory.getinitparams()
+    p.ShardWorker.__init__(self,
+          p.SessionStoreParserFactoryFactory(**initparams), p.openbinary,
+          {}, json.JSONDecoder())
+    self.error = error
+
+  def tryparseshard(self, shard):
+    raise self.error
+
+class TestShardWorker(unittest.TestCase):
+
+  def test_failed(self):
+    for error in [ValueError('x'), IOError('x'), OSError('x')]:
+      self.assertEqual(FailingShardWorker(error).parseshard(None), None)
+
+  def test_bug(self):
+    for error in [TypeError('x'), KeyError('x'), AttributeError('x')]:
+      self.assertRaises(type(error),
+            FailingShardWorker(error).parseshard, None)
+
+class TestMainShards(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.filename = os.path.join(self.directory, 'sessionstore.js')
+    with open(self.filename, 'w') as fileob:
+      json.dump(SESSIONSTORE, fileob)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_sameoutput(self):
+    for argv in [[], ['--all', '--url=all'], ['--closed', '--url=back'],
+          ['--window=selected', '--tab=all'],
+          ['--all', '--format=%windownumber%:%tabnumber%:%entrynumber% %url%'],
+          ['--all', '--unique'],
+          ['--all', '--unique', '--format=%tabnumber% %url%'],
+          ['--all', '--producer=flat', '--frames']]:
+      for filename in [gettestdatafilename(), self.filename]:
+        expected = runmain(argv + [filename])
+        for jobs in ['1', '2']:
+          for minshardsize in [1, None]:
+            self.assertEqual(runmain(['--window-jobs=' + jobs] + argv +
+                  [filename], minshardsize), expected)
+
+  def test_mozlz4(self):
+    self.assertEqual(
+          runmain(['--window-jobs=2', '--all',
+            gettestdatafilename('sessionstore.jsonlz4')], 1),
+          runmain(['--all', gettestdatafilename()]))
+
+  def test_nested(self):
+    with open(self.filename, 'wb') as fileob:
+      fileob.write(NESTED)
+    for jobs in ['1', '2']:
+      self.assertEqual(
+            runmain(['--window-jobs=' + jobs, '--all', self.filename], 1),
+            (0, 'a\nb\n', ''))
+
+  def test_broken(self):
+    with open(self.filename, 'wb') as fileob:
+      fileob.write(gettestdata()[:-100])
+    self.assertEqual(
+          runmain(['--window-jobs=2', self.filename], 1),
+          runmain([self.filename]))
+    self.assertEqual(runmain(['--window-jobs=2', 'missing.js']),
+          (1, '', 'error: cannot open file missing.js.\n'))
+
+  def test_errors(self):
+    for argv, message in [
+          (['--window-jobs=0'], 'illegal value for "window-jobs": "0"'),
+          (['--window-jobs=many'],
+            'illegal value for "window-jobs": "many"'),
+          (['--window-jobs=2', '--jobs=2'],
+            '--window-jobs takes exactly one filename'),
+          (['--window-jobs=2', self.filename],
+            '--window-jobs takes exactly one filename'),
+          (['--window-jobs=2', '--reader=stream'],
+            '--window-jobs takes no --reader'),
+          (['--window-jobs=2', '--summary'],
+            '--window-jobs takes no --summary'),
+          (['--window-jobs=2', '--writer=sessionstore'],
+            '--window-jobs takes no --writer=sessionstore')]:
+      self.assertEqual(runmain(argv + [self.filename]),
+            (2, '', message + '\n'))
@@ -0,0 +1,135 @@
+import unittest
+
+import os
+import shutil
+import sqlite3
+import StringIO
+import tempfile
+import time
+
+import sessionstoreparser as p
+
+def gettestdatafilename():
+  return os.path.join(os.path.dirname(__file__), 'sessionstore.js')
+
+class TestSqliteUrlWriter(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.database = os.path.join(self.directory, 'urls.db')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def makewriter(self, source):
+    self.stream = StringIO.StringIO()
+    return p.SqliteUrlWriter(self.stream, self.database, source, 2, time.time)
+
+  def makeurl(self, url, state, numbers):
+    url = p.DetailedUrlRecord(url, state)
+    url.windownumber, url.tabnumber, url.entrynumber = numbers
+    return url
+
+  def selectall(self):
+    connection = sqlite3.connect(self.database)
+    try:
+      return connection.execute('SELECT * FROM urls ORDER BY rowid').fetchall()
+    finally:
+      connection.close()
+
+  def test_rows(self):
+    urls = [
+          self.makeurl(u'http://a/',
+            p.WINDOWOPEN | p.TABOPEN | p.ENTRYBACK, (1, 2, 1)),
+          self.makeurl(u'http://b/',
+            p.WINDOWCLOSED | p.TABCLOSED | p.ENTRYSELECTED, (2, 1, 3)),
+          self.makeurl(u'http://c/',
+            p.WINDOWOPEN | p.WINDOWSELECTED | p.TABOPEN | p.ENTRYFORWARD,
+            (1, 1, 2))]
+    self.makewriter('/source').consume(iter(urls))
+    source = os.path.abspath('/source')
+    self.assertEqual(self.selectall(), [
+          (source, u'http://a/', p.WINDOWOPEN | p.TABOPEN | p.ENTRYBACK,
+            u'open', u'open', u'back', 1, 2, 1),
+          (source, u'http://b/',
+            p.WINDOWCLOSED | p.TABCLOSED | p.ENTRYSELECTED,
+            u'closed', u'closed', u'selected', 2, 1, 3),
+          (source, u'http://c/',
+            p.WINDOWOPEN | p.WINDOWSELECTED | p.TABOPEN | p.ENTRYFORWARD,
+            u'open,selected', u'open', u'forward', 1, 1, 2)])
+    self.assertTrue(self.stream.getvalue().startswith(
+          '3 rows in %s, ' % self.database))
+    self.assertTrue(self.stream.getvalue().endswith(' rows/s\n'))
+
+  def test_replacesource(self):
+    state = p.WINDOWOPEN | p.TABOPEN | p.ENTRYSELECTED
+    self.makewriter('/one').consume(
+          iter([self.makeurl(u'http://a/', state, (1, 1, 1))]))
+    self.makewriter('/two').consume(
+          iter([self.makeurl(u'http://b/', state, (1, 1, 1))]))
+    self.makewriter('/one').consume(
+          iter([self.makeurl(u'http://c/', state, (1, 1, 1))]))
+    self.assertEqual(sorted(row[1] for row in self.selectall()),
+          [u'http://b/', u'http://c/'])
+
+  def test_stdinsource(self):
+    state = p.WINDOWOPEN | p.TABOPEN | p.ENTRYSELECTED
+    self.makewriter('-').consume(
+          iter([self.makeurl(u'http://a/', state, (1, 1, 1))]))
+    self.assertEqual([row[0] for row in self.selectall()], [u'-'])
+
+class TestMainSqlite(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.database = os.path.join(self.directory, 'urls.db')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def runmain(self, argv, expectedstderr='', expectedstatus=0, stdin=None):
+    #pylint: disable=too-many-arguments
+    fakestdout = StringIO.StringIO()
+    fakestderr = StringIO.StringIO()
+    exitstatus = p.secludedmain(
+          ['progname'] + argv, fakestdout, fakestderr, p.openbinary, stdin)
+    self.assertEqual(fakestderr.getvalue(), expectedstderr)
+    self.assertEqual(exitstatus, expectedstatus)
+    return fakestdout.getvalue()
+
+  def test_query(self):
+    filename = gettestdatafilename()
+    databaseoption = '--database=' + self.database
+    self.runmain(['--writer=sqlite', databaseoption,
+          '--all', '--url=all', filename])
+    for options in [['--all', '--url=all'], ['--closed'], [],
+          ['--window=selected', '--url=back']]:
+      expected = self.runmain(options + [filename])
+      self.assertEqual(
+            self.runmain(['--query', databaseoption] + options), expected)
+      self.assertEqual(
+            self.runmain(['--query', databaseoption] + options + [filename]),
+            expected)
+    self.assertEqual(
+          self.runmain(['--query', databaseoption, filename + 'x']), '')
+
+  def test_querystdin(self):
+    filename = gettestdatafilename()
+    databaseoption = '--database=' + self.database
+    with open(filename, 'rb') as sessionfile:
+      data = sessionfile.read()
+    self.runmain(['--writer=sqlite', databaseoption,
+          '--all', '--url=all', '-'], stdin=StringIO.StringIO(data))
+    expected = self.runmain(['--closed', filename])
+    self.assertEqual(
+          self.runmain(['--query', databaseoption, '--closed', '-']),
+          expected)
+    self.assertEqual(self.runmain(['--query', databaseoption,
+          '--closed', os.path.join(os.getcwd(), '-')]), '')
+
+  def test_missingdatabase(self):
+    self.runmain(['--writer=sqlite', gettestdatafilename()],
+          '--writer=sqlite needs --database\n', 2)
+    self.runmain(['--query'], '--query needs --database\n', 2)
+    self.runmain(['--query', '--database=' + self.database],
+          'error: cannot open database %s.\n' % self.database, 1)
@@ -0,0 +1,171 @@
+import unittest
+
+import io
+import os
+import pstats
+import shutil
+import StringIO
+import tempfile
+
+import sessionstoreparser as p
+
+def gettestdatafilename():
+  return os.path.join(os.path.dirname(__file__), 'sessionstore.js')
+
+def runmain(argv):
+  fakestdout = StringIO.StringIO()
+  fakestderr = StringIO.StringIO()
+  exitstatus = p.secludedmain(
+        ['progname'] + argv, fakestdout, fakestderr, p.openbinary)
+  return exitstatus, fakestdout.getvalue(), fakestderr.getvalue()
+
+class FakeClock(object):
+  # every call advances by one second
+
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    self.now += 1.0
+    return self.now
+
+class TestPipelineStats(unittest.TestCase):
+
+  def setUp(self):
+    self.stats = p.PipelineStats(FakeClock(), FakeClock())
+    self.stats.start()
+
+  def test_nested(self):
+    def decode():
+      return 'decoded'
+    def read():
+      return self.stats.call('decode', decode)
+    self.assertEqual(self.stats.call('read', read), 'decoded')
+    # read runs until decode is entered and after it is left
+    self.assertEqual(self.stats.stages['read']['wall'], 2.0)
+    self.assertEqual(self.stats.stages['decode']['wall'], 1.0)
+    self.assertEqual(self.stats.stages['decode']['cpu'], 1.0)
+
+  def test_iterate(self):
+    produced = self.stats.iterate('produce', range(2500))
+    filtered = self.stats.iterate('filter', (n for n in produced if n % 2))
+    self.assertEqual(len(list(filtered)), 1250)
+    self.assertEqual(self.stats.stages['produce']['count'], 2500)
+    self.assertEqual(self.stats.stages['filter']['count'], 1250)
+    # produce is entered once per chunk and once more at the end
+    self.assertEqual(self.stats.stages['produce']['wall'], 4.0)
+
+  def test_write(self):
+    self.stats.stop()
+    stream = StringIO.StringIO()
+    self.stats.write(stream, 'name')
+    lines = stream.getvalue().splitlines()
+    self.assertEqual(lines[0], 'stats: name')
+    self.assertEqual([line.split()[0] for line in lines[2:8]],
+          p.PipelineStats.STAGES + ['total'])
+
+  def test_notstarted(self):
+    stats = p.PipelineStats(FakeClock(), FakeClock())
+    stats.stop()
+    self.assertEqual(stats.stages['total']['wall'], 1.0)
+
+  def test_streamreader(self):
+    # the stream reader reads and decodes while the urls are produced
+    initparams = p.SessionStoreProducerFactory.getinitparams()
+    factory = p.SessionStoreProducerFactory(
+          openfunc=p.openbinary, stderr=None, **initparams)
+    producer = factory.make(
+          {'filename': gettestdatafilename(), 'reader': 'stream'},
+          self.stats)
+    urls = self.stats.iterate('produce',
+          p.UrlProducer().produce(producer.produce()))
+    self.assertEqual(len(list(urls)), self.stats.stages['produce']['count'])
+    for stage in ['read', 'decode', 'produce']:
+      self.assertTrue(self.stats.stages[stage]['wall'] > 0, stage)
+
+class TestCountingStream(unittest.TestCase):
+
+  def test_count(self):
+    stats = p.PipelineStats(FakeClock(), FakeClock())
+    stream = io.TextIOWrapper(io.BytesIO(), encoding='utf-8')
+    countingstream = p.CountingStream(stream, stats)
+    countingstream.write(u'abc\xe4\n')
+    countingstream.flush()
+    countingstream.buffer.write(b'xyz')
+    self.assertEqual(stats.stages['consume']['count'], 9)
+
+class TestMainStats(unittest.TestCase):
+
+  def test_stats(self):
+    exitstatus, stdout, stderr = runmain(
+          ['--stats', '--all', '--url=all', gettestdatafilename()])
+    self.assertEqual(exitstatus, 0)
+    self.assertEqual(stdout.count('\n'), 55)
+    self.assertTrue(stderr.startswith('stats: '))
+    self.assertIn('  windows 3 open, 2 closed; tabs 13 open, 10 closed; '
+          'entries 55\n', stderr)
+    self.assertIn('  urls 55 produced, 55 passed filter\n', stderr)
+    filesize = os.path.getsize(gettestdatafilename())
+    self.assertIn('  bytes %d read, %d written\n' % (filesize, len(stdout)),
+          stderr)
+
+  def test_streamreaderbytes(self):
+    # counted as they are read, the file stays open for the closed
+    # windows which are never asked for
+    dummy_exitstatus, stdout, stderr = runmain(
+          ['--stats', '--reader=stream', gettestdatafilename()])
+    filesize = os.path.getsize(gettestdatafilename())
+    self.assertIn('  bytes %d read, %d written\n' % (filesize, len(stdout)),
+          stderr)
+
+  def test_samestdout(self):
+    for argv in [[], ['--writer=batched'], ['--reader=stream']]:
+      argv = argv + ['--all', gettestdatafilename()]
+      expected = runmain(argv)[1]
+      self.assertEqual(runmain(['--stats'] + argv)[1], expected)
+
+  def test_summary(self):
+    exitstatus, dummy_stdout, stderr = runmain(
+          ['--stats', '--summary', gettestdatafilename()])
+    self.assertEqual(exitstatus, 2)
+    self.assertEqual(stderr, '--summary takes no --stats or --trace-memory\n')
+
+  @unittest.skipIf(p.gettracemalloc() is not None, 'tracemalloc present')
+  def test_notracemalloc(self):
+    exitstatus, dummy_stdout, stderr = runmain(
+          ['--trace-memory', gettestdatafilename()])
+    self.assertEqual(exitstatus, 2)
+    self.assertEqual(stderr, '--trace-memory needs python 3.9 or later\n')
+
+  @unittest.skipIf(p.gettracemalloc() is None, 'needs python 3.9')
+  def test_tracememory(self):
+    exitstatus, dummy_stdout, stderr = runmain(
+          ['--trace-memory', gettestdatafilename()])
+    self.assertEqual(exitstatus, 0)
+    self.assertIn('peak MB', stderr)
+
+class TestMainProfile(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_profile(self):
+    profilefilename = os.path.join(self.directory, 'profile')
+    exitstatus, stdout, dummy_stderr = runmain(
+          ['--profile=' + profilefilename, gettestdatafilename()])
+    self.assertEqual(exitstatus, 0)
+    self.assertTrue(stdout)
+    functionnames = [function[2] for function in
+          pstats.Stats(profilefilename).stats]
+    self.assertIn('produce', functionnames)
+
+  def test_cannotwrite(self):
+    profilefilename = os.path.join(self.directory, 'missing', 'profile')
+    exitstatus, dummy_stdout, stderr = runmain(
+          ['--profile=' + profilefilename, gettestdatafilename()])
+    self.assertEqual(exitstatus, 1)
+    self.assertEqual(
+          stderr, 'error: cannot write profile to %s.\n' % profilefilename)
@@ -0,0 +1,132 @@
+
+import unittest
+
+import contextlib
+import json
+import os
+import StringIO
+
+import sessionstoreparser as p
+
+def gettestdata():
+  filename = os.path.join(os.path.dirname(__file__), 'sessionstore.js')
+  with open(filename) as testdatafile:
+    testdata = testdatafile.read()
+  return testdata
+
+def makescanner(text, chunksize=4):
+  fileob = StringIO.StringIO(text)
+  scanner = p.JsonScanner(fileob, json.JSONDecoder(), chunksize)
+  return scanner
+
+class TestJsonScanner(unittest.TestCase):
+
+  def test_readvalue(self):
+    scanner = makescanner(' {"a": [1, "x]\\"}", {"b": null}]} ')
+    self.assertEqual(scanner.readvalue(), {'a': [1, 'x]"}', {'b': None}]})
+
+  def test_iterobject(self):
+    scanner = makescanner('{"a": 1, "b": [2, 3], "c": "d"}')
+    values = {}
+    for key in scanner.iterobject():
+      if key == 'b':
+        scanner.skipvalue()
+      else:
+        values[key] = scanner.readvalue()
+    self.assertEqual(values, {'a': 1, 'c': 'd'})
+
+  def test_iterarray(self):
+    scanner = makescanner('[{"a": 1}, [], "s", 4.5e1, true]')
+    values = [scanner.readvalue() for _ in scanner.iterarray()]
+    self.assertEqual(values, [{'a': 1}, [], 's', 45.0, True])
+
+  def test_emptycontainers(self):
+    scanner = makescanner('[]')
+    self.assertEqual(list(scanner.iterarray()), [])
+    scanner = makescanner('{ }')
+    self.assertEqual(list(scanner.iterobject()), [])
+
+  def test_truncated(self):
+    scanner = makescanner('[{"a": "unterminated')
+    items = scanner.iterarray()
+    next(items)
+    self.assertRaises(ValueError, scanner.readvalue)
+
+class TestStreamingJsonReader(unittest.TestCase):
+
+  testdata = gettestdata()
+
+  def produceurls(self, jsonreader):
+    sessionstore = jsonreader.read('filename')
+    urlproducer = p.UrlProducer()
+    urls = [url['url'] for url in urlproducer.produce(sessionstore)]
+    return urls
+
+  def makereader(self, text, chunksize):
+    def fakeopen(dummy_filename):
+      return contextlib.closing(StringIO.StringIO(text))
+    initparams = p.SessionStoreProducerFactory.getinitparams()
+    dummy_readerclass, readerparams = initparams['jsonreaders']['stream']
+    readerparams = dict(readerparams, chunksize=chunksize)
+    jsonreader = p.StreamingJsonReader(openfunc=fakeopen, **readerparams)
+    return jsonreader
+
+  def test_sameurlsasjsonreader(self):
+    def fakeopen(dummy_filename):
+      return contextlib.closing(StringIO.StringIO(self.testdata))
+    expected = self.produceurls(p.JsonReader(fakeopen, json.loads))
+    for chunksize in [1, 2, 3, 7, 64, 1 << 16]:
+      jsonreader = self.makereader(self.testdata, chunksize)
+      self.assertEqual(self.produceurls(jsonreader), expected)
+
+  def test_windowsbeforeselected(self):
+    # firefox writes selectedWindow between windows and _closedWindows
+    text = ('{"windows": [{"tabs": [{"index": 1, "entries": ['
+          '{"url": "http://a/"}]}], "selected": 1, "_closedTabs": []}],'
+          '"selectedWindow": 1, "_closedWindows": [], "session": {}}')
+    jsonreader = self.makereader(text, 5)
+    self.assertEqual(self.produceurls(jsonreader), ['http://a/'])
+
+  def test_truncated(self):
+    text = self.testdata[:len(self.testdata) // 2]
+    jsonreader = self.makereader(text, 16)
+    self.assertRaises(p.Error, self.produceurls, jsonreader)
+
+class TestMainStream(unittest.TestCase):
+
+  testdata = gettestdata()
+
+  def test_streamall(self):
+    def fakeopen(dummy_filename):
+      return contextlib.closing(StringIO.StringIO(self.testdata))
+    expectedstdout = StringIO.StringIO()
+    fakeargv = ['progname', '--all', '--url=all', 'filename']
+    p.secludedmain(fakeargv, expectedstdout, StringIO.StringIO(), fakeopen)
+    fakestdout = StringIO.StringIO()
+    fakestderr = StringIO.StringIO()
+    fakeargv = ['progname',
+          '--reader=stream', '--all', '--url=all', 'filename']
+    exitstatus = p.secludedmain(fakeargv, fakestdout, fakestderr, fakeopen)
+    self.assertEqual(fakestderr.getvalue(), '')
+    self.assertEqual(fakestdout.getvalue(), expectedstdout.getvalue())
+    self.assertEqual(exitstatus, 0)
+
+  def test_wrongreader(self):
+    fakestdout = StringIO.StringIO()
+    fakestderr = StringIO.StringIO()
+    fakeargv = ['progname', '--reader=wrong', 'filename']
+    exitstatus = p.secludedmain(fakeargv, fakestdout, fakestderr, None)
+    self.assertEqual(fakestderr.getvalue(),
+          'illegal value for "reader": "wrong"\n')
+    self.assertEqual(exitstatus, 2)
+
+  def test_streamnotjson(self):
+    def fakeopen(dummy_filename):
+      return contextlib.closing(StringIO.StringIO('what is this'))
+    fakestdout = StringIO.StringIO()
+    fakestderr = StringIO.StringIO()
+    fakeargv = ['progname', '--reader=stream', 'filename']
+    exitstatus = p.secludedmain(fakeargv, fakestdout, fakestderr, fakeopen)
+    self.assertEqual(fakestderr.getvalue(),
+          'error: cannot read session store from file filename.\n')
+    self.assertEqual(exitstatus, 1)
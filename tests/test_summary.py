@@ -0,0 +1,82 @@
+import unittest
+
+import json
+import os
+import StringIO
+
+import sessionstoreparser as p
+
+def gettestdatafilename():
+  return os.path.join(os.path.dirname(__file__), 'sessionstore.js')
+
+def runmain(argv):
+  fakestdout = StringIO.StringIO()
+  fakestderr = StringIO.StringIO()
+  exitstatus = p.secludedmain(
+        ['progname'] + argv, fakestdout, fakestderr, p.openbinary)
+  return exitstatus, fakestdout.getvalue(), fakestderr.getvalue()
+
+class TestSessionStoreCounter(unittest.TestCase):
+
+  def setUp(self):
+    self.sessionstore = {
+          'windows': [{
+            'tabs': [
+              {'index': 2, 'entries': [{'url': 'b'}, {'url': 's'}]},
+              {'index': 1, 'entries': [{'url': 'f'}, {'url': 'ff'}]}],
+            'selected': 2,
+            '_closedTabs': [
+              {'state': {'index': 1, 'entries': [{'url': 'c'}]}}]}],
+          '_closedWindows': [{
+            'tabs': [{'index': 3, 'entries': [{'url': 'x'}]}],
+            'selected': 1,
+            '_closedTabs': []}],
+          'selectedWindow': 1}
+
+  def test_count(self):
+    counts = p.SessionStoreCounter().count(self.sessionstore)
+    self.assertEqual(counts, {
+          p.WINDOWOPEN: 1, p.WINDOWSELECTED: 1, p.WINDOWCLOSED: 1,
+          p.TABOPEN: 3, p.TABSELECTED: 2, p.TABCLOSED: 1,
+          p.ENTRYBACK: 2, p.ENTRYSELECTED: 3, p.ENTRYFORWARD: 1})
+
+  def test_filter(self):
+    urlfilter = p.UrlFilter({'tab': ['closed'], 'entry': ['selected']})
+    counts = p.SessionStoreCounter().count(self.sessionstore, urlfilter)
+    self.assertEqual(counts, {
+          p.WINDOWOPEN: 1, p.WINDOWSELECTED: 1, p.WINDOWCLOSED: 1,
+          p.TABOPEN: 0, p.TABSELECTED: 0, p.TABCLOSED: 1,
+          p.ENTRYBACK: 0, p.ENTRYSELECTED: 1, p.ENTRYFORWARD: 0})
+
+  def test_sameasproducer(self):
+    with open(gettestdatafilename()) as sessionfile:
+      sessionstore = json.load(sessionfile)
+    urlfilterfactory = p.UrlFilterFactory(
+          **p.UrlFilterFactory.getinitparams())
+    for parsedargv in [{}, {'all': None, 'entry': 'all'}, {'closed': None},
+          {'window': 'selected', 'entry': 'back'}]:
+      urlfilter = urlfilterfactory.make(parsedargv)
+      counts = p.SessionStoreCounter().count(sessionstore, urlfilter)
+      urls = list(urlfilter.filter(
+            p.UrlProducer().produce(sessionstore, urlfilter)))
+      for bit in [p.ENTRYBACK, p.ENTRYSELECTED, p.ENTRYFORWARD]:
+        self.assertEqual(counts[bit],
+              len([url for url in urls if url.state & bit]))
+
+class TestMainSummary(unittest.TestCase):
+
+  def test_summary(self):
+    exitstatus, stdout, stderr = runmain(
+          ['--summary', '--closed', gettestdatafilename()])
+    self.assertEqual(stderr, '')
+    self.assertEqual(stdout,
+          'windows open 0\n'
+          'windows selected 0\n'
+          'windows closed 2\n'
+          'tabs open 0\n'
+          'tabs selected 0\n'
+          'tabs closed 4\n'
+          'urls back 0\n'
+          'urls selected 4\n'
+          'urls forward 0\n')
+    self.assertEqual(exitstatus, 0)
@@ -0,0 +1,170 @@
+import unittest
+
+import json
+import math
+import os
+import shutil
+import StringIO
+import tempfile
+
+import sessionstoreparser as p
+
+def gettestdatafilename():
+  return os.path.join(os.path.dirname(__file__), 'sessionstore.js')
+
+def runmain(argv):
+  fakestdout = StringIO.StringIO()
+  fakestderr = StringIO.StringIO()
+  exitstatus = p.secludedmain(
+        ['progname'] + argv, fakestdout, fakestderr, p.openbinary)
+  return exitstatus, fakestdout.getvalue(), fakestderr.getvalue()
+
+def firstseen(lines):
+  seen = set()
+  uniquelines = []
+  for line in lines:
+    if line not in seen:
+      seen.add(line)
+      uniquelines.append(line)
+  return uniquelines
+
+class TestUrlSets(unittest.TestCase):
+
+  def test_exact(self):
+    urlset = p.ExactUrlSet()
+    urls = [u'http://%d/' % index for index in range(5000)]
+    self.assertTrue(all(urlset.addnew(url) for url in urls))
+    self.assertFalse(any(urlset.addnew(url) for url in urls))
+    self.assertTrue(urlset.addnew(u'http://x/'))
+    self.assertTrue(len(urlset.table) >= 2 * urlset.count)
+
+  def test_bloom(self):
+    urlset = p.BloomUrlSet(1 << 12, 0.01)
+    self.assertEqual(len(urlset.bits), 1 << 12)
+    capacity = int(len(urlset.bits) * 8 * math.log(2) ** 2 / -math.log(0.01))
+    urls = [u'http://%d/' % index for index in range(capacity)]
+    for url in urls:
+      urlset.addnew(url)
+    self.assertFalse(any(urlset.addnew(url) for url in urls))
+    falsepositives = sum(1 for index in range(1000)
+          if not urlset.addnew(u'http://x%d/' % index))
+    self.assertTrue(falsepositives < 50)
+
+  def test_bloomsize(self):
+    urlset = p.BloomUrlSet(5000, 0.01)
+    self.assertEqual(len(urlset.bits), 4096)
+
+  def test_uniquefilter(self):
+    urlfilter = p.UrlFilter({'entry': ['selected']})
+    uniquefilter = p.UniqueUrlFilter(urlfilter, p.ExactUrlSet())
+    self.assertEqual(uniquefilter.reachable, urlfilter.reachable)
+    state = p.WINDOWOPEN | p.TABOPEN
+    urls = [p.UrlRecord(url, state | p.ENTRYSELECTED) for url in 'abab']
+    urls.insert(0, p.UrlRecord('c', state | p.ENTRYBACK))
+    urls.append(p.UrlRecord('c', state | p.ENTRYSELECTED))
+    self.assertEqual([url.url for url in uniquefilter.filter(urls)],
+          ['a', 'b', 'c'])
+
+  def test_uniquelines(self):
+    urlset = p.ExactUrlSet()
+    self.assertEqual(p.uniquelines(urlset, b'1 a\n1 b\n', [u'a', u'b']),
+          b'1 a\n1 b\n')
+    self.assertEqual(p.uniquelines(urlset, b'2 b\n2 c\n', [u'b', u'c']),
+          b'2 c\n')
+    self.assertEqual(p.uniquelines(urlset, b'', []), b'')
+    self.assertRaises(ValueError, p.uniquelines, urlset, b'x\ny\n', [u'x'])
+
+def makewindow(names, title=None):
+  return {
+        'tabs': [{'index': 1, 'entries': [{'url': name, 'title': title}]}
+          for name in names],
+        'selected': 1,
+        '_closedTabs': []}
+
+class TestMainUnique(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def makefile(self, name, windows):
+    filename = os.path.join(self.directory, name)
+    with open(filename, 'w') as fileob:
+      json.dump({'windows': windows, '_closedWindows': [],
+            'selectedWindow': 1}, fileob)
+    return filename
+
+  def test_unique(self):
+    filename = gettestdatafilename()
+    dummy_exitstatus, stdout, dummy_stderr = runmain(
+          ['--all', '--url=all', filename])
+    expected = '\n'.join(firstseen(stdout.splitlines())) + '\n'
+    for mode in ['exact', 'approximate']:
+      exitstatus, stdout, stderr = runmain(
+            ['--all', '--url=all', '--unique=' + mode, filename])
+      self.assertEqual(stderr, '')
+      self.assertEqual(stdout, expected)
+      self.assertEqual(exitstatus, 0)
+
+  def test_uniquebatch(self):
+    filename = gettestdatafilename()
+    dummy_exitstatus, expected, dummy_stderr = runmain(
+          ['--unique=exact', '--url=all', filename])
+    for jobs in ['1', '2']:
+      exitstatus, stdout, stderr = runmain(['--unique=exact', '--url=all',
+            '--jobs=' + jobs, filename, filename])
+      self.assertEqual(stderr, '')
+      self.assertEqual(stdout, expected)
+      self.assertEqual(exitstatus, 0)
+
+  def test_uniquebatchndjson(self):
+    filename = gettestdatafilename()
+    argv = ['--unique=exact', '--url=all', '--writer=ndjson']
+    dummy_exitstatus, expected, dummy_stderr = runmain(argv + [filename])
+    for jobs in ['1', '2']:
+      self.assertEqual(runmain(argv + ['--jobs=' + jobs, filename, filename]),
+            (0, expected, ''))
+
+  def test_uniquebatchformat(self):
+    # the same urls in other windows and tabs give other lines
+    filenames = [
+          self.makefile('a.js', [makewindow('ab'), makewindow('c')]),
+          self.makefile('b.js', [makewindow('cd'), makewindow('ba')])]
+    argv = ['--unique=exact', '--format=%windownumber%:%tabnumber% %url%']
+    for jobs in ['1', '2']:
+      self.assertEqual(runmain(argv + ['--jobs=' + jobs] + filenames),
+            (0, '1:1 a\n1:2 b\n2:1 c\n1:2 d\n', ''))
+
+  def test_titlenewline(self):
+    filenames = [self.makefile('a.js', [makewindow('a', 'one\ntwo')]),
+          self.makefile('b.js', [makewindow('b')])]
+    self.assertEqual(runmain(['--unique=exact', '--format=%title% %url%']
+          + filenames), (1, 'None b\n',
+          'error: cannot make the urls of file %s unique, the output is '
+          'not one line per url.\nerror: 1 of 2 files failed.\n' %
+          filenames[0]))
+
+  def test_illegalvalues(self):
+    filename = gettestdatafilename()
+    for argv, message in [
+          (['--unique=maybe'], 'illegal value for "unique": "maybe"'),
+          (['--unique=approximate', '--unique-memory=0'],
+            'illegal value for "unique-memory": "0"'),
+          (['--unique=approximate', '--unique-error=1'],
+            'illegal value for "unique-error": "1"'),
+          (['--unique=exact', '--unique-memory=1'],
+            '--unique=exact takes no --unique-memory'),
+          (['--unique=exact', '--unique-error=0.1'],
+            '--unique=exact takes no --unique-error'),
+          (['--unique=exact', '--summary', '--jobs=2'],
+            '--unique with several files takes no --summary'),
+          (['--unique=exact', '--writer=sqlite', '--database=urls.db',
+            '--jobs=2'],
+            '--unique with several files takes no --writer=sqlite'),
+          (['--unique=exact', '--writer=csv', '--jobs=2'],
+            '--unique with several files takes no --writer=csv'),
+          (['--unique=exact', '--writer=html', '--jobs=2'],
+            '--unique with several files takes no --writer=html')]:
+      self.assertEqual(runmain(argv + [filename]), (2, '', message + '\n'))
@@ -0,0 +1,164 @@
+
+import unittest
+
+import os
+import shutil
+import StringIO
+import tempfile
+import time
+
+import sessionstoreparser as p
+
+def gettestdatafilename():
+  return os.path.join(os.path.dirname(__file__), 'sessionstore.js')
+
+class TestUrlCache(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.sessionfile = os.path.join(self.directory, 'sessionstore.js')
+    shutil.copy(gettestdatafilename(), self.sessionfile)
+    self.cachedirectory = os.path.join(self.directory, 'cache')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def makecache(self, maxsize=1 << 20):
+    return p.UrlCache(self.cachedirectory, maxsize, os.stat, p.openbinary)
+
+  def test_storeload(self):
+    urlcache = self.makecache()
+    identity = urlcache.getidentity(self.sessionfile)
+    self.assertEqual(urlcache.load(identity), None)
+    urls = [p.UrlRecord(u'http://a/', p.WINDOWOPEN | p.ENTRYFORWARD),
+          p.UrlRecord(u'http://b/', p.TABCLOSED)]
+    urlcache.store(identity, urls)
+    loaded = list(urlcache.load(identity))
+    self.assertEqual([(url.url, url.state) for url in loaded],
+          [(url.url, url.state) for url in urls])
+
+  def test_changedcontent(self):
+    urlcache = self.makecache()
+    identity = urlcache.getidentity(self.sessionfile)
+    urlcache.store(identity, [p.UrlRecord(u'http://a/')])
+    with open(self.sessionfile, 'ab') as sessionfile:
+      sessionfile.write(b' ')
+    identity = urlcache.getidentity(self.sessionfile)
+    self.assertEqual(urlcache.load(identity), None)
+
+  def test_corrupted(self):
+    urlcache = self.makecache()
+    identity = urlcache.getidentity(self.sessionfile)
+    urlcache.store(identity, [p.UrlRecord(u'http://a/')])
+    with open(urlcache.getcachepath(identity), 'r+b') as cachefile:
+      cachefile.seek(-4, os.SEEK_END)
+      cachefile.truncate()
+    self.assertEqual(urlcache.load(identity), None)
+
+  def test_missingfile(self):
+    urlcache = self.makecache()
+    self.assertEqual(urlcache.getidentity(self.sessionfile + 'x'), None)
+
+  def makefileidentity(self, urlcache, name):
+    filename = os.path.join(self.directory, name)
+    with open(filename, 'wb') as fileob:
+      fileob.write(name.encode('utf-8'))
+    return urlcache.getidentity(filename)
+
+  def test_evictleastrecentlyused(self):
+    urlcache = self.makecache()
+    identities = []
+    for index in range(3):
+      identity = self.makefileidentity(urlcache, 'file%d' % index)
+      urlcache.store(identity, [p.UrlRecord(u'http://%d/' % index)] * 100)
+      identities.append(identity)
+      past = time.time() - 100 + index
+      os.utime(urlcache.getcachepath(identity), (past, past))
+    urlcache.load(identities[0])
+    entrysize = os.path.getsize(urlcache.getcachepath(identities[0]))
+    urlcache.maxsize = entrysize * 3
+    identity = self.makefileidentity(urlcache, 'file3')
+    urlcache.store(identity, [p.UrlRecord(u'http://3/')] * 100)
+    self.assertNotEqual(urlcache.load(identities[0]), None)
+    self.assertEqual(urlcache.load(identities[1]), None)
+    self.assertNotEqual(urlcache.load(identities[2]), None)
+    self.assertNotEqual(urlcache.load(identity), None)
+
+  def test_warmhitreadsnofile(self):
+    urlcache = self.makecache()
+    identity = urlcache.getidentity(self.sessionfile)
+    urlcache.store(identity, [p.UrlRecord(u'http://a/')])
+    def failopen(dummy_filename):
+      raise AssertionError('session store read on a warm hit')
+    urlcache.openfunc = failopen
+    loaded = list(urlcache.load(urlcache.getidentity(self.sessionfile)))
+    self.assertEqual([url.url for url in loaded], [u'http://a/'])
+
+  def test_touched(self):
+    urlcache = self.makecache()
+    identity = urlcache.getidentity(self.sessionfile)
+    urlcache.store(identity, [p.UrlRecord(u'http://a/')])
+    past = time.time() - 100
+    os.utime(self.sessionfile, (past, past))
+    identity = urlcache.getidentity(self.sessionfile)
+    loaded = list(urlcache.load(identity))
+    self.assertEqual([url.url for url in loaded], [u'http://a/'])
+    def failopen(dummy_filename):
+      raise AssertionError('session store hashed again')
+    urlcache.openfunc = failopen
+    self.assertNotEqual(urlcache.load(identity), None)
+
+  def test_changedsamesize(self):
+    urlcache = self.makecache()
+    identity = urlcache.getidentity(self.sessionfile)
+    urlcache.store(identity, [p.UrlRecord(u'http://a/')])
+    with open(self.sessionfile, 'r+b') as sessionfile:
+      sessionfile.write(b' ')
+    past = time.time() - 100
+    os.utime(self.sessionfile, (past, past))
+    identity = urlcache.getidentity(self.sessionfile)
+    self.assertEqual(urlcache.load(identity), None)
+
+  def test_failedstoreleavesnotempfile(self):
+    urlcache = self.makecache()
+    identity = urlcache.getidentity(self.sessionfile)
+    os.makedirs(urlcache.getcachepath(identity))
+    urlcache.store(identity, [p.UrlRecord(u'http://a/')])
+    self.assertEqual([name for name in os.listdir(self.cachedirectory)
+          if name.endswith('.tmp')], [])
+
+class TestMainCache(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.cachedirectory = os.path.join(self.directory, 'cache')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def runmain(self, argv):
+    fakestdout = StringIO.StringIO()
+    fakestderr = StringIO.StringIO()
+    exitstatus = p.secludedmain(
+          ['progname'] + argv, fakestdout, fakestderr, p.openbinary)
+    self.assertEqual(fakestderr.getvalue(), '')
+    self.assertEqual(exitstatus, 0)
+    return fakestdout.getvalue()
+
+  def test_sameoutput(self):
+    filename = gettestdatafilename()
+    for options in [['--all', '--url=all'], ['--closed'], []]:
+      expected = self.runmain(options + [filename])
+      cacheoption = '--cache=' + self.cachedirectory
+      self.assertEqual(self.runmain([cacheoption] + options + [filename]),
+            expected)
+      self.assertEqual(len(os.listdir(self.cachedirectory)), 1)
+
+  def test_illegalcachesize(self):
+    fakestdout = StringIO.StringIO()
+    fakestderr = StringIO.StringIO()
+    fakeargv = ['progname', '--cache=dir', '--cache-size=big', 'filename']
+    exitstatus = p.secludedmain(fakeargv, fakestdout, fakestderr, None)
+    self.assertEqual(fakestderr.getvalue(),
+          'illegal value for "cache-size": "big"\n')
+    self.assertEqual(exitstatus, 2)
@@ -0,0 +1,67 @@
+
+import unittest
+
+import sessionstoreparser as p
+
+def makefilter(**templates):
+  initparams = p.UrlFilterFactory.getinitparams()
+  urlfilterfactory = p.UrlFilterFactory(**initparams)
+  return urlfilterfactory.make(templates)
+
+class TestCompiledUrlFilter(unittest.TestCase):
+
+  def test_defaultreachable(self):
+    urlfilter = makefilter()
+    self.assertTrue(p.WINDOWOPEN in urlfilter.reachable)
+    self.assertFalse(p.WINDOWCLOSED in urlfilter.reachable)
+    self.assertFalse(p.WINDOWOPEN | p.TABCLOSED in urlfilter.reachable)
+    self.assertFalse(
+          p.WINDOWOPEN | p.TABOPEN | p.ENTRYBACK in urlfilter.reachable)
+
+  def test_table(self):
+    urlfilter = makefilter(window='selected', entry='all')
+    state = p.WINDOWOPEN | p.WINDOWSELECTED | p.TABOPEN | p.ENTRYFORWARD
+    self.assertTrue(urlfilter.table[state])
+    self.assertFalse(urlfilter.table[state & ~p.WINDOWSELECTED])
+
+class TestUrlProducerPruning(unittest.TestCase):
+
+  # the pruned parts are invalid so visiting them would raise
+
+  sessionstore = {
+        'windows': [{
+          'tabs': [
+            {'index': 2, 'entries': [None, {'url': 's'}, None]},
+            {'index': 1, 'entries': [{'url': 't'}]}],
+          'selected': 1,
+          '_closedTabs': None}],
+        'selectedWindow': 1}
+
+  def test_default(self):
+    urlfilter = makefilter()
+    urls = p.UrlProducer().produce(self.sessionstore, urlfilter)
+    self.assertEqual([url.url for url in urls], ['s', 't'])
+
+  def test_selected(self):
+    urlfilter = makefilter(selected='')
+    urls = p.UrlProducer().produce(self.sessionstore, urlfilter)
+    self.assertEqual([url.url for url in urls], ['s'])
+
+  def test_unfiltered(self):
+    urls = p.UrlProducer().produce(self.sessionstore)
+    self.assertRaises(TypeError, list, urls)
+
+  def test_indexoutofrange(self):
+    sessionstore = {
+          'windows': [{
+            'tabs': [
+              {'index': 0, 'entries': [{'url': 'f1'}, {'url': 'f2'}]},
+              {'index': 3, 'entries': [{'url': 'b1'}, {'url': 'b2'}]}],
+            'selected': 1,
+            '_closedTabs': []}],
+          '_closedWindows': [],
+          'selectedWindow': 1}
+    urls = list(p.UrlProducer().produce(sessionstore))
+    self.assertEqual([url.url for url in urls], ['f1', 'f2', 'b1', 'b2'])
+    self.assertEqual([url.getstatenames('entry') for url in urls], [
+          set(['forward']), set(['forward']), set(['back']), set(['back'])])
@@ -0,0 +1,85 @@
+
+import unittest
+
+import sessionstoreparser as p
+
+class TestUrlRecord(unittest.TestCase):
+
+  def test_statenames(self):
+    url = p.UrlRecord('http://a/',
+          p.WINDOWOPEN | p.WINDOWSELECTED | p.TABCLOSED | p.ENTRYBACK)
+    self.assertEqual(url.getstatenames('window'), set(['open', 'selected']))
+    self.assertEqual(url.getstatenames('tab'), set(['closed']))
+    self.assertEqual(url.getstatenames('entry'), set(['back']))
+
+  def test_dictaccess(self):
+    url = p.UrlRecord('http://a/', p.TABOPEN)
+    self.assertEqual(url['url'], 'http://a/')
+    self.assertEqual(url['tab'], set(['open']))
+    self.assertEqual(url['window'], set())
+    self.assertRaises(KeyError, lambda: url['title'])
+
+  def test_noinstancedict(self):
+    url = p.UrlRecord('http://a/')
+    self.assertRaises(AttributeError, setattr, url, 'title', 'a')
+
+class TestUrlProducerStates(unittest.TestCase):
+
+  def test_states(self):
+    sessionstore = {
+          'windows': [{
+            'tabs': [
+              {'index': 2, 'entries': [{'url': 'b'}, {'url': 's'}]},
+              {'index': 1, 'entries': [{'url': 'f'}, {'url': 'ff'}]}],
+            'selected': 2,
+            '_closedTabs': [
+              {'state': {'index': 1, 'entries': [{'url': 'c'}]}}]}],
+          '_closedWindows': [],
+          'selectedWindow': 1}
+    urls = list(p.UrlProducer().produce(sessionstore))
+    window = p.WINDOWOPEN | p.WINDOWSELECTED
+    self.assertEqual([(url.url, url.state) for url in urls], [
+          ('b', window | p.TABOPEN | p.ENTRYBACK),
+          ('s', window | p.TABOPEN | p.ENTRYSELECTED),
+          ('f', window | p.TABOPEN | p.TABSELECTED | p.ENTRYSELECTED),
+          ('ff', window | p.TABOPEN | p.TABSELECTED | p.ENTRYFORWARD),
+          ('c', window | p.TABCLOSED | p.ENTRYSELECTED)])
+
+  def test_numbers(self):
+    sessionstore = {
+          'windows': [{
+            'tabs': [
+              {'index': 2, 'entries': [{'url': 'b'}, {'url': 's'}]},
+              {'index': 1, 'entries': [{'url': 'f'}, {'url': 'ff'}]}],
+            'selected': 2,
+            '_closedTabs': []}],
+          '_closedWindows': [{
+            'tabs': [],
+            'selected': 1,
+            '_closedTabs': [
+              {'state': {'index': 1, 'entries': [{'url': 'c'}]}}]}],
+          'selectedWindow': 1}
+    urlproducer = p.DetailedUrlProducer(p.SqliteUrlWriter.fields)
+    urls = list(urlproducer.produce(sessionstore))
+    self.assertEqual([(url.url,
+          url.windownumber, url.tabnumber, url.entrynumber) for url in urls], [
+          ('b', 1, 1, 1),
+          ('s', 1, 1, 2),
+          ('f', 1, 2, 1),
+          ('ff', 1, 2, 2),
+          ('c', 1, 1, 1)])
+    self.assertEqual(urls[-1].state,
+          p.WINDOWCLOSED | p.TABCLOSED | p.ENTRYSELECTED)
+
+class TestUrlFilterMasks(unittest.TestCase):
+
+  def test_match(self):
+    urlfilter = p.UrlFilter({
+          'window': ['open'],
+          'entry': ['back', 'forward']})
+    self.assertTrue(urlfilter.attributesmatch(
+          p.UrlRecord('a', p.WINDOWOPEN | p.TABCLOSED | p.ENTRYBACK)))
+    self.assertFalse(urlfilter.attributesmatch(
+          p.UrlRecord('a', p.WINDOWOPEN | p.TABCLOSED | p.ENTRYSELECTED)))
+    self.assertFalse(urlfilter.attributesmatch(
+          p.UrlRecord('a', p.WINDOWCLOSED | p.TABOPEN | p.ENTRYFORWARD)))
@@ -0,0 +1,89 @@
+
+import unittest
+
+import contextlib
+import errno
+import os
+import StringIO
+
+import sessionstoreparser as p
+
+def gettestdata():
+  filename = os.path.join(os.path.dirname(__file__), 'sessionstore.js')
+  with open(filename) as testdatafile:
+    testdata = testdatafile.read()
+  return testdata
+
+class FakeStream(object):
+
+  def __init__(self, failerrno=None):
+    self.failerrno = failerrno
+    self.writes = []
+
+  def write(self, data):
+    if self.failerrno is not None:
+      raise IOError(self.failerrno, os.strerror(self.failerrno))
+    self.writes.append(data)
+
+  def flush(self):
+    pass
+
+def makeurls(count):
+  return [p.UrlRecord(u'http://u%d/' % index) for index in range(count)]
+
+class TestBatchedUrlWriter(unittest.TestCase):
+
+  def test_chunks(self):
+    stream = FakeStream()
+    urlwriter = p.BatchedUrlWriter(stream, 64)
+    urlwriter.consume(iter(makeurls(100)))
+    self.assertTrue(len(stream.writes) > 1)
+    self.assertEqual(b''.join(stream.writes), b''.join(
+          b'http://u%d/\n' % index for index in range(100)))
+
+  def test_nourls(self):
+    stream = FakeStream()
+    p.BatchedUrlWriter(stream, 64).consume(iter([]))
+    self.assertEqual(stream.writes, [])
+
+  def test_utf8(self):
+    stream = FakeStream()
+    urls = [p.UrlRecord(u'http://\xe4/')]
+    p.BatchedUrlWriter(stream, 64).consume(iter(urls))
+    self.assertEqual(stream.writes, [b'http://\xc3\xa4/\n'])
+
+  def test_brokenpipe(self):
+    stream = FakeStream(errno.EPIPE)
+    p.BatchedUrlWriter(stream, 64).consume(iter(makeurls(10)))
+
+  def test_othererror(self):
+    stream = FakeStream(errno.ENOSPC)
+    urlwriter = p.BatchedUrlWriter(stream, 64)
+    self.assertRaises(IOError, urlwriter.consume, iter(makeurls(10)))
+
+class TestMainBatched(unittest.TestCase):
+
+  testdata = gettestdata()
+
+  def test_sameasplain(self):
+    def fakeopen(dummy_filename):
+      return contextlib.closing(StringIO.StringIO(self.testdata))
+    outputs = []
+    for writer in ['plain', 'batched']:
+      fakestdout = StringIO.StringIO()
+      fakestderr = StringIO.StringIO()
+      fakeargv = ['progname', '--all', '--url=all', '--writer=' + writer, 'f']
+      exitstatus = p.secludedmain(fakeargv, fakestdout, fakestderr, fakeopen)
+      self.assertEqual(fakestderr.getvalue(), '')
+      self.assertEqual(exitstatus, 0)
+      outputs.append(fakestdout.getvalue())
+    self.assertEqual(outputs[0], outputs[1])
+
+  def test_wrongwriter(self):
+    fakestdout = StringIO.StringIO()
+    fakestderr = StringIO.StringIO()
+    fakeargv = ['progname', '--writer=wrong', 'filename']
+    exitstatus = p.secludedmain(fakeargv, fakestdout, fakestderr, None)
+    self.assertEqual(fakestderr.getvalue(),
+          'illegal value for "writer": "wrong"\n')
+    self.assertEqual(exitstatus, 2)
@@ -0,0 +1,98 @@
+
+import unittest
+
+import StringIO
+
+import sessionstoreparser as p
+
+class FakeStat(object):
+
+  def __init__(self, st_ino, st_size, st_mtime):
+    self.st_ino = st_ino
+    self.st_size = st_size
+    self.st_mtime = st_mtime
+
+class StopWatching(Exception):
+  pass
+
+class FakeSessionStoreParser(object):
+
+  def __init__(self):
+    self.parsecount = 0
+
+  def parse(self):
+    self.parsecount += 1
+
+def runwatch(stats, sessionstoreparser):
+  stats = list(stats)
+  def fakestat(dummy_filename):
+    stat = stats[0]
+    if stat is None:
+      raise OSError('ignored error message')
+    return stat
+  def fakesleep(dummy_seconds):
+    stats.pop(0)
+    if len(stats) == 0:
+      raise StopWatching()
+  watchparser = p.WatchSessionStoreParser(sessionstoreparser, 'filename', 1,
+        fakestat, fakesleep, StringIO.StringIO())
+  try:
+    watchparser.parse()
+  except StopWatching:
+    pass
+  return watchparser
+
+class TestWatchSessionStoreParser(unittest.TestCase):
+
+  def test_parseonlyonchange(self):
+    first = FakeStat(1, 100, 1.0)
+    second = FakeStat(2, 120, 2.0)
+    sessionstoreparser = FakeSessionStoreParser()
+    runwatch([first, first, first, first, second, second, second],
+          sessionstoreparser)
+    self.assertEqual(sessionstoreparser.parsecount, 2)
+
+  def test_waitwhilewriting(self):
+    stats = [FakeStat(1, size, size) for size in [10, 20, 30, 30]]
+    sessionstoreparser = FakeSessionStoreParser()
+    runwatch(stats, sessionstoreparser)
+    self.assertEqual(sessionstoreparser.parsecount, 1)
+
+  def test_missingfile(self):
+    sessionstoreparser = FakeSessionStoreParser()
+    runwatch([None, None, None], sessionstoreparser)
+    self.assertEqual(sessionstoreparser.parsecount, 0)
+
+class TestUrlDiffWriter(unittest.TestCase):
+
+  def test_diff(self):
+    stream = StringIO.StringIO()
+    urldiffwriter = p.UrlDiffWriter(stream)
+    urldiffwriter.consume([p.UrlRecord(url) for url in ['a', 'b', 'a']])
+    self.assertEqual(stream.getvalue(), '+ a\n+ b\n')
+    stream.truncate(0)
+    urldiffwriter.consume([p.UrlRecord(url) for url in ['c', 'b']])
+    self.assertEqual(stream.getvalue(), '- a\n+ c\n')
+    stream.truncate(0)
+    urldiffwriter.consume([p.UrlRecord(url) for url in ['b', 'c']])
+    self.assertEqual(stream.getvalue(), '')
+
+class TestMainWatch(unittest.TestCase):
+
+  def test_watchmanyfiles(self):
+    fakestdout = StringIO.StringIO()
+    fakestderr = StringIO.StringIO()
+    fakeargv = ['progname', '--watch', 'file1', 'file2']
+    exitstatus = p.secludedmain(fakeargv, fakestdout, fakestderr, None)
+    self.assertEqual(fakestderr.getvalue(),
+          '--watch takes exactly one filename\n')
+    self.assertEqual(exitstatus, 2)
+
+  def test_illegalinterval(self):
+    fakestdout = StringIO.StringIO()
+    fakestderr = StringIO.StringIO()
+    fakeargv = ['progname', '--watch', '--interval=-1', 'filename']
+    exitstatus = p.secludedmain(fakeargv, fakestdout, fakestderr, None)
+    self.assertEqual(fakestderr.getvalue(),
+          'illegal value for "interval": "-1"\n')
+    self.assertEqual(exitstatus, 2)